@@ -0,0 +1,191 @@
+"""
+Run the test suites in parallel, each worker against a database of its own
+
+usage: python HSAParallelTests.py [-j WORKERS] [MODULE ...]
+
+The schema (db/database.psql) is loaded once into a template database, and each worker
+gets a copy of the template, so that no worker sees the data of another. Copies commit
+asynchronously, since they are discarded afterwards. Test classes are handed to workers
+one at a time, largest first, and a test still starts from the install state by resetting
+its worker's database. Afterwards, this reports failures and the time taken by setup, by
+each worker, and by the slowest classes and tests. Every database is dropped at the end.
+
+MODULEs default to HSAlibTests and HSAccessObjectsTests. The template and the copies are
+named after the database of the suites (HSA_TEST_DATABASE, by default acouch), and are
+created through its user, which must be allowed to create databases. Workers need PostgreSQL;
+suites of the SQLite backend (HSA_TEST_BACKEND=sqlite) are run one at a time.
+"""
+__author__ = 'Alva'
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+import unittest
+
+import psycopg2
+
+SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'db', 'database.psql')
+
+
+class _TimedResult(unittest.TestResult):
+    """ a test result that also records how long each test took """
+
+    def __init__(self):
+        unittest.TestResult.__init__(self)
+        self.times = []
+        self.__started = None
+
+    def startTest(self, test):
+        self.__started = time.time()
+        unittest.TestResult.startTest(self, test)
+
+    def stopTest(self, test):
+        unittest.TestResult.stopTest(self, test)
+        self.times.append((test.id(), time.time() - self.__started))
+
+
+# database of this worker process, set by _start_worker
+_worker_database = None
+
+
+def _start_worker(databases, modules):
+    """ claim a database for this worker process and point the test modules at it """
+    global _worker_database
+    _worker_database = databases.get()
+    os.environ['HSA_TEST_DATABASE'] = _worker_database
+    for name in modules:
+        module = __import__(name)
+        module.DATABASE = (_worker_database,) + tuple(module.DATABASE[1:])
+
+
+def _run_class(unit):
+    """ run the tests of one class; return what happened, in a form that can be pickled """
+    module, name = unit
+    suite = unittest.TestLoader().loadTestsFromName(name, __import__(module))
+    result = _TimedResult()
+    started = time.time()
+    try:
+        suite.run(result)
+    except Exception:
+        result.errors.append((suite, traceback.format_exc()))
+    return {'class': module + '.' + name, 'database': _worker_database,
+            'seconds': time.time() - started, 'tests': result.testsRun, 'times': result.times,
+            'failures': [(str(test), text) for test, text in result.failures + result.errors],
+            'skipped': len(result.skipped)}
+
+
+def _connect(database, template):
+    """ connect to the maintenance database with the user of the template database """
+    conn = psycopg2.connect(database=database, user=template[1], password=template[2],
+                            host=template[3], port=template[4])
+    conn.autocommit = True
+    return conn
+
+
+def _create_databases(template, workers):
+    """ load the schema into a template database and copy it for each worker """
+    base = template[0]
+    conn = _connect('postgres', template)
+    cur = conn.cursor()
+    copies = ['%s_test_%d' % (base, n + 1) for n in range(workers)]
+    try:
+        for name in [base + '_template'] + copies:
+            cur.execute('drop database if exists "%s"' % name)
+        cur.execute('create database "%s_template"' % base)
+        loader = _connect(base + '_template', template)
+        try:
+            with open(SCHEMA) as schema:
+                loader.cursor().execute(schema.read())
+        finally:
+            loader.close()
+        for name in copies:
+            cur.execute('create database "%s" template "%s_template"' % (name, base))
+            cur.execute('alter database "%s" set synchronous_commit to off' % name)
+    finally:
+        conn.close()
+    return copies
+
+
+def _drop_databases(template, copies):
+    conn = _connect('postgres', template)
+    try:
+        for name in copies + [template[0] + '_template']:
+            conn.cursor().execute('drop database if exists "%s"' % name)
+    finally:
+        conn.close()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='run the test suites in parallel')
+    parser.add_argument('-j', '--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('modules', nargs='*', default=['HSAlibTests', 'HSAccessObjectsTests'])
+    args = parser.parse_args(argv)
+    if os.environ.get('HSA_TEST_BACKEND', 'postgres') != 'postgres':
+        parser.error('workers need the postgres backend; run the suites themselves for HSA_TEST_BACKEND=%s'
+                     % os.environ['HSA_TEST_BACKEND'])
+
+    started = time.time()
+    units = []
+    for name in args.modules:
+        module = __import__(name)
+        for suite in unittest.TestLoader().loadTestsFromModule(module):
+            if suite.countTestCases() > 0:
+                units.append((suite.countTestCases(), name, type(next(iter(suite))).__name__))
+    units = [(module, name) for count, module, name in sorted(units, key=lambda unit: -unit[0])]
+    template = sys.modules[args.modules[0]].DATABASE
+    workers = max(1, min(args.workers, len(units)))
+
+    copies = _create_databases(template, workers)
+    prepared = time.time()
+    try:
+        databases = multiprocessing.Queue()
+        for name in copies:
+            databases.put(name)
+        pool = multiprocessing.Pool(workers, _start_worker, (databases, args.modules))
+        try:
+            reports = []
+            for report in pool.imap_unordered(_run_class, units):
+                reports.append(report)
+                sys.stderr.write('.' if not report['failures'] else 'F')
+                sys.stderr.flush()
+            sys.stderr.write('\n')
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        _drop_databases(template, copies)
+    finished = time.time()
+
+    failures = [failure for report in reports for failure in report['failures']]
+    for test, text in failures:
+        print('=' * 70)
+        print('FAIL: %s' % test)
+        print('-' * 70)
+        print(text)
+    tests = sum(report['tests'] for report in reports)
+    busy = sum(report['seconds'] for report in reports)
+    print('Ran %d tests in %d classes with %d workers' % (tests, len(reports), workers))
+    print('  setup (template and %d copies): %.2fs' % (len(copies), prepared - started))
+    print('  tests: %.2fs, %.2fs of work (%.1fx)'
+          % (finished - prepared, busy, busy / max(finished - prepared, 1e-6)))
+    for name in copies:
+        seconds = [report['seconds'] for report in reports if report['database'] == name]
+        print('  worker %s: %d classes, %.2fs' % (name, len(seconds), sum(seconds)))
+    print('Slowest classes:')
+    for report in sorted(reports, key=lambda report: -report['seconds'])[:10]:
+        print('  %7.2fs  %s (%d tests)' % (report['seconds'], report['class'], report['tests']))
+    print('Slowest tests:')
+    times = [entry for report in reports for entry in report['times']]
+    for test, seconds in sorted(times, key=lambda entry: -entry[1])[:10]:
+        print('  %7.2fs  %s' % (seconds, test))
+    skipped = sum(report['skipped'] for report in reports)
+    print('%s%s' % ('FAILED (failures=%d)' % len(failures) if failures else 'OK',
+                    ' (skipped=%d)' % skipped if skipped else ''))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
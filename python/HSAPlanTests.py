@@ -0,0 +1,387 @@
+__author__ = 'Alva'
+# Plan-regression tests for the hot queries of HSAlib: python HSAPlanTests.py
+# HSA_PLAN_SCALE (default 1) multiplies the size of the generated dataset.
+import hashlib
+import json
+import os
+import re
+import unittest
+
+import HSAlib
+
+# database to test against: name (from HSA_TEST_DATABASE), user, password, host, and port.
+DATABASE = (os.environ.get('HSA_TEST_DATABASE', 'acouch'), 'acouch', 'xyzzy', 'localhost', '5432')
+
+# rows generated per unit of HSA_PLAN_SCALE
+_USERS = 20000
+_GROUPS = 2000
+_RESOURCES = 50000
+
+# The dataset: plan-user-n owns plan-resource-n (and n + users, ...) and plan-group-n.
+# Every resource has two readers besides its owner, plan-resource-n is shared with
+# plan-group-(1 + n % groups) when n is a multiple of 5, every user belongs to two
+# groups, and plan-group-n contains plan-group-10n ... plan-group-(10n + 9) for the
+# first tenth of the groups. Owners invite readers of every tenth resource to rw,
+# and every tenth user is invited to a group.
+_GENERATE = [
+    # the counts maintained by triggers are computed once by hs_recount() at the end
+    "alter table user_access_to_resource disable trigger user",
+    "alter table user_access_to_group disable trigger user",
+    "alter table group_access_to_resource disable trigger user",
+    """insert into users (user_uuid, user_login, user_name, user_active, user_admin, assertion_user_id)
+       select md5('plan-user-' || i), 'plan-user-' || i, 'Plan User ' || i, true, false, 1
+       from generate_series(1, %(users)s) i""",
+    """insert into groups (group_uuid, group_name, group_active, group_shareable,
+                           group_discoverable, group_public, assertion_user_id)
+       select md5('plan-group-' || i), 'plan-group-' || i, true, true, i %% 10 = 0, i %% 20 = 0, 1
+       from generate_series(1, %(groups)s) i""",
+    # before memberships, so that the closure triggers have no members to recount
+    """insert into group_access_to_group (group_id, member_group_id, assertion_user_id)
+       select p.group_id, g.group_id, 1
+       from generate_series(11, %(groups)s / 10) i
+       join groups g on g.group_uuid = md5('plan-group-' || i)
+       join groups p on p.group_uuid = md5('plan-group-' || (i / 10))""",
+    """insert into resources (resource_uuid, resource_path, resource_title,
+                              resource_immutable, resource_published,
+                              resource_discoverable, resource_public,
+                              resource_shareable, assertion_user_id)
+       select md5('plan-resource-' || i), '/plan/resource/' || i, 'Plan Resource ' || i,
+              false, false, i %% 10 = 0, i %% 20 = 0, true, 1
+       from generate_series(1, %(resources)s) i""",
+    """insert into user_access_to_resource (user_id, resource_id, privilege_id, assertion_user_id)
+       select u.user_id, r.resource_id, 1, u.user_id
+       from generate_series(1, %(resources)s) i
+       join users u on u.user_login = 'plan-user-' || (1 + (i - 1) %% %(users)s)
+       join resources r on r.resource_path = '/plan/resource/' || i""",
+    """insert into user_access_to_resource (user_id, resource_id, privilege_id, assertion_user_id)
+       select u.user_id, r.resource_id, 3 - k %% 2, o.user_id
+       from generate_series(1, %(resources)s) i
+       cross join generate_series(1, 2) k
+       join resources r on r.resource_path = '/plan/resource/' || i
+       join users o on o.user_login = 'plan-user-' || (1 + (i - 1) %% %(users)s)
+       join users u on u.user_login = 'plan-user-' || (1 + (i + 7919 * k) %% %(users)s)""",
+    """insert into user_access_to_group (user_id, group_id, privilege_id, assertion_user_id)
+       select u.user_id, g.group_id, 1, u.user_id
+       from generate_series(1, %(groups)s) i
+       join users u on u.user_login = 'plan-user-' || (1 + (i - 1) %% %(users)s)
+       join groups g on g.group_uuid = md5('plan-group-' || i)""",
+    """insert into user_access_to_group (user_id, group_id, privilege_id, assertion_user_id)
+       select u.user_id, g.group_id, 3, g.assertion_user_id
+       from generate_series(1, %(users)s) i
+       cross join generate_series(1, 2) k
+       join users u on u.user_login = 'plan-user-' || i
+       join groups g on g.group_uuid = md5('plan-group-' || (1 + (i * k * 31) %% %(groups)s))
+       on conflict do nothing""",
+    """insert into group_access_to_resource (group_id, resource_id, privilege_id, assertion_user_id)
+       select g.group_id, r.resource_id, 3, 1
+       from generate_series(5, %(resources)s, 5) i
+       join resources r on r.resource_path = '/plan/resource/' || i
+       join groups g on g.group_uuid = md5('plan-group-' || (1 + i %% %(groups)s))""",
+    """insert into user_invitations_to_resource (user_id, resource_id, privilege_id, assertion_user_id)
+       select a.user_id, a.resource_id, 2, a.assertion_user_id
+       from generate_series(10, %(resources)s, 10) i
+       join resources r on r.resource_path = '/plan/resource/' || i
+       join user_access_to_resource a on a.resource_id = r.resource_id and a.privilege_id = 3""",
+    """insert into user_invitations_to_group (user_id, group_id, privilege_id, assertion_user_id)
+       select u.user_id, o.group_id, 3, o.user_id
+       from generate_series(10, %(users)s, 10) i
+       join users u on u.user_login = 'plan-user-' || i
+       join groups g on g.group_uuid = md5('plan-group-' || (1 + (i * 37) %% %(groups)s))
+       join user_access_to_group o on o.group_id = g.group_id and o.privilege_id = 1""",
+    "alter table user_access_to_resource enable trigger user",
+    "alter table user_access_to_group enable trigger user",
+    "alter table group_access_to_resource enable trigger user",
+    "analyze",
+    "select hs_recount()",
+]
+
+# Deleting rows one by one would fire the triggers for every grant, and leave dead
+# rows that every foreign key check of the final deletion of users would scan.
+_REMOVE = [
+    """truncate user_access_to_resource, user_access_to_group, group_access_to_resource,
+                user_invitations_to_resource, user_invitations_to_group,
+                group_access_to_group, group_closure, user_folder_of_resource, user_tags_of_resource,
+                groups, resources""",
+]
+
+# Tables too large to read in full for one privilege check or listing.
+_LARGE_TABLES = set(['users', 'groups', 'resources',
+                     'user_access_to_resource', 'user_access_to_group', 'group_access_to_resource',
+                     'group_access_to_group', 'group_closure',
+                     'user_invitations_to_resource', 'user_invitations_to_group'])
+
+
+def startup(login):
+    """ log into the access control system (without password)
+    :type login: basestring
+    :param login: login name to use for user
+    :return:
+    """
+    return HSAlib.HSAccess(login, 'unused', *DATABASE)
+
+
+def generate_dataset(ha, scale=1):
+    """ fill the database with users, groups, resources and grants for planning
+    :type ha: HSAlib.HSAccess
+    :type scale: int
+    :param ha: administrative session
+    :param scale: multiplier of the number of rows generated
+    """
+    cur = ha._HSAccessCore__cur
+    sizes = {'users': _USERS * scale, 'groups': _GROUPS * scale, 'resources': _RESOURCES * scale}
+    for statement in _GENERATE:
+        cur.execute(statement % sizes)
+    ha._HSAccessCore__commit()
+    # as autovacuum would, so that index-only scans need not visit the tables
+    conn = ha._HSAccessCore__conn
+    conn.autocommit = True
+    try:
+        cur.execute("vacuum analyze")
+    finally:
+        conn.autocommit = False
+
+
+def remove_dataset(ha):
+    """ empty the database again after generate_dataset()
+    :type ha: HSAlib.HSAccess
+    :param ha: administrative session
+    """
+    cur = ha._HSAccessCore__cur
+    for statement in _REMOVE:
+        cur.execute(statement)
+    ha._HSAccessCore__commit()
+    ha._HSAccessCore__global_reset("yes, I'm sure")
+
+
+def explain(ha, query):
+    """ run a query under EXPLAIN (ANALYZE, BUFFERS)
+    :type ha: HSAlib.HSAccess
+    :type query: basestring
+    :param ha: session that ran the query
+    :param query: the query, with its arguments, as sent to the server
+    :return: the plan, as reported by FORMAT JSON
+    :rtype: dict
+    """
+    # server-side cursors send "DECLARE name CURSOR ... FOR query"
+    query = re.sub(r'(?is)^\s*declare\s+\S+\s+.*?\bcursor\b.*?\bfor\b', '', query)
+    cur = ha._HSAccessCore__cur
+    cur.execute("explain (analyze, buffers, format json) " + query)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, basestring):
+        plan = json.loads(plan)
+    ha._HSAccessCore__conn.rollback()
+    return plan[0]
+
+
+def plan_nodes(node):
+    """ iterate over a plan node and all nodes below it
+    :type node: dict
+    :param node: node of a plan from explain()
+    """
+    yield node
+    for child in node.get('Plans', []):
+        for n in plan_nodes(child):
+            yield n
+
+
+def table_of(relation):
+    """ the table a relation belongs to
+    :type relation: basestring
+    :param relation: name of a table, or of a partition made by db/partitioned.psql
+    :rtype: str
+    """
+    table = re.sub(r'_p\d+$', '', relation)
+    return table if table in _LARGE_TABLES else relation
+
+
+def sequential_scans(plan):
+    """ large tables a plan reads in full
+    :type plan: dict
+    :param plan: plan from explain()
+    :return: names of the tables
+    :rtype: list[str]
+    """
+    return sorted(set(table_of(n['Relation Name']) for n in plan_nodes(plan['Plan'])
+                      if n['Node Type'] == 'Seq Scan' and table_of(n['Relation Name']) in _LARGE_TABLES))
+
+
+def partitions_read(plan):
+    """ partitions a plan read, by table
+    :type plan: dict
+    :param plan: plan from explain()
+    :return: dict of table names to the names of their partitions that were read
+    :rtype: dict[str, set[str]]
+    """
+    result = {}
+    for n in plan_nodes(plan['Plan']):
+        if n.get('Actual Loops') and 'Relation Name' in n and table_of(n['Relation Name']) != n['Relation Name']:
+            result.setdefault(table_of(n['Relation Name']), set()).add(n['Relation Name'])
+    return result
+
+
+def describe(plan):
+    """ one line for each node of a plan, for failure messages
+    :type plan: dict
+    :param plan: plan from explain()
+    :rtype: str
+    """
+    def lines(node, depth):
+        line = '  ' * depth + node['Node Type']
+        if 'Index Name' in node:
+            line += ' using ' + node['Index Name']
+        if 'Relation Name' in node:
+            line += ' on ' + node['Relation Name']
+        yield line + ' (rows=%d loops=%d buffers=%d)' % (node['Actual Rows'], node['Actual Loops'],
+                                                         node.get('Shared Hit Blocks', 0) +
+                                                         node.get('Shared Read Blocks', 0))
+        for child in node.get('Plans', []):
+            for l in lines(child, depth + 1):
+                yield l
+    return '\n'.join(lines(plan['Plan'], 0))
+
+
+def buffers(plan):
+    """ shared buffers a plan touched while executing
+    :type plan: dict
+    :param plan: plan from explain()
+    :rtype: int
+    """
+    return plan['Plan'].get('Shared Hit Blocks', 0) + plan['Plan'].get('Shared Read Blocks', 0)
+
+
+
+
+class _RecordingBackend(HSAlib._PostgresBackend):
+    """ PostgreSQL backend that remembers the last server-side cursor it opened """
+    stream = None
+
+    def stream_cursor(self, conn):
+        self.stream = super(_RecordingBackend, self).stream_cursor(conn)
+        return self.stream
+
+
+class T01HotQueryPlans(unittest.TestCase):
+    """ The hot queries use indexes and stay within a budget of shared buffers """
+
+    # method -> (buffers, buffers per row): its (last) query may touch at most
+    # buffers + buffers per row * rows returned. Index-only probes of a few levels
+    # and a visit to the row take about 3 buffers each.
+    budgets = {
+        'resource_is_owned': (300, 0),
+        'resource_is_readable': (300, 0),
+        'get_user_privilege_over_resource': (300, 0),
+        'get_cumulative_user_privilege_over_resource': (300, 0),
+        'group_is_owned': (50, 0),
+        'get_cumulative_user_privilege_over_group': (50, 0),
+        'get_resources_held_by_user': (100, 10),
+        'get_users_holding_resource': (300, 10),
+        'get_groups_holding_resource': (50, 10),
+        'get_resources_held_by_group': (50, 10),
+        'get_groups_of_user': (50, 10),
+        'get_group_members': (50, 10),
+        'get_effective_readers': (300, 10),
+        'get_resource_invitations_sent_by_user': (50, 10),
+        'get_group_invitations_sent_by_user': (50, 10),
+        'get_resource_invitations_for_user': (50, 10),
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        ha = startup('admin')
+        remove_dataset(ha)
+        generate_dataset(ha, int(os.environ.get('HSA_PLAN_SCALE', '1')))
+        cur = ha._HSAccessCore__cur
+        cur.execute("""select count(*) from pg_partitioned_table
+                       where partrelid = 'user_access_to_resource'::regclass""")
+        cls.partitioned = cur.fetchone()[0] > 0
+        ha._HSAccessCore__conn.rollback()
+
+    @classmethod
+    def tearDownClass(cls):
+        remove_dataset(startup('admin'))
+
+    def setUp(self):
+        # plan-user-2000 owns plan-resource-2000, which is shared with plan-group-1,
+        # which contains plan-group-10 ... plan-group-19
+        self.ha = startup('plan-user-2000')
+        self.backend = _RecordingBackend()
+        self.ha._HSAccessCore__backend = self.backend
+        self.resource = hashlib.md5('plan-resource-2000').hexdigest()
+        self.group = hashlib.md5('plan-group-2000').hexdigest()
+        self.parent_group = hashlib.md5('plan-group-1').hexdigest()
+        self.reader = [u['uuid'] for u in self.ha.get_users_holding_resource(self.resource)
+                       if u['privilege'] == 'ro'][0]
+
+    def tearDown(self):
+        # a skipped test would otherwise hold its transaction open until tearDownClass
+        self.ha.release()
+
+    def check(self, method, *args):
+        """ call a method of HSAccess and check the plan of the last query it sent
+        :type method: basestring
+        :param method: name of the method
+        :param args: arguments of the method
+        """
+        self.backend.stream = None
+        result = getattr(self.ha, method)(*args)
+        if isinstance(result, dict) and 'readers' in result:
+            result['readers'] = list(result['readers'])
+        if self.backend.stream is not None:
+            query = self.backend.stream.query
+        else:
+            query = self.ha._HSAccessCore__cur.query
+        plan = explain(self.ha, query)
+        self.plan = plan
+        self.assertEqual(sequential_scans(plan), [],
+                         "%s reads whole tables:\n%s\n%s" % (method, query, describe(plan)))
+        fixed, per_row = self.budgets[method]
+        budget = fixed + per_row * plan['Plan']['Actual Rows']
+        self.assertLessEqual(buffers(plan), budget,
+                             "%s touches %d buffers (budget %d):\n%s\n%s" % (method, buffers(plan), budget,
+                                                                              query, describe(plan)))
+        return result
+
+    def test_01_privileges(self):
+        "Privilege checks"
+        self.assertTrue(self.check('resource_is_owned', self.resource))
+        self.assertTrue(self.check('resource_is_readable', self.resource, self.reader))
+        self.assertEqual(self.check('get_user_privilege_over_resource', self.resource), 'own')
+        self.assertEqual(self.check('get_cumulative_user_privilege_over_resource', self.resource, self.reader), 'ro')
+        self.assertTrue(self.check('group_is_owned', self.group))
+        self.assertEqual(self.check('get_cumulative_user_privilege_over_group', self.group), 'own')
+
+    def test_02_listings(self):
+        "Listings of resources, users, and groups"
+        self.assertIn(self.resource, [r['uuid'] for r in self.check('get_resources_held_by_user')])
+        self.assertGreater(len(self.check('get_users_holding_resource', self.resource)), 3)
+        self.assertEqual([g['uuid'] for g in self.check('get_groups_holding_resource', self.resource)],
+                         [self.parent_group])
+        self.assertIn(self.resource, [r['uuid'] for r in self.check('get_resources_held_by_group', self.parent_group)])
+        self.check('get_groups_of_user')
+        self.check('get_group_members', self.group)
+        readers = self.check('get_effective_readers', self.resource)['readers']
+        self.assertGreater(len(readers), 3)
+
+    def test_03_invitations(self):
+        "Listings of invitations"
+        self.assertGreater(len(self.check('get_resource_invitations_sent_by_user')), 0)
+        self.check('get_group_invitations_sent_by_user')
+        self.check('get_resource_invitations_for_user', self.reader)
+
+    def test_04_partition_pruning(self):
+        "With partitioned grant tables, checks and listings for one resource read one partition of each"
+        if not self.partitioned:
+            self.skipTest("grant tables are not partitioned (db/partitioned.psql)")
+        for method, args in (('resource_is_readable', (self.resource, self.reader)),
+                             ('get_cumulative_user_privilege_over_resource', (self.resource, self.reader)),
+                             ('get_users_holding_resource', (self.resource,)),
+                             ('get_groups_holding_resource', (self.resource,)),
+                             ('get_effective_readers', (self.resource,))):
+            self.check(method, *args)
+            for table, partitions in partitions_read(self.plan).items():
+                self.assertEqual(len(partitions), 1, "%s reads %s:\n%s" % (method, ', '.join(sorted(partitions)),
+                                                                          describe(self.plan)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,478 @@
+"""
+Budgets of SQL statements for the public methods of HSAccessCore and the access objects
+
+Performance regressions creep in as one more query inside a method that is called on every
+request. BUDGETS declares, for every public method of HSAccessCore, HSAccessUser, HSAccessGroup,
+HSAccessGroupInvitation, and HSAccessResource, the most statements one call may send to the
+database. install() wraps those methods so that a call that sends more fails with
+AssertionError. The test suites install the budgets for their whole run, so every call they
+make is checked; statements() counts the statements of a block, for tests of a single call.
+Budgets do not depend on the data: methods that list objects read them in a query or two,
+however many there are. The few that cannot are listed, with the reason, in UNBUDGETED.
+
+Statements are counted by cursors that replace the session's on first use, and are counted for
+the outermost call in each thread: what a method calls counts against its own budget. Only the
+connections of the session whose method is called (or of the sessions given to statements())
+are counted. uninstall() gives sessions back their own cursors. Transaction commands, preparing
+a statement on a new connection, and statements sent through server-side cursors or by other
+connections (e.g., the denial filter's) are not counted. Sessions of either backend are checked;
+the few methods that take more statements over SQLite have their budgets there in SQLITE_BUDGETS.
+"""
+__author__ = 'Alva'
+import contextlib
+import functools
+import threading
+import weakref
+
+import psycopg2.extensions
+import psycopg2.extras
+
+import HSAlib
+import HSAccessObjects
+
+# HSAsync uses the library from Python 3, which has no basestring
+try:
+    basestring
+except NameError:
+    basestring = str
+
+# class -> public method -> most statements that one call may send, however much data there is
+BUDGETS = {
+    'HSAccessCore': {
+        'accept_invitation_to_group': 10,
+        'accept_invitation_to_resource': 10,
+        'assert_folder': 3,
+        'assert_group': 7,
+        'assert_group_metadata': 7,
+        'assert_resource': 8,
+        'assert_resource_has_tag': 8,
+        'assert_resource_in_folder': 9,
+        'assert_resource_metadata': 8,
+        'assert_tag': 3,
+        'assert_user': 7,
+        'assert_user_metadata': 11,
+        'bulk_import': 144,
+        'checkpoint_audit_log': 3,
+        'export_acl': 16,
+        'get_catalog_page': 2,
+        'get_cumulative_user_privilege_over_group': 3,
+        'get_cumulative_user_privilege_over_resource': 4,
+        'get_cumulative_user_privilege_over_resource_at': 11,
+        'get_discoverable_groups': 2,
+        'get_discoverable_resources': 2,
+        'get_effective_readers': 2,
+        'get_folders': 1,
+        'get_group_invitations_for_user': 1,
+        'get_group_invitations_sent_by_user': 1,
+        'get_group_members': 3,
+        'get_group_metadata': 1,
+        'get_group_summaries': 1,
+        'get_groups': 1,
+        'get_groups_for_user': 1,
+        'get_groups_holding_resource': 2,
+        'get_groups_of_user': 2,
+        'get_login': 0,
+        'get_member_groups': 2,
+        'get_number_of_group_owners': 2,
+        'get_number_of_groups_of_user': 3,
+        'get_number_of_groups_owned_by_user': 2,
+        'get_number_of_resource_owners': 2,
+        'get_number_of_resources_held_by_user': 2,
+        'get_number_of_resources_owned_by_user': 2,
+        'get_public_groups': 2,
+        'get_public_resources': 2,
+        'get_resource_history': 6,
+        'get_resource_invitations_for_user': 1,
+        'get_resource_invitations_sent_by_user': 1,
+        'get_resource_metadata': 1,
+        'get_resource_summaries': 1,
+        'get_resources_by_tag': 2,
+        'get_resources_by_tags': 1,
+        'get_resources_held_by_group': 2,
+        'get_resources_held_by_user': 1,
+        'get_resources_in_folders': 2,
+        'get_tag_counts': 1,
+        'get_tags': 1,
+        'get_user_actions': 3,
+        'get_user_metadata': 1,
+        'get_user_privilege_over_group': 3,
+        'get_user_privilege_over_resource': 3,
+        'get_user_uuid_from_login': 1,
+        'get_users': 1,
+        'get_users_holding_resource': 2,
+        'get_uuid': 0,
+        'group_exists': 1,
+        'group_is_active': 1,
+        'group_is_discoverable': 1,
+        'group_is_owned': 3,
+        'group_is_public': 1,
+        'group_is_readable': 4,
+        'group_is_readwrite': 3,
+        'group_is_shareable': 1,
+        'invite_user_to_group': 8,
+        'invite_user_to_resource': 8,
+        'recount': 3,
+        'refuse_invitation_to_group': 6,
+        'refuse_invitation_to_resource': 6,
+        'release': 0,
+        'resource_exists': 1,
+        'resource_is_discoverable': 1,
+        'resource_is_immutable': 1,
+        'resource_is_owned': 3,
+        'resource_is_public': 1,
+        'resource_is_published': 1,
+        'resource_is_readable': 5,
+        'resource_is_readwrite': 3,
+        'resource_is_shareable': 1,
+        'retract_folder': 4,
+        'retract_group': 6,
+        'retract_resource': 6,
+        'retract_resource_has_tag': 5,
+        'retract_resource_in_folder': 5,
+        'retract_tag': 4,
+        'search_groups': 2,
+        'search_resources': 2,
+        'search_users': 1,
+        'share_group_with_group': 9,
+        'share_group_with_user': 8,
+        'share_resource_with_group': 13,
+        'share_resource_with_user': 8,
+        'uninvite_user_to_group': 5,
+        'uninvite_user_to_resource': 5,
+        'unshare_group_with_group': 7,
+        'unshare_group_with_user': 6,
+        'unshare_resource_with_group': 7,
+        'unshare_resource_with_user': 7,
+        'user_exists': 1,
+        'user_is_active': 1,
+        'user_is_admin': 1,
+        'user_is_in_group': 3,
+    },
+    'HSAccessUser': {
+        'get_access': 0,
+        'get_capabilities': 1,
+        'get_discoverable_groups': 3,
+        'get_discoverable_resources': 3,
+        'get_groups': 2,
+        'get_login': 0,
+        'get_name': 0,
+        'get_privilege_over_group': 2,
+        'get_privilege_over_resource': 2,
+        'get_public_groups': 3,
+        'get_public_resources': 3,
+        'get_resources': 2,
+        'get_uuid': 0,
+        'is_active': 0,
+        'is_admin': 0,
+        'pprint': 5,
+        'refresh': 1,
+        'register_group': 8,
+        'register_resource': 9,
+    },
+    'HSAccessGroup': {
+        'can_change': 1,
+        'can_change_flags': 1,
+        'can_delete': 1,
+        'can_share': 1,
+        'can_view': 1,
+        'get_capabilities': 1,
+        'get_name': 0,
+        'get_owners': 3,
+        'get_privilege': 0,
+        'get_uuid': 0,
+        'is_active': 0,
+        'is_discoverable': 0,
+        'is_member': 0,
+        'is_owned': 0,
+        'is_public': 0,
+        'is_readable': 0,
+        'is_shareable': 0,
+        'is_writeable': 0,
+        'refresh': 1,
+    },
+    'HSAccessGroupInvitation': {
+        'get_capabilities': 0,
+    },
+    'HSAccessResource': {
+        'can_change': 1,
+        'can_change_flags': 1,
+        'can_delete': 1,
+        'can_share': 1,
+        'can_view': 1,
+        'get_capabilities': 1,
+        'get_path': 0,
+        'get_privilege': 0,
+        'get_title': 0,
+        'get_uuid': 0,
+        'is_discoverable': 0,
+        'is_immutable': 0,
+        'is_owned': 0,
+        'is_public': 0,
+        'is_published': 0,
+        'is_readable': 0,
+        'is_shareable': 0,
+        'is_writeable': 0,
+        'refresh': 1,
+    },
+}
+
+_CLASSES = (HSAlib.HSAccessCore, HSAccessObjects.HSAccessUser, HSAccessObjects.HSAccessGroup,
+            HSAccessObjects.HSAccessGroupInvitation, HSAccessObjects.HSAccessResource)
+
+# class -> public method -> why the method has no budget
+UNBUDGETED = {
+    'HSAccessGroup': {
+        'pprint': "debugging output: reads each member as an HSAccessUser",
+    },
+    'HSAccessResource': {
+        'pprint': "debugging output: reads each holder as an HSAccessUser, and its privilege",
+    },
+}
+
+# class -> public method -> budget of a session over SQLite, where it differs from BUDGETS:
+# SQLite has no stored functions, so what one function of database.psql does takes a statement
+# for each table there
+SQLITE_BUDGETS = {
+    'HSAccessCore': {
+        'checkpoint_audit_log': 11,  # hs_audit_checkpoint
+        'recount': 4,  # hs_recount
+    },
+}
+
+# per thread: depth of budgeted calls, and the Statements counting in it
+_state = threading.local()
+# session -> (object or None for the session, attribute, original, replacement) for each
+# attribute that _instrument replaced
+_instrumented = weakref.WeakKeyDictionary()
+# (class, method) -> original method, while installed
+_originals = {}
+# 'class.method' -> most statements sent by one call, while installed
+_observed = {}
+
+
+# beginnings of the statements that prepare another on a connection that has not yet prepared it
+_PREPARING = ('select 1 from pg_prepared_statements', 'deallocate ', 'prepare ')
+
+
+def _counters():
+    """ the Statements counting in this thread """
+    if not hasattr(_state, 'counters'):
+        _state.counters = []
+    return _state.counters
+
+
+def _count(connection, query):
+    counters = _counters()
+    if not counters:
+        return
+    text = query.lstrip().lower() if isinstance(query, basestring) else ''
+    if text.startswith(_PREPARING):
+        return
+    for counter in counters:
+        if any(connection is counted for counted in counter.connections):
+            counter.count += 1
+
+
+class _CountingCursorMixin(object):
+    """ count the statements a cursor sends """
+
+    def execute(self, query, vars=None):
+        _count(self.connection, query)
+        return super(_CountingCursorMixin, self).execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        _count(self.connection, query)
+        return super(_CountingCursorMixin, self).executemany(query, vars_list)
+
+    def callproc(self, procname, parameters=None):
+        _count(self.connection, procname)
+        return super(_CountingCursorMixin, self).callproc(procname, parameters)
+
+    def copy_expert(self, sql, file, size=8192):
+        _count(self.connection, sql)
+        return super(_CountingCursorMixin, self).copy_expert(sql, file, size)
+
+
+class CountingCursor(_CountingCursorMixin, psycopg2.extras.DictCursor):
+    """ the session's cursor, counting the statements it sends """
+
+
+class CountingPlainCursor(_CountingCursorMixin, psycopg2.extensions.cursor):
+    """ cursors the session opens for itself, counting the statements they send """
+
+
+class CountingSQLiteCursor(_CountingCursorMixin, HSAlib._SQLiteCursor):
+    """ cursors of a session over SQLite, counting the statements they send """
+
+
+def _counting_factories(cur):
+    """ the counting cursor factories for the session's cursor and for its other cursors, or None """
+    if isinstance(cur, psycopg2.extras.DictCursor):
+        return CountingCursor, CountingPlainCursor
+    if isinstance(cur, HSAlib._SQLiteCursor):
+        return CountingSQLiteCursor, CountingSQLiteCursor
+    return None
+
+
+def public_methods(cls):
+    """ names of the public methods that a class itself defines (static methods send nothing) """
+    return sorted(name for name, value in vars(cls).items()
+                  if not name.startswith('_') and callable(value) and not isinstance(value, staticmethod))
+
+
+def _session_of(obj):
+    """ the HSAccess session behind a session or an access object """
+    if isinstance(obj, HSAlib.HSAccessCore):
+        return obj
+    for name, value in vars(obj).items():
+        if name.endswith('__hsa'):
+            return value
+    return None
+
+
+def _connections_of(session):
+    """ the connections of a session (None for none) """
+    if session is None:
+        return []
+    return [conn for conn in (getattr(session, '_HSAccessCore__conn', None),
+                              getattr(session, '_HSAccessCore__replica_conn', None)) if conn is not None]
+
+
+def _instrument(obj):
+    """ give the session behind obj counting cursors, if it does not have them, and return the session """
+    session = _session_of(obj)
+    if session is None:
+        return None
+    replaced = _instrumented.setdefault(session, [])
+    for name in ('_HSAccessCore__cur', '_HSAccessCore__replica_cur'):
+        cur = getattr(session, name, None)
+        if cur is None or isinstance(cur, _CountingCursorMixin) or _counting_factories(cur) is None:
+            continue
+        factory, plain_factory = _counting_factories(cur)
+        counting = cur.connection.cursor(cursor_factory=factory)
+        replaced.append((None, name, cur, counting))
+        setattr(session, name, counting)
+        if cur.connection.cursor_factory is not plain_factory:
+            replaced.append((cur.connection, 'cursor_factory', cur.connection.cursor_factory, plain_factory))
+            cur.connection.cursor_factory = plain_factory
+    return session
+
+
+def _restore(session):
+    """ give a session back what _instrument replaced, unless the session has replaced it since """
+    for obj, name, original, replacement in reversed(_instrumented.pop(session, [])):
+        if obj is None:
+            obj = session
+        if getattr(obj, name, None) is replacement:
+            setattr(obj, name, original)
+
+
+def _budgeted(cls, name, method, budget, sqlite_budget):
+    key = cls.__name__ + '.' + name
+
+    @functools.wraps(method)
+    def call(self, *args, **kwargs):
+        if getattr(_state, 'depth', 0) > 0:
+            _state.depth += 1
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                _state.depth -= 1
+        session = _instrument(self)
+        limit = budget
+        # a session whose constructor failed has no backend, but may still be released
+        if getattr(getattr(session, '_HSAccessCore__backend', None), 'name', None) == 'sqlite':
+            limit = sqlite_budget
+        sent = Statements(_connections_of(session))
+        counters = _counters()
+        counters.append(sent)
+        _state.depth = 1
+        try:
+            result = method(self, *args, **kwargs)
+        finally:
+            _state.depth = 0
+            counters.remove(sent)
+        _observed[key] = max(_observed.get(key, 0), sent.count)
+        if sent.count > limit:
+            raise AssertionError("%s sent %d statements; its budget is %d" % (key, sent.count, limit))
+        return result
+    return call
+
+
+def install(budgets=None, sqlite_budgets=None):
+    """
+    Check the budgets of every public method until uninstall() is called
+
+    :type budgets: dict
+    :param budgets: budgets to check, as BUDGETS, which is the default
+    :type sqlite_budgets: dict
+    :param sqlite_budgets: budgets of sessions over SQLite where they differ, as SQLITE_BUDGETS,
+        which is the default
+    """
+    if budgets is None:
+        budgets = BUDGETS
+    if sqlite_budgets is None:
+        sqlite_budgets = SQLITE_BUDGETS
+    uninstall()
+    for cls in _CLASSES:
+        for name in public_methods(cls):
+            if name in UNBUDGETED.get(cls.__name__, {}):
+                continue
+            _originals[(cls, name)] = vars(cls)[name]
+            budget = budgets[cls.__name__][name]
+            sqlite_budget = sqlite_budgets.get(cls.__name__, {}).get(name, budget)
+            setattr(cls, name, _budgeted(cls, name, vars(cls)[name], budget, sqlite_budget))
+
+
+def uninstall():
+    """ stop checking budgets, and give every session back its own cursors """
+    for (cls, name), method in _originals.items():
+        setattr(cls, name, method)
+    _originals.clear()
+    for session in list(_instrumented.keys()):
+        _restore(session)
+
+
+def observed():
+    """
+    Most statements sent by one call of each method called since install()
+
+    :return: dict from 'class.method' to number of statements
+    :rtype: dict
+    """
+    return dict(_observed)
+
+
+class Statements(object):
+    """ the number of statements sent through some connections within a block of statements() """
+
+    def __init__(self, connections):
+        self.connections = connections
+        self.count = 0
+
+
+@contextlib.contextmanager
+def statements(*sessions):
+    """
+    Count the statements sent by sessions (or access objects) within a block
+
+    :return: Statements whose count is final when the block ends
+    :rtype: Statements
+
+    Sessions that were not counting their statements before the block get their own cursors back
+    at its end.
+    """
+    fresh = [session for session in (_session_of(obj) for obj in sessions)
+             if session is not None and session not in _instrumented]
+    connections = []
+    for obj in sessions:
+        connections += _connections_of(_instrument(obj))
+    counted = Statements(connections)
+    counters = _counters()
+    counters.append(counted)
+    try:
+        yield counted
+    finally:
+        counters.remove(counted)
+        for session in fresh:
+            _restore(session)
@@ -386,9 +386,10 @@ class HSAccessUser(HSAccessObject):
         This gets the list of groups accessible to the current user, as objects. 
         """
         group_uuids = self.__hsa.get_groups_for_user(self.__uuid)
+        summaries = self.__hsa.get_group_summaries([g['uuid'] for g in group_uuids])
         result = []
         for g in group_uuids:
-            result += [HSAccessGroup(self.__hsa, g['uuid'])]
+            result += [HSAccessGroup(self.__hsa, g['uuid'], summaries[g['uuid']])]
         return result
 
     def get_public_groups(self):
@@ -403,9 +404,10 @@ class HSAccessUser(HSAccessObject):
         group_uuids = self.__hsa.get_public_groups()
         # print "group_uuids is "
         # pprint(group_uuids)
+        summaries = self.__hsa.get_group_summaries([g['uuid'] for g in group_uuids])
         result = []
         for g in group_uuids:
-            result += [HSAccessGroup(self.__hsa, g['uuid'])]
+            result += [HSAccessGroup(self.__hsa, g['uuid'], summaries[g['uuid']])]
         return result
 
     def get_discoverable_groups(self):
@@ -418,9 +420,10 @@ class HSAccessUser(HSAccessObject):
         This gets the list of groups discoverable by the current user, as objects.
         """
         group_uuids = self.__hsa.get_discoverable_groups()
+        summaries = self.__hsa.get_group_summaries([g['uuid'] for g in group_uuids])
         result = []
         for g in group_uuids:
-            result += [HSAccessGroup(self.__hsa, g['uuid'])]
+            result += [HSAccessGroup(self.__hsa, g['uuid'], summaries[g['uuid']])]
         return result
 
     # obey access control
@@ -434,9 +437,10 @@ class HSAccessUser(HSAccessObject):
         This gets the list of resources accessible to the current user, as objects. 
         """
         resource_uuids = self.__hsa.get_resources_held_by_user(self.__uuid)
+        summaries = self.__hsa.get_resource_summaries([g['uuid'] for g in resource_uuids])
         result = []
         for g in resource_uuids:
-            result += [HSAccessResource(self.__hsa, g['uuid'])]
+            result += [HSAccessResource(self.__hsa, g['uuid'], summaries[g['uuid']])]
         return result
 
     def get_public_resources(self):
@@ -449,9 +453,10 @@ class HSAccessUser(HSAccessObject):
         This gets the list of resources accessible to the current user, as objects.
         """
         resource_uuids = self.__hsa.get_public_resources()
+        summaries = self.__hsa.get_resource_summaries([g['uuid'] for g in resource_uuids])
         result = []
         for g in resource_uuids:
-            result += [HSAccessResource(self.__hsa, g['uuid'])]
+            result += [HSAccessResource(self.__hsa, g['uuid'], summaries[g['uuid']])]
         return result
 
     def get_discoverable_resources(self):
@@ -464,9 +469,10 @@ class HSAccessUser(HSAccessObject):
         This gets the list of resources accessible to the current user, as objects.
         """
         resource_uuids = self.__hsa.get_discoverable_resources()
+        summaries = self.__hsa.get_resource_summaries([g['uuid'] for g in resource_uuids])
         result = []
         for g in resource_uuids:
-            result += [HSAccessResource(self.__hsa, g['uuid'])]
+            result += [HSAccessResource(self.__hsa, g['uuid'], summaries[g['uuid']])]
         return result
 
     # ## ERROR ### def get_group_invitations(self):
@@ -618,14 +624,16 @@ class HSAccessGroup(HSAccessObject):
 
     This is a simple reflection interface that informs one as to whether group operations are possible
     """
-    def __init__(self, hsa, uuid):
+    def __init__(self, hsa, uuid, summary=None):
         """
         Initialize a group object
 
         :type hsa: HSAccess
         :type uuid: basestring
+        :type summary: dict
         :param hsa: raw access object: instance of HSAccess. 
         :param uuid: uuid of group to represent. 
+        :param summary: the group's record from HSAccess.get_group_summaries; omit to read it.
         """
         if not isinstance(hsa, HSAccess):
             raise HSAUsageException("hsa is not an instance of HSAccess")
@@ -634,7 +642,10 @@ class HSAccessGroup(HSAccessObject):
 
         self.__hsa = hsa
         self.__uuid = uuid
-        self.refresh()
+        if summary is None:
+            self.refresh()
+        else:
+            self.__summarize(summary)
 
     def refresh(self):
         """
@@ -643,10 +654,14 @@ class HSAccessGroup(HSAccessObject):
         :return: dict of metadata
         :rtype: dict
         """
-        self.__meta = self.__hsa.get_group_metadata(self.__uuid)
-        self.__priv_cum = self.__hsa.get_cumulative_user_privilege_over_group(self.__uuid)
-        self.__priv_prim = self.__hsa.get_user_privilege_over_group(self.__uuid)
-        self.__member = self.__hsa.user_is_in_group(self.__uuid)
+        self.__summarize(self.__hsa.get_group_summaries([self.__uuid])[self.__uuid])
+
+    def __summarize(self, summary):
+        """ cache a record of HSAccess.get_group_summaries """
+        self.__meta = summary['metadata']
+        self.__priv_cum = summary['privilege']
+        self.__priv_prim = summary['user_privilege']
+        self.__member = summary['member']
 
     def get_uuid(self):
         """ 
@@ -733,9 +748,10 @@ class HSAccessGroup(HSAccessObject):
         This is a privileged routine made accessible by :py:meth:`get_capabilities`. 
         """
         res = self.__hsa.get_resources_held_by_group(self.__uuid)
+        summaries = self.__hsa.get_resource_summaries([m['uuid'] for m in res])
         results = []
         for m in res:
-            results += [HSAccessResource(self.__hsa, m['uuid'])]
+            results += [HSAccessResource(self.__hsa, m['uuid'], summaries[m['uuid']])]
         return results
 
     # privileges
@@ -931,10 +947,13 @@ class HSAccessGroup(HSAccessObject):
         methods are also protected from being executed inappropriately. 
         """
         capabilities = {}
-        if not self.__hsa.user_is_active():
+        # one lookup of the current user answers both whether it is active and whether it is an administrator
+        user = self.__hsa.get_user_metadata()
+        if not user['active']:
             return {}
+        admin = user['admin']
         # if the user is administrator or owner, then can set flags
-        if self.__hsa.user_is_admin() or self.is_owned():
+        if admin or self.is_owned():
             capabilities['change_name'] = self.__change_name
 
             if self.is_discoverable():
@@ -952,14 +971,14 @@ class HSAccessGroup(HSAccessObject):
             else:
                 capabilities['make_shareable'] = self.__make_shareable
 
-        if self.__hsa.user_is_admin() or self.is_owned() or self.is_shareable():
+        if admin or self.is_owned() or self.is_shareable():
             capabilities['share_with_user'] = self.__share_with_user
             # capabilities['invite_user'] = self.__invite_user
 
-        if self.__hsa.user_is_admin() or self.is_member() or self.is_public():
+        if admin or self.is_member() or self.is_public():
             capabilities['get_members'] = self.__get_members
 
-        if self.__hsa.user_is_admin() or self.is_member():
+        if admin or self.is_member():
             capabilities['get_resources'] = self.__get_resources
 
         return capabilities
@@ -1220,14 +1239,16 @@ class HSAccessResource(HSAccessObject):
 
     This is a simple reflection interface that informs one as to whether resource operations are possible
     """
-    def __init__(self, hsa, uuid):
+    def __init__(self, hsa, uuid, summary=None):
         """
         Initialize a resource object
 
         :type hsa: HSAccess
         :type uuid: basestring 
+        :type summary: dict
         :param hsa: Object describing the current (primitive) session.
         :param uuid: uuid of resource. 
+        :param summary: the resource's record from HSAccess.get_resource_summaries; omit to read it.
 
         This builds a resource object from a resource uuid, and caches the state of the 
         resource to save time during rendering. 
@@ -1239,7 +1260,10 @@ class HSAccessResource(HSAccessObject):
 
         self.__hsa = hsa
         self.__uuid = uuid
-        self.refresh()
+        if summary is None:
+            self.refresh()
+        else:
+            self.__summarize(summary)
 
     def refresh(self):
         """
@@ -1248,9 +1272,13 @@ class HSAccessResource(HSAccessObject):
         :return: dict of metadata
         :rtype: dict
         """
-        self.__meta = self.__hsa.get_resource_metadata(self.__uuid)
-        self.__priv_cum = self.__hsa.get_cumulative_user_privilege_over_resource(self.__uuid)
-        self.__priv_prim = self.__hsa.get_user_privilege_over_resource(self.__uuid)
+        self.__summarize(self.__hsa.get_resource_summaries([self.__uuid])[self.__uuid])
+
+    def __summarize(self, summary):
+        """ cache a record of HSAccess.get_resource_summaries """
+        self.__meta = summary['metadata']
+        self.__priv_cum = summary['privilege']
+        self.__priv_prim = summary['user_privilege']
 
     # these routines are available to all users
     def get_uuid(self):
@@ -1498,11 +1526,12 @@ class HSAccessResource(HSAccessObject):
         methods are also protected from being executed inappropriately. 
         """
         capabilities = {}
-        if not self.__hsa.user_is_active():
+        user = self.__hsa.get_user_metadata()  # active and admin flags in one query
+        if not user['active']:
             return {}
         # if the user is administrator or owner, then can set flags
 
-        if self.__hsa.user_is_admin() or self.is_owned():
+        if user['admin'] or self.is_owned():
             capabilities['change_title'] = self.__change_title
             capabilities['get_users'] = self.__get_users
             capabilities['get_groups'] = self.__get_groups
@@ -1580,9 +1609,10 @@ class HSAccessResource(HSAccessObject):
         :rtype: list[HSAccessGroup] 
         """
         groups = self.__hsa.get_groups_holding_resource(self.__uuid)
+        summaries = self.__hsa.get_group_summaries([u['uuid'] for u in groups])
         result = []
         for u in groups:
-            result += [HSAccessGroup(self.__hsa, u['uuid'])]
+            result += [HSAccessGroup(self.__hsa, u['uuid'], summaries[u['uuid']])]
         return result
 
     def __change_title(self, new_name):
@@ -1,10 +1,40 @@
 __author__ = 'Alva'
 from HSAlib import HSAccess, HSAccessException, HSAUsageException, HSAIntegrityException
 from HSAccessObjects import HSAccessUser, HSAccessGroup, HSAccessResource
+import HSAQueryBudgets
 
+import os
+import sqlite3
+import tempfile
 import unittest
 from pprint import pprint
 
+# backend to test (from HSA_TEST_BACKEND): 'postgres', the default, or 'sqlite'
+BACKEND = os.environ.get('HSA_TEST_BACKEND', 'postgres')
+# database to test against: name (from HSA_TEST_DATABASE), user, password, host, and port.
+# For SQLite, the name is that of a file, which setUpModule makes afresh from db/database.sqlite.
+if BACKEND == 'sqlite':
+    DATABASE = (os.environ.get('HSA_TEST_DATABASE', os.path.join(tempfile.gettempdir(), 'hs_objects_test.db')),
+                None, None, None, None)
+else:
+    DATABASE = (os.environ.get('HSA_TEST_DATABASE', 'acouch'), 'acouch', 'xyzzy', 'localhost', '5432')
+
+
+def setUpModule():
+    if BACKEND == 'sqlite':
+        for path in (DATABASE[0], DATABASE[0] + '-wal', DATABASE[0] + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+        db = sqlite3.connect(DATABASE[0])
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'db', 'database.sqlite')) as f:
+            db.executescript(f.read())
+        db.close()
+    HSAQueryBudgets.install()
+
+
+def tearDownModule():
+    HSAQueryBudgets.uninstall()
+
 # class Stasher(object):
 #     """
 #     This allows recovery of object details for objects that have been created before,
@@ -144,7 +174,7 @@ class T01CreateUser(unittest.TestCase):
         admin._HSAccessUser__hsa._HSAccessCore__global_reset("yes, I'm sure")
 
     def login(self, login):
-        self.hsaccess_instance = HSAccess(login, 'unused', 'acouch', 'acouch', 'xyzzy', 'localhost', '5432')
+        self.hsaccess_instance = HSAccess(login, 'unused', *DATABASE, backend=BACKEND)
         self.login_name = login
         self.user_object = HSAccessUser(self.hsaccess_instance, self.hsaccess_instance.get_uuid())
         return self.user_object
@@ -262,7 +292,7 @@ class T02RegularUser(unittest.TestCase):
         # self.dog = admin_caps['register_user']('dog', 'one little arfer')
 
     def login(self, login):
-        self.hsaccess_instance = HSAccess(login, 'unused', 'acouch', 'acouch', 'xyzzy', 'localhost', '5432')
+        self.hsaccess_instance = HSAccess(login, 'unused', *DATABASE, backend=BACKEND)
         self.login_name = login
         self.user_object = HSAccessUser(self.hsaccess_instance, self.hsaccess_instance.get_uuid())
         return self.user_object
@@ -318,7 +348,7 @@ class T03RegisterResource(unittest.TestCase):
         # self.dog = admin_caps['register_user']('dog', 'one little arfer')
 
     def login(self, login):
-        self.hsaccess_instance = HSAccess(login, 'unused', 'acouch', 'acouch', 'xyzzy', 'localhost', '5432')
+        self.hsaccess_instance = HSAccess(login, 'unused', *DATABASE, backend=BACKEND)
         self.login_name = login
         self.user_object = HSAccessUser(self.hsaccess_instance, self.hsaccess_instance.get_uuid())
         return self.user_object
@@ -536,7 +566,7 @@ class T04ResourcePublicAndDiscoverable(unittest.TestCase):
         # self.dog = admin_caps['register_user']('dog', 'one little arfer')
 
     def login(self, login):
-        self.hsaccess_instance = HSAccess(login, 'unused', 'acouch', 'acouch', 'xyzzy', 'localhost', '5432')
+        self.hsaccess_instance = HSAccess(login, 'unused', *DATABASE, backend=BACKEND)
         self.login_name = login
         self.user_object = HSAccessUser(self.hsaccess_instance, self.hsaccess_instance.get_uuid())
         return self.user_object
@@ -631,7 +661,7 @@ class T06RegisterGroup(unittest.TestCase):
         # self.dog = admin_caps['register_user']('dog', 'one little arfer')
 
     def login(self, login):
-        self.hsaccess_instance = HSAccess(login, 'unused', 'acouch', 'acouch', 'xyzzy', 'localhost', '5432')
+        self.hsaccess_instance = HSAccess(login, 'unused', *DATABASE, backend=BACKEND)
         self.login_name = login
         self.user_object = HSAccessUser(self.hsaccess_instance, self.hsaccess_instance.get_uuid())
         return self.user_object
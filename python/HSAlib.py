@@ -11,11 +11,34 @@ The HSAccess library implements access control logic for scientific data sharing
 __author__ = 'Alva Couch'
 
 
+import collections
+import csv
+import datetime
+import functools
+import glob
+import gzip
+import json
+import math
+import os
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
+import psycopg2.pool
+import random
+import re
+import sqlite3
+import threading
+import time
 import uuid
+import weakref
 # from pprint import pprint
 
+# HSAsync uses this library from Python 3, which has no basestring
+try:
+    basestring
+except NameError:
+    basestring = str
+
 
 ##################################################################
 # assertion logic for filesystem protection model
@@ -29,9 +52,6 @@ import uuid
 # indicating why it cannot be made true.
 ##################################################################
 # to be done:
-# deep logic for ownership: do not allow the last owner to disown
-# - for groups (not tested)
-# - for resources (not tested)
 # invite/accept logic for resources
 ##################################################################
 
@@ -107,6 +127,1410 @@ class HSAIntegrityException(HSAException):
     pass
 
 
+##################################################################
+# connection pooling
+# A web front end creates one HSAccess session per request. Rather than
+# opening a new database connection for each one, sessions can borrow a
+# connection from a pool that is shared by every session in the process.
+##################################################################
+
+_connection_pools = {}
+_connection_pools_lock = threading.Lock()
+
+
+def get_connection_pool(db_database, db_user, db_password, db_host, db_port, minconn=1, maxconn=20):
+    """
+    Get the process-wide connection pool for a database, creating it if necessary
+
+    :type db_database: basestring
+    :type db_user: basestring
+    :type db_password: basestring
+    :type db_host: basestring
+    :type db_port: basestring
+    :type minconn: int
+    :type maxconn: int
+    :param db_database: name of the access control database
+    :param db_user: database user
+    :param db_password: database password
+    :param db_host: database host
+    :param db_port: database port
+    :param minconn: connections to open when the pool is created
+    :param maxconn: largest number of connections the pool will hold open
+    :return: a thread-safe pool suitable for the 'pool' argument of HSAccess
+    :rtype: psycopg2.pool.ThreadedConnectionPool
+
+    There is one pool per set of database parameters. minconn and maxconn only apply
+    when the pool is first created.
+    """
+    key = (db_database, db_user, db_host, str(db_port))
+    with _connection_pools_lock:
+        if key not in _connection_pools:
+            try:
+                _connection_pools[key] = psycopg2.pool.ThreadedConnectionPool(
+                    minconn, maxconn, database=db_database, user=db_user, password=db_password,
+                    host=db_host, port=db_port)
+            except psycopg2.Error:
+                raise HSAIntegrityException("unable to connect to the database")
+        return _connection_pools[key]
+
+
+##################################################################
+# grant table maintenance
+# In very large deployments, db/partitioned.psql divides the tables of
+# grants over resources into partitions by hash of resource. Each partition
+# can then be vacuumed, analyzed, or reindexed on its own, several at once,
+# rather than the whole table at a time.
+##################################################################
+
+_GRANT_TABLES = ('user_access_to_resource', 'group_access_to_resource')
+
+_MAINTENANCE_COMMANDS = {
+    'vacuum': 'VACUUM {}',
+    'analyze': 'ANALYZE {}',
+    'vacuum analyze': 'VACUUM ANALYZE {}',
+    'reindex': 'REINDEX TABLE CONCURRENTLY {}',
+}
+
+
+def maintain_grant_tables(db_database, db_user, db_password, db_host, db_port,
+                          operation='vacuum analyze', jobs=4):
+    """
+    Vacuum, analyze, or reindex the tables of grants over resources, a partition at a time
+
+    :type db_database: basestring
+    :type db_user: basestring
+    :type db_password: basestring
+    :type db_host: basestring
+    :type db_port: basestring
+    :type operation: basestring
+    :type jobs: int
+    :param db_database: name of the access control database
+    :param db_user: database user; must own the tables
+    :param db_password: database password
+    :param db_host: database host
+    :param db_port: database port
+    :param operation: 'vacuum', 'analyze', 'vacuum analyze', or 'reindex'
+    :param jobs: how many partitions to work on at once, each over its own connection
+    :return: names of the tables or partitions maintained
+    :rtype: list[str]
+
+    Tables that are not partitioned are maintained whole. Reindexing does not block
+    changes to the table. If any partition fails, the others that have not started
+    are left alone, and the failure is reported.
+    """
+    if operation not in _MAINTENANCE_COMMANDS:
+        raise HSAUsageException("operation must be one of " + ", ".join(sorted(_MAINTENANCE_COMMANDS)))
+    if not isinstance(jobs, int) or jobs < 1:
+        raise HSAUsageException("jobs must be a positive integer")
+
+    def connect():
+        try:
+            conn = psycopg2.connect(database=db_database, user=db_user, password=db_password,
+                                    host=db_host, port=db_port)
+        except psycopg2.Error:
+            raise HSAIntegrityException("unable to connect to the database")
+        conn.autocommit = True  # vacuum cannot run in a transaction
+        return conn
+
+    conn = connect()
+    try:
+        cur = conn.cursor()
+        pending = []
+        for table in _GRANT_TABLES:
+            cur.execute("""SELECT inhrelid::regclass::text FROM pg_inherits
+                           WHERE inhparent = %s::regclass ORDER BY 1""", (table,))
+            pending.extend([r[0] for r in cur.fetchall()] or [table])
+    finally:
+        conn.close()
+
+    done = []
+    failures = []
+    lock = threading.Lock()
+
+    def work():
+        try:
+            conn = connect()
+        except HSAIntegrityException as e:
+            with lock:
+                failures.append(e)
+            return
+        try:
+            cur = conn.cursor()
+            while True:
+                with lock:
+                    if failures or not pending:
+                        return
+                    table = pending.pop(0)
+                try:
+                    cur.execute(_MAINTENANCE_COMMANDS[operation].format(
+                        psycopg2.extensions.quote_ident(table, cur)))
+                except psycopg2.Error as e:
+                    with lock:
+                        failures.append(HSAIntegrityException(
+                            "unable to {} {}: {}".format(operation, table, e.pgerror or e)))
+                    return
+                with lock:
+                    done.append(table)
+        finally:
+            conn.close()
+
+    workers = [threading.Thread(target=work) for i in range(min(jobs, len(pending)))]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    if failures:
+        raise failures[0]
+    return done
+
+
+##################################################################
+# storage backends
+# The access control database is normally kept by a PostgreSQL server
+# (db/database.psql). For a single node, e.g., at the edge of a network,
+# it can instead be an SQLite file in the same process (db/database.sqlite),
+# so that checks need no round trip to a server. Both files define the same
+# tables and views, so HSAccessCore issues the same queries to either;
+# a backend supplies what differs: connections, errors, word search, and
+# the maintenance that PostgreSQL does in stored functions.
+##################################################################
+
+class _PostgresBackend(object):
+    """
+    PRIVATE: access control database kept by a PostgreSQL server (db/database.psql)
+    """
+    name = 'postgres'
+    Error = psycopg2.Error
+    # current time, to the microsecond, for the audit log
+    clock = "clock_timestamp()"
+
+    def connect(self, db_database, db_user, db_password, db_host, db_port):
+        return psycopg2.connect(database=db_database, user=db_user, password=db_password,
+                                host=db_host, port=db_port)
+
+    def cursor(self, conn):
+        return conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+
+    def stream_cursor(self, conn):
+        """
+        Cursor for results too large to fetch at once: a server-side cursor
+        """
+        cur = conn.cursor(name='hs_cursor_' + uuid.uuid4().hex, cursor_factory=psycopg2.extras.DictCursor)
+        cur.itersize = 1000
+        return cur
+
+    def error_code(self, error):
+        """
+        SQLSTATE of an error, e.g., 'HS001' when the last owner would be removed
+        """
+        return error.pgcode
+
+    # SQLSTATEs after which a prepared statement is prepared again: the server does not know it,
+    # or the views it reads have been redefined so that its results would change type
+    __UNPREPARED_SQLSTATES = ('26000', '0A000')
+
+    def execute_prepared(self, cur, name, args):
+        """
+        Execute one of _prepared_statements, preparing it on cur's connection if necessary
+
+        A statement that must be prepared again is, and is executed again, if the failure came
+        at the start of a transaction; within a transaction, the error is raised and the statement
+        is prepared again by the next transaction.
+        """
+        conn = cur.connection
+        with _prepared_statistics_lock:
+            prepared = _prepared_connections.setdefault(conn, set())
+        fresh = conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        preparations = 0
+        try:
+            if name not in prepared:
+                self.__prepare(cur, name, prepared)
+                preparations += 1
+            try:
+                cur.execute("execute hs_" + name + "(" + ", ".join(["%s"] * len(args)) + ")", args)
+            except psycopg2.Error as e:
+                if e.pgcode not in self.__UNPREPARED_SQLSTATES:
+                    raise
+                prepared.clear()
+                if not fresh:
+                    raise
+                conn.rollback()
+                self.__prepare(cur, name, prepared)
+                preparations += 1
+                cur.execute("execute hs_" + name + "(" + ", ".join(["%s"] * len(args)) + ")", args)
+        finally:
+            _count_prepared(name, 1, preparations)
+
+    def __prepare(self, cur, name, prepared):
+        """
+        PRIVATE: prepare a statement on cur's connection, replacing any with the same name
+        """
+        sql = _prepared_statements[name]
+        number = [0]
+
+        def placeholder(match):
+            number[0] += 1
+            return '$' + str(number[0])
+        cur.execute("select 1 from pg_prepared_statements where name=%s", ('hs_' + name,))
+        if cur.rowcount > 0:
+            cur.execute("deallocate hs_" + name)
+        cur.execute("prepare hs_" + name + " as " + re.sub(r'%s', placeholder, sql))
+        prepared.add(name)
+
+    def match_words(self, column):
+        """
+        Condition that text matches words, given as the argument of words_argument
+        """
+        return "to_tsvector('simple', " + column + ") @@ to_tsquery('simple', %s)"
+
+    def rank_words(self, column):
+        """
+        How well text matches words, given as the argument of words_argument; larger is better
+        """
+        return "ts_rank(to_tsvector('simple', " + column + "), to_tsquery('simple', %s))"
+
+    def words_argument(self, words):
+        """
+        Argument of match_words and rank_words: each word must begin a word of the text
+        """
+        return ' & '.join(w + ':*' for w in words)
+
+    def in_list(self, column):
+        """
+        Condition that a column is one of a list of values, given as the argument of list_argument
+        """
+        return column + " = any(%s)"
+
+    def list_argument(self, values):
+        """
+        Argument of in_list
+        """
+        return list(values)
+
+    def defer_constraints(self, cur):
+        cur.execute("set constraints all deferred")
+
+    def clear_audit_log(self, cur):
+        # the audit log refuses deletion
+        cur.execute("truncate audit_log")
+
+    def recount(self, cur):
+        cur.execute("select hs_recount() as corrected")
+        return cur.fetchone()['corrected']
+
+    def checkpoint_audit_log(self, cur):
+        cur.execute("select hs_audit_checkpoint() as checkpoint_time")
+        return cur.fetchone()['checkpoint_time']
+
+
+def _sqlite_words(text):
+    """
+    PRIVATE: words of text, in lower case, as HSAccessCore splits search queries
+    """
+    return re.findall(r'[^\W_]+', text.lower(), re.UNICODE)
+
+
+def _sqlite_words_match(text, words):
+    """
+    PRIVATE: SQL function hs_words_match(text, words): whether each word begins a word of text
+    """
+    if text is None or not words:
+        return False
+    found = _sqlite_words(text)
+    return all(any(f.startswith(w) for f in found) for w in words.split())
+
+
+def _sqlite_words_rank(text, words):
+    """
+    PRIVATE: SQL function hs_words_rank(text, words): number of words of text that words begin
+    """
+    if text is None or not words:
+        return 0
+    words = words.split()
+    return sum(1 for f in _sqlite_words(text) if any(f.startswith(w) for w in words))
+
+
+def _sqlite_clock():
+    """
+    PRIVATE: SQL function hs_clock(): the local time to the microsecond, as PostgreSQL's clock_timestamp()
+    """
+    return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+sqlite3.register_converter('BOOLEAN', lambda value: int(value) != 0)
+
+_sqlite_queries = {}
+
+
+class _SQLiteRow(list):
+    """
+    PRIVATE: row of an SQLite result, indexed by position or by column name, as psycopg2's DictRow
+    """
+    def __init__(self, values, index):
+        list.__init__(self, values)
+        self.__index = index
+
+    def __getitem__(self, key):
+        if isinstance(key, basestring):
+            return list.__getitem__(self, self.__index[key])
+        return list.__getitem__(self, key)
+
+
+class _SQLiteCursor(object):
+    """
+    PRIVATE: cursor over an SQLite database that behaves as the psycopg2 cursors HSAccessCore uses
+
+    Queries use psycopg2's %s parameters. Results are fetched when the query is executed,
+    so rowcount counts the rows selected, as it does for psycopg2.
+    """
+    def __init__(self, connection, cur):
+        self.connection = connection
+        self.__cur = cur
+        self.__rows = []
+        self.__next = 0
+        self.query = None
+        self.description = None
+        self.rowcount = -1
+        self.closed = False
+
+    def execute(self, query, args=None):
+        if args is not None:
+            translated = _sqlite_queries.get(query)
+            if translated is None:
+                translated = query.replace('%s', '?').replace('%%', '%')
+                _sqlite_queries[query] = translated
+            query = translated
+            args = tuple(args)
+        else:
+            args = ()
+        self.connection.begin_for(query)
+        self.__cur.execute(query, args)
+        self.query = query
+        self.description = self.__cur.description
+        if self.description is not None:
+            index = {}
+            for i, column in enumerate(self.description):
+                index[column[0]] = i            # the last column of a name, as DictRow
+            self.__rows = [_SQLiteRow(row, index) for row in self.__cur.fetchall()]
+            self.rowcount = len(self.__rows)
+        else:
+            self.__rows = []
+            self.rowcount = self.__cur.rowcount
+        self.__next = 0
+
+    def fetchone(self):
+        if self.__next >= len(self.__rows):
+            return None
+        self.__next += 1
+        return self.__rows[self.__next - 1]
+
+    def fetchall(self):
+        rows = self.__rows[self.__next:]
+        self.__next = len(self.__rows)
+        return rows
+
+    def __iter__(self):
+        while self.__next < len(self.__rows):
+            yield self.fetchone()
+
+    def close(self):
+        self.__cur.close()
+        self.__rows = []
+        self.closed = True
+
+
+class _SQLiteConnection(object):
+    """
+    PRIVATE: connection to an SQLite database that behaves as the psycopg2 connections HSAccessCore uses
+
+    As in PostgreSQL's default isolation, each query sees every change committed before it starts.
+    A transaction starts, taking the database's write lock, with the first statement that is not
+    a query, and lasts until commit or rollback. Statements are prepared once per connection.
+    """
+    def __init__(self, path, timeout):
+        self.dsn = 'sqlite:' + path
+        self.cursor_factory = _SQLiteCursor
+        self.__db = sqlite3.connect(path, timeout=timeout, isolation_level=None,
+                                    detect_types=sqlite3.PARSE_DECLTYPES, cached_statements=256)
+        self.__in_transaction = False
+        self.__db.execute("PRAGMA journal_mode=WAL")
+        self.__db.execute("PRAGMA synchronous=NORMAL")
+        self.__db.execute("PRAGMA foreign_keys=ON")
+        self.__db.execute("PRAGMA case_sensitive_like=ON")
+        self.__db.create_function('hs_words_match', 2, _sqlite_words_match)
+        self.__db.create_function('hs_words_rank', 2, _sqlite_words_rank)
+        self.__db.create_function('hs_clock', 0, _sqlite_clock)
+        self.closed = False
+
+    def cursor(self, cursor_factory=None):
+        """
+        A new cursor, made by cursor_factory or else the connection's, as psycopg2 does
+        """
+        return (cursor_factory or self.cursor_factory)(self, self.__db.cursor())
+
+    def begin_for(self, query):
+        """
+        Start a transaction, unless one is under way, if query is not a query
+        """
+        if not self.__in_transaction and query.lstrip()[:6].lower() != 'select':
+            self.__db.execute("BEGIN IMMEDIATE")
+            self.__in_transaction = True
+
+    def commit(self):
+        if self.__in_transaction:
+            self.__in_transaction = False
+            self.__db.execute("COMMIT")
+
+    def rollback(self):
+        if self.__in_transaction:
+            self.__in_transaction = False
+            self.__db.execute("ROLLBACK")
+
+    def close(self):
+        if not self.closed:
+            self.__db.close()
+            self.closed = True
+
+
+class _SQLiteBackend(object):
+    """
+    PRIVATE: access control database kept in an SQLite file (db/database.sqlite)
+    """
+    name = 'sqlite'
+    Error = sqlite3.Error
+    clock = "hs_clock()"
+
+    # seconds to wait for another process to finish a change
+    __TIMEOUT = 30
+
+    def connect(self, db_database, db_user, db_password, db_host, db_port):
+        try:
+            return _SQLiteConnection(db_database, self.__TIMEOUT)
+        except sqlite3.Error:
+            raise HSAIntegrityException("unable to connect to the database")
+
+    def cursor(self, conn):
+        return conn.cursor()
+
+    def stream_cursor(self, conn):
+        return conn.cursor()
+
+    def error_code(self, error):
+        """
+        Code with which a trigger of db/database.sqlite refused a change, e.g., 'HS001'
+        """
+        code = re.match(r'(HS\d{3}):', str(error))
+        if code is None:
+            return None
+        return code.group(1)
+
+    def execute_prepared(self, cur, name, args):
+        # sqlite3 prepares each statement once per connection
+        cur.execute(_prepared_statements[name], args)
+        _count_prepared(name, 1, 0)
+
+    def match_words(self, column):
+        return "hs_words_match(" + column + ", %s)"
+
+    def rank_words(self, column):
+        return "hs_words_rank(" + column + ", %s)"
+
+    def words_argument(self, words):
+        return ' '.join(words)
+
+    def in_list(self, column):
+        return column + " in (select value from json_each(%s))"
+
+    def list_argument(self, values):
+        return json.dumps(list(values))
+
+    def defer_constraints(self, cur):
+        # checks are immediate; callers order their deletions instead
+        pass
+
+    def clear_audit_log(self, cur):
+        # the audit log refuses deletion; lift that for the length of the transaction
+        cur.execute("select name, sql from sqlite_master where type='trigger' and tbl_name='audit_log'")
+        triggers = cur.fetchall()
+        for trigger in triggers:
+            cur.execute("drop trigger " + trigger['name'])
+        cur.execute("delete from audit_log")
+        for trigger in triggers:
+            cur.execute(trigger['sql'])
+
+    def recount(self, cur):
+        """
+        Repair owner counts; the other counts of database.psql are views here
+        """
+        corrected = 0
+        for table, id_column, count_column, grants in (
+                ('resources', 'resource_id', 'resource_owner_count', 'user_access_to_resource'),
+                ('groups', 'group_id', 'group_owner_count', 'user_access_to_group')):
+            owners = """(select count(*) from
+                            (select a.user_id from """ + grants + """ a
+                             join users u on u.user_id=a.user_id and u.user_active
+                             where a.""" + id_column + """=t.""" + id_column + """
+                             group by a.user_id having min(a.privilege_id)=1))"""
+            cur.execute("update " + table + " as t set " + count_column + "=" + owners +
+                        " where " + count_column + " <> " + owners)
+            corrected += cur.rowcount
+        return corrected
+
+    def checkpoint_audit_log(self, cur):
+        """
+        Take a checkpoint as hs_audit_checkpoint does in database.psql
+        """
+        cur.execute("""insert into audit_checkpoints (checkpoint_time)
+                       values (hs_clock())""")
+        cur.execute("""select checkpoint_id, checkpoint_time from audit_checkpoints
+                       where checkpoint_id=last_insert_rowid()""")
+        checkpoint = cur.fetchone()
+        checkpoint_id = checkpoint['checkpoint_id']
+        cur.execute("""insert into audit_checkpoint_state (checkpoint_id, verb, user_id, flags)
+                       select %s, 'assert_user', user_id,
+                              coalesce(case when user_active then 'a' end, '') ||
+                              coalesce(case when user_admin then 'A' end, '')
+                       from users""", (checkpoint_id,))
+        cur.execute("""insert into audit_checkpoint_state (checkpoint_id, verb, group_id, flags)
+                       select %s, 'assert_group', group_id,
+                              coalesce(case when group_active then 'a' end, '') ||
+                              coalesce(case when group_shareable then 's' end, '') ||
+                              coalesce(case when group_discoverable then 'd' end, '') ||
+                              coalesce(case when group_public then 'p' end, '')
+                       from groups""", (checkpoint_id,))
+        cur.execute("""insert into audit_checkpoint_state (checkpoint_id, verb, resource_id, flags)
+                       select %s, 'assert_resource', resource_id,
+                              coalesce(case when resource_shareable then 's' end, '') ||
+                              coalesce(case when resource_discoverable then 'd' end, '') ||
+                              coalesce(case when resource_public then 'p' end, '') ||
+                              coalesce(case when resource_immutable then 'i' end, '') ||
+                              coalesce(case when resource_published then 'P' end, '')
+                       from resources""", (checkpoint_id,))
+        cur.execute("""insert into audit_checkpoint_state
+                           (checkpoint_id, verb, assertion_user_id, user_id, resource_id, privilege_id)
+                       select %s, 'share_resource_with_user', assertion_user_id, user_id, resource_id, privilege_id
+                       from user_access_to_resource""", (checkpoint_id,))
+        cur.execute("""insert into audit_checkpoint_state
+                           (checkpoint_id, verb, assertion_user_id, group_id, resource_id, privilege_id)
+                       select %s, 'share_resource_with_group', assertion_user_id, group_id, resource_id, privilege_id
+                       from group_access_to_resource""", (checkpoint_id,))
+        cur.execute("""insert into audit_checkpoint_state
+                           (checkpoint_id, verb, assertion_user_id, user_id, group_id, privilege_id)
+                       select %s, 'share_group_with_user', assertion_user_id, user_id, group_id, privilege_id
+                       from user_access_to_group""", (checkpoint_id,))
+        cur.execute("""insert into audit_checkpoint_state
+                           (checkpoint_id, verb, assertion_user_id, group_id, member_group_id)
+                       select %s, 'share_group_with_group', assertion_user_id, group_id, member_group_id
+                       from group_access_to_group""", (checkpoint_id,))
+        return checkpoint['checkpoint_time']
+
+
+_backends = {
+    'postgres': _PostgresBackend(),
+    'sqlite': _SQLiteBackend()
+}
+
+
+##################################################################
+# prepared statements
+# The lookups made by every privilege check are prepared once per
+# database connection, so that the server plans them, views and all,
+# once rather than on each call. A connection borrowed from a pool keeps
+# its statements when it is given back. Statements are prepared again,
+# without the caller noticing, if the server has forgotten them (e.g., the
+# connection was reset) or if the views they read have been redefined.
+##################################################################
+
+_prepared_statements = {
+    'user_id_from_uuid': "select user_id from users where user_uuid=%s",
+    'user_id_from_login': "select user_id from users where user_login=%s",
+    'user_uuid_from_login': "select user_uuid from users where user_login=%s",
+    'user_login_from_uuid': "select user_login from users where user_uuid=%s",
+    'group_id_from_uuid': "select group_id from groups where group_uuid=%s",
+    'resource_id_from_uuid': "select resource_id from resources where resource_uuid=%s",
+    'user_privilege_over_resource': """select user_id, resource_id, privilege_id from user_resource_privilege
+                                       where user_id=%s and resource_id=%s""",
+    'cumulative_user_privilege_over_resource': """select user_id, resource_id, privilege_id
+                                                  from cumulative_user_resource_privilege
+                                                  where user_id=%s and resource_id=%s""",
+    'user_privilege_over_group': """select privilege_id from user_group_privilege
+                                    where user_id=%s and group_id=%s""",
+    'cumulative_user_privilege_over_group': """select privilege_id from cumulative_user_group_privilege
+                                               where user_id=%s and group_id=%s""",
+}
+
+# statement name -> counts of executions and of preparations, for this process
+_prepared_statistics = dict((name, {'executions': 0, 'preparations': 0}) for name in _prepared_statements)
+_prepared_statistics_lock = threading.Lock()
+# connection -> names of the statements prepared on it
+_prepared_connections = weakref.WeakKeyDictionary()
+
+
+def get_prepared_statement_statistics():
+    """
+    Report how often each prepared statement has been executed and prepared by this process
+
+    :return: dict of statement names to dicts with keys 'executions', 'preparations', and 'hits'
+    :rtype: dict[str, dict[str, int]]
+
+    'hits' counts executions that found the statement already prepared on their connection.
+    With the SQLite backend, sqlite3 keeps statements prepared itself, and every execution is a hit.
+    """
+    with _prepared_statistics_lock:
+        result = {}
+        for name, counts in _prepared_statistics.items():
+            result[name] = {'executions': counts['executions'],
+                            'preparations': counts['preparations'],
+                            'hits': counts['executions'] - counts['preparations']}
+        return result
+
+
+def _count_prepared(name, executions, preparations):
+    """
+    PRIVATE: add to the statistics of a prepared statement
+    """
+    with _prepared_statistics_lock:
+        _prepared_statistics[name]['executions'] += executions
+        _prepared_statistics[name]['preparations'] += preparations
+
+
+##################################################################
+# catalog cache
+# Public and discoverable listings are the same for everyone, so they
+# are cached once per process and shared by all sessions. Each cached
+# listing records the catalog version it was read at; the database bumps
+# that version whenever the listing changes (see catalog_versions).
+##################################################################
+
+_catalog_cache = {}
+_catalog_cache_lock = threading.Lock()
+
+
+##################################################################
+# denial filters
+# Most privilege checks are denials: users probing resources that nobody
+# shared with them. A denial filter is a process-wide Bloom filter of the
+# (user, resource) pairs that hold any privilege in one database, plus the
+# set of public resources. A pair that is in neither holds no privilege,
+# so the check is answered without querying the privilege views.
+# The filter is built from a snapshot of cumulative_user_resource_privilege,
+# and kept up to date by the notifications the database sends on channel
+# hs_grants whenever a privilege may have been granted (see
+# hs_grant_notify_trigger). Revocations are not sent; the pairs they leave
+# behind are merely checked against the database until the next rebuild.
+##################################################################
+
+class _BloomFilter(object):
+    """
+    PRIVATE: a set of pairs of integers that never misses a pair it holds,
+    but may claim to hold pairs it does not
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        """
+        Make an empty filter
+
+        :type capacity: int
+        :type error_rate: float
+        :param capacity: pairs it can hold before its error rate exceeds error_rate
+        :param error_rate: chance that it claims to hold a pair it does not
+        """
+        self.capacity = max(int(capacity), 1024)
+        self.count = 0
+        self.__bits = int(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.__hashes = max(1, int(round(self.__bits * math.log(2) / self.capacity)))
+        self.__array = bytearray((self.__bits + 7) // 8)
+
+    def __positions(self, a, b):
+        """
+        PRIVATE: the bits that represent a pair, by double hashing
+        """
+        h1 = hash((a, b))
+        h2 = hash((b, a, self.__bits)) | 1
+        return [(h1 + i * h2) % self.__bits for i in range(self.__hashes)]
+
+    def add(self, a, b):
+        for p in self.__positions(a, b):
+            self.__array[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, pair):
+        for p in self.__positions(pair[0], pair[1]):
+            if not self.__array[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+
+class _DenialFilter(object):
+    """
+    PRIVATE: the pairs of (user_id, resource_id) that may hold privilege in one database
+
+    The filter listens for hs_grants on a connection of its own, and reads notifications
+    waiting on that connection before each lookup. It is rebuilt from a snapshot when first
+    used, when it is full, when the connection fails, and at least every __MAX_AGE seconds,
+    to shed pairs whose privilege has been revoked. Rebuilds run on a thread of their own,
+    with a connection of their own; the filter they replace answers lookups meanwhile.
+    """
+
+    __MAX_AGE = 3600
+    __RETRY = 10  # seconds to wait after a rebuild fails before trying again
+    __BATCH = 10000  # pairs read from the snapshot at a time
+
+    def __init__(self, db_database, db_user, db_password, db_host, db_port):
+        self.__params = dict(database=db_database, user=db_user, password=db_password,
+                             host=db_host, port=db_port)
+        self.__lock = threading.Lock()
+        self.__conn = None
+        self.__pairs = None
+        self.__public = None
+        self.__built = 0
+        self.__builder = None
+        self.__failed = 0
+        self.lookups = 0
+        self.denials = 0
+        self.rebuilds = 0
+
+    def may_hold(self, user_id, resource_id):
+        """
+        Whether a user may hold privilege over a resource
+
+        :type user_id: int
+        :type resource_id: int
+        :param user_id: private id of the user
+        :param resource_id: private id of the resource
+        :return: False if the user certainly holds no privilege over the resource and it is not public
+        :rtype: bool
+
+        This never waits for a rebuild. Until the filter is first built, while it cannot follow
+        changes, while another thread is reading notifications, or if the database cannot be
+        reached, the answer is True, so that the caller asks the database.
+        """
+        if not self.__lock.acquire(False):
+            return True
+        try:
+            if not self.__refresh():
+                return True
+            self.lookups += 1
+            if (user_id, resource_id) in self.__pairs or resource_id in self.__public:
+                return True
+            self.denials += 1
+            return False
+        finally:
+            self.__lock.release()
+
+    def sync(self):
+        """
+        Read every notification sent before now
+
+        A session calls this after committing a change, so that the change is not denied by
+        the filter when the session checks it. The round trip ensures that notifications sent
+        by transactions already committed have arrived.
+        """
+        with self.__lock:
+            if self.__conn is not None:
+                try:
+                    self.__conn.cursor().execute("select 1")
+                except psycopg2.Error:
+                    self.__close()
+                    return
+                self.__refresh()
+
+    def warm(self):
+        """
+        Build the filter now, if it has not been built, rather than at the first lookup
+
+        Unlike a lookup, this waits for the rebuild to finish.
+        """
+        with self.__lock:
+            self.__refresh()
+            builder = self.__builder
+        if builder is not None:
+            builder.join()
+
+    def __refresh(self):
+        """
+        PRIVATE: apply waiting notifications, starting a rebuild if necessary
+
+        :return: whether the filter can be used
+        :rtype: bool
+        """
+        if self.__conn is not None:
+            try:
+                self.__conn.poll()
+                if not self.__apply(self.__conn, self.__pairs, self.__public):
+                    # a change the filter cannot follow; it must not answer until rebuilt
+                    self.__close()
+            except psycopg2.Error:
+                self.__close()
+        if self.__conn is None or time.time() - self.__built > self.__MAX_AGE \
+                or self.__pairs.count > self.__pairs.capacity:
+            self.__start_rebuild()
+        return self.__pairs is not None
+
+    def __start_rebuild(self):
+        """
+        PRIVATE: start a rebuild on a thread of its own, unless one is running or recently failed
+        """
+        if self.__builder is not None or time.time() - self.__failed < self.__RETRY:
+            return
+        self.__builder = threading.Thread(target=self.__rebuild, name='hs_denial_filter')
+        self.__builder.daemon = True
+        self.__builder.start()
+
+    def __rebuild(self):
+        """
+        PRIVATE: build the filter again from a snapshot of the database, then put it in use
+
+        The connection listens before the snapshot is read, so that grants committed while it
+        is read are applied afterward rather than lost. The pairs and the public resources are
+        read in one repeatable-read transaction, so that they describe the same moment, and the
+        pairs are streamed through a server-side cursor rather than held in memory. Only the
+        exchange of the new filter for the old takes the lock.
+        """
+        conn = None
+        try:
+            conn = psycopg2.connect(**self.__params)
+            conn.autocommit = True
+            conn.cursor().execute("LISTEN hs_grants")
+            conn.autocommit = False
+            conn.set_session(isolation_level=psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ,
+                             readonly=True)
+            cur = conn.cursor()
+            cur.execute("SELECT count(*) FROM cumulative_user_resource_privilege")
+            pairs = _BloomFilter(2 * cur.fetchone()[0])
+            stream = conn.cursor(name='hs_denial_filter')
+            stream.execute("SELECT user_id, resource_id FROM cumulative_user_resource_privilege")
+            while True:
+                rows = stream.fetchmany(self.__BATCH)
+                if not rows:
+                    break
+                for user_id, resource_id in rows:
+                    pairs.add(user_id, resource_id)
+            stream.close()
+            cur.execute("SELECT resource_id FROM resources WHERE resource_public")
+            public = set(r[0] for r in cur.fetchall())
+            conn.commit()
+            conn.set_session(isolation_level='DEFAULT', readonly='DEFAULT', autocommit=True)
+            conn.poll()
+            if not self.__apply(conn, pairs, public):
+                # asked to rebuild again; do so at the next lookup
+                conn.close()
+                conn = None
+        except psycopg2.Error:
+            if conn is not None:
+                conn.close()
+            conn = None
+        with self.__lock:
+            self.__builder = None
+            if conn is None:
+                self.__failed = time.time()
+                return
+            self.__close()
+            self.__conn, self.__pairs, self.__public = conn, pairs, public
+            self.__built = time.time()
+            self.rebuilds += 1
+
+    @staticmethod
+    def __apply(conn, pairs, public):
+        """
+        PRIVATE: apply the notifications a filter's connection has received so far
+
+        :param conn: connection that listens for hs_grants
+        :param pairs: the filter's pairs
+        :param public: the filter's public resources
+        :return: False if the filter must be rebuilt instead
+        :rtype: bool
+        """
+        cur = conn.cursor()
+        notifies = list(conn.notifies)
+        del conn.notifies[:]
+        for notify in notifies:
+            words = notify.payload.split()
+            if words[0] == 'pair':
+                pairs.add(int(words[1]), int(words[2]))
+            elif words[0] == 'resource':
+                cur.execute("""SELECT user_id, resource_id FROM cumulative_user_resource_privilege
+                               WHERE resource_id=%s""", (int(words[1]),))
+                for user_id, resource_id in cur.fetchall():
+                    pairs.add(user_id, resource_id)
+            elif words[0] == 'user':
+                cur.execute("""SELECT user_id, resource_id FROM cumulative_user_resource_privilege
+                               WHERE user_id=%s""", (int(words[1]),))
+                for user_id, resource_id in cur.fetchall():
+                    pairs.add(user_id, resource_id)
+            elif words[0] == 'public':
+                public.add(int(words[1]))
+            else:  # not understood; start again from a snapshot
+                return False
+        return True
+
+    def __close(self):
+        """
+        PRIVATE: forget the filter and its connection
+        """
+        if self.__conn is not None:
+            try:
+                self.__conn.close()
+            except psycopg2.Error:
+                pass
+        self.__conn = None
+        self.__pairs = None
+        self.__public = None
+
+_denial_filters = {}
+_denial_filters_lock = threading.Lock()
+
+
+def get_denial_filter_statistics():
+    """
+    Report how the denial filters of this process have been used
+
+    :return: dict with keys 'lookups', 'denials', and 'rebuilds', summed over all databases
+    :rtype: dict[str, int]
+
+    'denials' counts the lookups answered without querying privileges.
+    """
+    with _denial_filters_lock:
+        filters = list(_denial_filters.values())
+    return {'lookups': sum(f.lookups for f in filters),
+            'denials': sum(f.denials for f in filters),
+            'rebuilds': sum(f.rebuilds for f in filters)}
+
+
+##################################################################
+# single flight
+# When many requests ask the same privilege question at once, e.g., the
+# first visitors to a newly shared resource, only one session of the
+# process asks the database. The others wait for its answer.
+##################################################################
+
+_flights = {}
+_flights_lock = threading.Lock()
+_flight_statistics = {'flights': 0, 'coalesced': 0}
+_commit_sequence = 0
+
+
+class _Flight(object):
+    """
+    PRIVATE: one question being asked of the database, and its answer once known
+    """
+
+    def __init__(self, sequence):
+        self.sequence = sequence
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+def _note_commit():
+    """
+    PRIVATE: note that a session of this process has committed a change
+
+    Questions already being asked may not see the change, so later callers do not wait for them.
+    """
+    global _commit_sequence
+    with _flights_lock:
+        _commit_sequence += 1
+
+
+def _single_flight(key, compute):
+    """
+    PRIVATE: answer a question, sharing the answer with identical questions asked at the same time
+
+    :type key: tuple
+    :param key: the question, including the database asked
+    :param compute: function of no arguments that answers the question from the database
+    :return: the answer
+
+    A caller waits for a question already being asked only if no session of this process has
+    committed since it was asked. If that question fails, each waiter asks it again itself.
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        if flight is not None and flight.sequence == _commit_sequence:
+            _flight_statistics['coalesced'] += 1
+            leader = False
+        else:
+            flight = _Flight(_commit_sequence)
+            _flights[key] = flight
+            _flight_statistics['flights'] += 1
+            leader = True
+    if not leader:
+        flight.done.wait()
+        if flight.failed:
+            return compute()
+        return flight.result
+    try:
+        flight.result = compute()
+    except:
+        flight.failed = True
+        raise
+    finally:
+        with _flights_lock:
+            if _flights.get(key) is flight:
+                del _flights[key]
+        flight.done.set()
+    return flight.result
+
+
+def get_single_flight_statistics():
+    """
+    Report how many privilege questions this process has asked, and how many were coalesced
+
+    :return: dict with keys 'flights' (questions asked of the database) and 'coalesced'
+        (calls that waited for an identical question rather than asking it)
+    :rtype: dict[str, int]
+    """
+    with _flights_lock:
+        return dict(_flight_statistics)
+
+
+##################################################################
+# decision traces and warm-up
+# A worker that has just started has no pooled connections, no prepared
+# statements, and no denial filter, so its first requests are slow. Each
+# worker can record the (user, resource) pairs whose privilege it decides
+# in a rotating trace file of its own. A worker that is starting reads the
+# traces of its predecessors and warms up on the decisions they made
+# most recently, before it is put into service.
+##################################################################
+
+_decision_trace = None
+_decision_trace_lock = threading.Lock()
+
+
+class _DecisionTrace(object):
+    """
+    PRIVATE: a file of the (user_id, resource_id) pairs decided by this process, one per line
+
+    Privilege checks only append their pair to a queue in memory. A thread of the trace's own
+    writes the queue to the file every __INTERVAL seconds, or sooner once __BATCH pairs are
+    waiting; if it falls __PENDING pairs behind, the oldest waiting pairs are dropped. When the
+    file reaches max_bytes, it becomes path.1 (path.1 becomes path.2, and so on up to
+    path.<backups>) and a new file is started.
+    """
+
+    __INTERVAL = 1.0
+    __BATCH = 1000
+    __PENDING = 100000
+
+    def __init__(self, path, max_bytes, backups):
+        self.__path = path
+        self.__max_bytes = max_bytes
+        self.__backups = backups
+        self.__file = open(path, 'a')
+        self.__pending = collections.deque(maxlen=self.__PENDING)
+        self.__wake = threading.Event()
+        self.__closing = False
+        self.__writer = threading.Thread(target=self.__write_pending, name='hs-decision-trace')
+        self.__writer.daemon = True
+        self.__writer.start()
+
+    def record(self, user_id, resource_id):
+        # appending to a deque is atomic, so checks need no lock
+        self.__pending.append((user_id, resource_id))
+        if len(self.__pending) == self.__BATCH:
+            self.__wake.set()
+
+    def __write_pending(self):
+        """
+        PRIVATE: the writer thread: write waiting pairs to the file until the trace is closed
+        """
+        while not self.__closing:
+            self.__wake.wait(self.__INTERVAL)
+            self.__wake.clear()
+            self.__flush()
+        self.__flush()
+
+    def __flush(self):
+        """
+        PRIVATE: write the waiting pairs, rotating the file as it fills
+        """
+        while True:
+            try:
+                user_id, resource_id = self.__pending.popleft()
+            except IndexError:
+                break
+            self.__file.write('%d %d\n' % (user_id, resource_id))
+            if self.__file.tell() >= self.__max_bytes:
+                self.__rotate()
+        self.__file.flush()
+
+    def __rotate(self):
+        """
+        PRIVATE: move the trace to path.1, and older traces one further, and start a new trace
+        """
+        self.__file.close()
+        for number in range(self.__backups - 1, 0, -1):
+            older = '%s.%d' % (self.__path, number)
+            if os.path.exists(older):
+                os.rename(older, '%s.%d' % (self.__path, number + 1))
+        if self.__backups > 0:
+            os.rename(self.__path, self.__path + '.1')
+        else:
+            os.remove(self.__path)
+        self.__file = open(self.__path, 'a')
+
+    def close(self):
+        """
+        Write the pairs still waiting, and stop
+        """
+        self.__closing = True
+        self.__wake.set()
+        self.__writer.join()
+        self.__file.close()
+
+
+def record_decision_trace(path, max_bytes=4 * 1024 * 1024, backups=1):
+    """
+    Record the privilege decisions made by this process, for a later warm_up
+
+    :type path: basestring
+    :type max_bytes: int
+    :type backups: int
+    :param path: file to append to, or None to stop recording
+    :param max_bytes: size at which the file is rotated
+    :param backups: number of rotated files to keep, as path.1, path.2, ...
+
+    Every check of a user's privilege over a resource, made by any session of the process,
+    appends the user and resource to the trace. Checks queue their decisions in memory, and a
+    background thread writes them within a second; stopping the recording writes the rest.
+    Each process must record to a file of its own, e.g., one of a fixed number of slots that
+    restarted processes reuse (as HSAccessMiddleware does), so that files do not accumulate.
+    A trace is only meaningful for the database it was recorded from.
+    """
+    global _decision_trace
+    if path is not None and (not isinstance(max_bytes, int) or max_bytes < 1
+                             or not isinstance(backups, int) or backups < 0):
+        raise HSAUsageException("max_bytes must be positive and backups must not be negative")
+    with _decision_trace_lock:
+        if _decision_trace is not None:
+            _decision_trace.close()
+            _decision_trace = None
+        if path is not None:
+            _decision_trace = _DecisionTrace(path, max_bytes, backups)
+
+
+def _trace_decision(user_id, resource_id):
+    """
+    PRIVATE: append a decision to the trace, if one is being recorded
+    """
+    trace = _decision_trace
+    if trace is not None:
+        trace.record(user_id, resource_id)
+
+
+def _read_decision_traces(pattern, limit):
+    """
+    PRIVATE: the distinct pairs most recently recorded in the traces that match a pattern
+
+    :type pattern: basestring
+    :type limit: int
+    :return: up to limit (user_id, resource_id) pairs, the most recent first
+    :rtype: list[tuple[int, int]]
+
+    Files are read newest first, each from its end, until limit pairs have been found.
+    """
+    pairs = []
+    seen = set()
+    for path in sorted(glob.glob(pattern), key=os.path.getmtime, reverse=True):
+        try:
+            with open(path) as trace:
+                lines = trace.readlines()
+        except (IOError, OSError):
+            continue
+        for line in reversed(lines):
+            words = line.split()
+            if len(words) != 2 or not words[0].isdigit() or not words[1].isdigit():
+                continue
+            pair = (int(words[0]), int(words[1]))
+            if pair not in seen:
+                seen.add(pair)
+                pairs.append(pair)
+                if len(pairs) >= limit:
+                    return pairs
+    return pairs
+
+
+def warm_up(trace_pattern, db_database, db_user, db_password, db_host, db_port,
+            pool=None, denial_filter=False, limit=10000):
+    """
+    Prepare this process to answer privilege checks quickly, from the traces of earlier processes
+
+    :type trace_pattern: basestring
+    :type db_database: basestring
+    :type db_user: basestring
+    :type db_password: basestring
+    :type db_host: basestring
+    :type db_port: basestring
+    :type pool: psycopg2.pool.AbstractConnectionPool
+    :type denial_filter: bool
+    :type limit: int
+    :param trace_pattern: glob pattern matching the files written by record_decision_trace
+    :param pool: pool whose connections to warm, e.g., from get_connection_pool; omit to warm
+        the database alone
+    :param denial_filter: also build the process-wide denial filter of the database
+    :param limit: number of recent decisions to warm up on
+    :return: dict with keys 'decisions' (pairs read from the traces), 'granted' (of those,
+        pairs that hold privilege), and 'connections' (connections warmed)
+    :rtype: dict[str, int]
+
+    The connections the pool keeps open (its minconn, but at least one) are opened now, and prepare
+    the statements used by privilege checks. The decisions most recently recorded in the traces, and
+    the users and resources they concern, are read with a few bulk queries, so that the database has
+    them in memory when the first requests arrive. Decisions are not remembered by the process itself:
+    sessions still ask the database, so that no decision can be out of date.
+
+    This should be called once when a worker starts, before it is put into service.
+    """
+    if not isinstance(limit, int) or limit < 0:
+        raise HSAUsageException("limit must not be negative")
+    pairs = _read_decision_traces(trace_pattern, limit)
+    user_ids = sorted(set(p[0] for p in pairs))
+    resource_ids = sorted(set(p[1] for p in pairs))
+    backend = _backends['postgres']
+    connections = []
+    try:
+        if pool is not None:
+            # a pool that keeps no connection open still lends one for the bulk queries
+            for _ in range(max(pool.minconn, 1)):
+                connections.append(pool.getconn())
+        else:
+            connections.append(backend.connect(db_database, db_user, db_password, db_host, db_port))
+        pair = pairs[0] if pairs else (0, 0)
+        samples = {'user_privilege_over_resource': pair,
+                   'cumulative_user_privilege_over_resource': pair,
+                   'user_privilege_over_group': (pair[0], 0),
+                   'cumulative_user_privilege_over_group': (pair[0], 0)}
+        for conn in connections:
+            cur = backend.cursor(conn)
+            for name in _prepared_statements:
+                backend.execute_prepared(cur, name, samples.get(name, ('',)))
+            conn.rollback()
+        cur = backend.cursor(connections[0])
+        cur.execute("select user_id, user_uuid, user_login from users where user_id = any(%s)", (user_ids,))
+        cur.execute("""select resource_id, resource_uuid, resource_public from resources
+                       where resource_id = any(%s)""", (resource_ids,))
+        cur.execute("""select p.user_id, p.resource_id, p.privilege_id
+                       from cumulative_user_resource_privilege p
+                       join unnest(%s::integer[], %s::integer[]) as t(user_id, resource_id)
+                       using (user_id, resource_id)""",
+                    ([p[0] for p in pairs], [p[1] for p in pairs]))
+        granted = cur.rowcount
+        connections[0].rollback()
+    except psycopg2.Error:
+        raise HSAIntegrityException("unable to warm up from the database")
+    finally:
+        for conn in connections:
+            if pool is not None:
+                pool.putconn(conn)
+            else:
+                conn.close()
+    if denial_filter:
+        key = (db_database, db_user, db_host, str(db_port))
+        with _denial_filters_lock:
+            if key not in _denial_filters:
+                _denial_filters[key] = _DenialFilter(db_database, db_user, db_password, db_host, db_port)
+            flt = _denial_filters[key]
+        flt.warm()
+    return {'decisions': len(pairs), 'granted': granted, 'connections': len(connections)}
+
+
+##################################################################
+# bulk import
+# HSAccessCore.bulk_import copies records into staging tables with COPY.
+# Records given as JSON lines are turned into CSV on the way.
+##################################################################
+
+class _ImportStream(object):
+    """
+    PRIVATE: a file-like object that gives COPY the records of a JSON lines stream as CSV
+
+    Each non-blank line becomes one record with the given columns, followed by the reason it
+    must be rejected, if any: the line is not a JSON object, or has fields not in columns.
+    """
+
+    def __init__(self, stream, columns):
+        self.__lines = self.__records(stream, columns)
+        self.__buffer = ''
+
+    @staticmethod
+    def __records(stream, columns):
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if not isinstance(record, dict):
+                values, reason = [None] * len(columns), 'not a JSON object'
+            else:
+                unknown = sorted(set(record) - set(columns))
+                values = [record.get(name) for name in columns]
+                reason = "unknown field '%s'" % unknown[0] if unknown else None
+            fields = []
+            for value in values + [reason]:
+                if value is None:
+                    fields.append('')
+                else:
+                    if isinstance(value, bool):
+                        value = 'true' if value else 'false'
+                    elif not isinstance(value, basestring):
+                        value = json.dumps(value)
+                    fields.append('"' + value.replace('"', '""') + '"')
+            text = ','.join(fields) + '\n'
+            if not isinstance(text, str):
+                text = text.encode('utf-8')
+            yield text
+
+    def read(self, size=-1):
+        while size < 0 or len(self.__buffer) < size:
+            try:
+                self.__buffer += next(self.__lines)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self.__buffer)
+        data, self.__buffer = self.__buffer[:size], self.__buffer[size:]
+        return data
+
+
+
+##################################################################
+# ACL export
+# HSAccessCore.export_acl copies tables and views to gzipped CSV files with COPY.
+##################################################################
+
+class _ExportSink(object):
+    """
+    PRIVATE: a file-like object that gives the rows COPY writes to a gzip file in large pieces
+
+    COPY writes one row at a time, and compressing rows one at a time is several times slower.
+    """
+
+    def __init__(self, path, compresslevel, size=1 << 20):
+        self.__file = gzip.open(path, 'wb', compresslevel)
+        self.__size = size
+        self.__parts = []
+        self.__length = 0
+
+    def write(self, data):
+        self.__parts.append(data)
+        self.__length += len(data)
+        if self.__length >= self.__size:
+            self.flush()
+
+    def flush(self):
+        self.__file.write(b''.join(self.__parts))
+        self.__parts = []
+        self.__length = 0
+
+    def close(self):
+        self.flush()
+        self.__file.close()
+
+
 class HSAccessCore(object):
     """
     This class consists of the core methods that contact iRODS
@@ -121,30 +1545,412 @@ class HSAccessCore(object):
     __PRIVILEGE_NONE = 4            # code that no privilege is asserted
     __PRIVILEGE_CODES = ['own', 'rw', 'ro', 'none']
 
+    # cached catalogs: name -> (catalog version to check, query reporting that version with each row)
+    __CATALOGS = {
+        'public_resources': ('resources', """
+            SELECT v.catalog_version, r.resource_uuid, r.resource_title, r.resource_path,
+                   'ro' AS privilege_code
+            FROM catalog_versions v
+            LEFT JOIN resources r ON r.resource_public
+            WHERE v.catalog_name='resources'
+            ORDER BY r.resource_title, r.resource_uuid"""),
+        'discoverable_resources': ('resources', """
+            SELECT v.catalog_version, r.resource_uuid, r.resource_title, r.resource_path,
+                   CASE WHEN r.resource_public THEN 'ro'
+                        ELSE 'none'
+                   END AS privilege_code
+            FROM catalog_versions v
+            LEFT JOIN resources r ON r.resource_discoverable OR r.resource_public
+            WHERE v.catalog_name='resources'
+            ORDER BY r.resource_title, r.resource_uuid"""),
+        'public_groups': ('groups', """
+            SELECT v.catalog_version, g.group_uuid, g.group_name, 'ro' AS privilege_code
+            FROM catalog_versions v
+            LEFT JOIN groups g ON g.group_public
+            WHERE v.catalog_name='groups'
+            ORDER BY g.group_name, g.group_uuid"""),
+        'discoverable_groups': ('groups', """
+            SELECT v.catalog_version, g.group_uuid, g.group_name,
+                   CASE WHEN g.group_public THEN 'ro'
+                        ELSE 'none'
+                   END AS privilege_code
+            FROM catalog_versions v
+            LEFT JOIN groups g ON g.group_discoverable OR g.group_public
+            WHERE v.catalog_name='groups'
+            ORDER BY g.group_name, g.group_uuid""")
+    }
+    __CATALOG_PAGE_SIZE = 50
+
+    # Routing to read replicas.
+    # Public methods are marked as reading or writing. The outermost marked method decides which
+    # connection serves the whole call, so that the checks made by a change are made on the primary,
+    # in the same transaction as the change.
+
+    def __reads(method):
+        """
+        PRIVATE: mark a method that only reads, so that the session's replica may answer it
+
+        The replica is used only after it has replayed every change committed by this session.
+        If the replica fails, the session gives it up and the call is repeated on the primary.
+        """
+        @functools.wraps(method)
+        def route(self, *args, **kwargs):
+            if self.__route_depth == 0 and self.__replica_cur is not None:
+                try:
+                    if self.__replica_is_current():
+                        return self.__call_routed(self.__replica_cur, method, args, kwargs)
+                except psycopg2.OperationalError:
+                    self.__drop_replica(broken=True)
+            return self.__call_routed(self.__cur, method, args, kwargs)
+        return route
+
+    def __writes(method):
+        """
+        PRIVATE: mark a method that makes changes, so that everything it reads comes from the primary
+
+        If the change is refused, whatever it had done is rolled back, so that it neither holds
+        locks nor is committed by the session's next change.
+        """
+        @functools.wraps(method)
+        def route(self, *args, **kwargs):
+            if self.__route_depth > 0:
+                return self.__call_routed(self.__cur, method, args, kwargs)
+            self.__writing = True
+            try:
+                return self.__call_routed(self.__cur, method, args, kwargs)
+            except Exception:
+                if self.__conn is not None:
+                    self.__conn.rollback()
+                raise
+            finally:
+                self.__writing = False
+        return route
+
     def __init__(self, irods_user, irods_password,
-                 db_database, db_user, db_password, db_host, db_port):
+                 db_database, db_user, db_password, db_host, db_port,
+                 pool=None, memoize=False, replicas=None, backend='postgres', denial_filter=False):
+        """
+        Open an access control session for a user
+
+        :type pool: psycopg2.pool.AbstractConnectionPool
+        :type memoize: bool
+        :type replicas: list
+        :type backend: basestring
+        :type denial_filter: bool
+        :param pool: borrow the database connection from this pool (see get_connection_pool);
+            omit to open a private connection.
+        :param memoize: remember privilege decisions until the next change made through this session.
+        :param replicas: (db_host, db_port) of streaming replicas of the database, to which
+            privilege checks and listings are sent; omit to send everything to db_host.
+        :param backend: 'postgres' for a PostgreSQL server loaded from db/database.psql, or 'sqlite'
+            for an SQLite file loaded from db/database.sqlite, whose path is given as db_database.
+        :param denial_filter: answer checks of privilege over resources from the process-wide denial
+            filter of the database when it shows that no privilege is held.
+
+        A session that uses a pool must be given back with 'release' when it is no longer needed,
+        e.g., at the end of a web request. Memoized decisions do not notice changes made by other
+        sessions, so memoize should only be used for sessions that live for one request.
+
+        A session with replicas reads from one of them, chosen at random, using the same database,
+        user, and password as the primary (and pools from get_connection_pool if pool is given).
+        Changes are made on the primary. Once the session has changed something, it reads from the
+        primary until the replica has replayed that change, so a session always sees its own changes.
+        If no replica can be reached, the session reads from the primary.
+
+        The SQLite backend runs the database in this process, for a single node. It ignores db_user,
+        db_password, db_host, and db_port, and cannot be used with a pool, replicas, or a denial filter.
+
+        The denial filter learns of grants made by other sessions and processes from the database,
+        within moments of their commit; a grant made by the session itself is known at once.
+        """
+        self.__irods_user = irods_user
+        # print 'irods_user is ', irods_user
+        # could authenticate against irods here
+        self.__conn = None
+        self.__cur = None
+        self.__pool = pool
+        self.__replica_conn = None
+        self.__replica_cur = None
+        self.__replica_pool = None
+        self.__route_depth = 0
+        self.__writing = False
+        self.__sticky_lsn = None
+        self.__user_id = None
+        self.__user_uuid = None
+        if memoize:
+            self.__memo = {}
+        else:
+            self.__memo = None
+        if backend not in _backends:
+            raise HSAUsageException("backend must be 'postgres' or 'sqlite'")
+        if backend != 'postgres' and (pool is not None or replicas or denial_filter):
+            raise HSAUsageException("pools, replicas, and denial filters require the postgres backend")
+        self.__backend = _backends[backend]
+        self.__denial_filter = None
+        if denial_filter:
+            key = (db_database, db_user, db_host, str(db_port))
+            with _denial_filters_lock:
+                if key not in _denial_filters:
+                    _denial_filters[key] = _DenialFilter(db_database, db_user, db_password, db_host, db_port)
+                self.__denial_filter = _denial_filters[key]
         try:
-            self.__irods_user = irods_user
-            # print 'irods_user is ', irods_user
-            # could authenticate against irods here
-            self.__conn = None
-            self.__cur = None
-            self.__conn = psycopg2.connect(database=db_database, user=db_user, password=db_password,
-                                           host=db_host, port=db_port)
-            self.__cur = self.__conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+            if pool is not None:
+                self.__conn = pool.getconn()
+            else:
+                self.__conn = self.__backend.connect(db_database, db_user, db_password, db_host, db_port)
+            self.__cur = self.__backend.cursor(self.__conn)
         except:
+            self.release()
             raise HSAIntegrityException("unable to connect to the database")
-        self.__user_id = self.__get_user_id_from_login(irods_user)
-        self.__user_uuid = self.get_user_uuid_from_login(irods_user)
+        if replicas:
+            self.__connect_replica(random.choice(list(replicas)), db_database, db_user, db_password)
+        try:
+            self.__user_id = self.__get_user_id_from_login(irods_user)
+            self.__user_uuid = self.get_user_uuid_from_login(irods_user)
+        except HSAException:
+            self.release()
+            raise
 
     def __del__(self):
+        self.release()
+
+    def release(self):
+        """
+        Give up the database connection held by this session
+
+        If the session was created with a pool, its connection is returned to the pool; otherwise
+        the connection is closed. Uncommitted work is discarded. The session cannot be used afterward.
+        It is safe to call this more than once.
+        """
         if self.__conn is not None:
-            self.__conn.close()
+            if self.__pool is not None:
+                try:
+                    self.__conn.rollback()
+                    self.__pool.putconn(self.__conn)
+                except psycopg2.Error:
+                    self.__pool.putconn(self.__conn, close=True)
+            else:
+                self.__conn.close()
+        self.__conn = None
+        self.__cur = None
+        self.__drop_replica()
+
+    def __connect_replica(self, replica, db_database, db_user, db_password):
+        """
+        PRIVATE: open the session's connection to a replica
+
+        :type replica: tuple
+        :param replica: (db_host, db_port) of the replica
+
+        The connection is in autocommit mode, so that it never holds a snapshot open on the replica.
+        Failure to connect is not an error; the session simply reads from the primary.
+        """
+        db_host, db_port = replica
+        try:
+            if self.__pool is not None:
+                self.__replica_pool = get_connection_pool(db_database, db_user, db_password, db_host, db_port)
+                self.__replica_conn = self.__replica_pool.getconn()
+            else:
+                self.__replica_conn = psycopg2.connect(database=db_database, user=db_user, password=db_password,
+                                                       host=db_host, port=db_port)
+            self.__replica_conn.autocommit = True
+            self.__replica_cur = self.__replica_conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        except (psycopg2.Error, HSAIntegrityException):
+            self.__drop_replica(broken=True)
+
+    def __drop_replica(self, broken=False):
+        """
+        PRIVATE: give up the session's replica connection, if any
+
+        :type broken: bool
+        :param broken: whether the connection failed and should be closed rather than pooled
+        """
+        if self.__replica_conn is not None:
+            if self.__replica_pool is not None:
+                try:
+                    # the pool may also serve the primary, if it has the same address
+                    self.__replica_conn.autocommit = False
+                except psycopg2.Error:
+                    broken = True
+                self.__replica_pool.putconn(self.__replica_conn, close=broken)
+            else:
+                self.__replica_conn.close()
+        self.__replica_conn = None
+        self.__replica_cur = None
+        self.__replica_pool = None
+
+    def __replica_is_current(self):
+        """
+        PRIVATE: whether the replica has replayed every change committed by this session
+
+        :rtype: bool
+
+        This asks the replica only while a change is outstanding. A server that is not in recovery
+        (e.g., a promoted replica) is current if it has written the change.
+        """
+        if self.__sticky_lsn is None:
+            return True
+        self.__replica_cur.execute("""select case when pg_is_in_recovery() then pg_last_wal_replay_lsn()
+                                                  else pg_current_wal_lsn()
+                                             end >= %s::pg_lsn as current""", (self.__sticky_lsn,))
+        if self.__replica_cur.fetchone()['current']:
+            self.__sticky_lsn = None
+            return True
+        return False
+
+    def __call_routed(self, cur, method, args, kwargs):
+        """
+        PRIVATE: call a method with self.__cur set to cur, for __reads and __writes
+        """
+        saved = self.__cur
+        self.__cur = cur
+        self.__route_depth += 1
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.__route_depth -= 1
+            self.__cur = saved
+
+    def __commit(self):
+        """
+        PRIVATE: commit the current transaction
+
+        Every change made by a session passes through here, so this is also where memoized
+        privilege decisions are forgotten, where concurrent privilege questions stop sharing
+        answers asked before the change, where the denial filter learns of the change, and where
+        a session with a replica notes how far the replica must get before it sees the change.
+        """
+        self.__conn.commit()
+        _note_commit()
+        if self.__memo is not None:
+            self.__memo.clear()
+        if self.__denial_filter is not None:
+            self.__denial_filter.sync()
+        if self.__replica_conn is not None:
+            cur = self.__conn.cursor()
+            cur.execute("select pg_current_wal_lsn()::text")
+            self.__sticky_lsn = cur.fetchone()[0]
+            self.__conn.rollback()
+
+    def __execute_prepared(self, name, args):
+        """
+        PRIVATE: execute one of _prepared_statements with the session's cursor
+
+        :type name: basestring
+        :type args: tuple
+        :param name: name of the statement
+        :param args: values of its parameters
+        """
+        self.__backend.execute_prepared(self.__cur, name, args)
+
+    # SQLSTATE raised by the database when a change would leave a resource or group without owners
+    __LAST_OWNER_SQLSTATE = 'HS001'
+    # SQLSTATE raised by the database when group membership would be circular
+    __CIRCULAR_GROUP_SQLSTATE = 'HS002'
+
+    def __check_last_owner(self, error, message):
+        """
+        PRIVATE: translate a database refusal to remove the last owner
+
+        :type error: Exception
+        :type message: basestring
+        :param error: error raised by a change to user_access_to_resource or user_access_to_group
+        :param message: explanation to give the caller
+
+        The current transaction is rolled back. If the database refused the change because it
+        would leave a resource or group without owners, this raises HSAccessException(message);
+        otherwise the original error is raised again.
+        """
+        self.__conn.rollback()
+        if self.__backend.error_code(error) == self.__LAST_OWNER_SQLSTATE:
+            raise HSAccessException(message)
+        raise error
+
+    def __audit(self, verb, user_id=None, group_id=None, resource_id=None, privilege_id=None,
+                assertion_user_id=None, flags=None, detail=None, member_group_id=None):
+        """
+        PRIVATE: append a change made by the current user to the audit log
+
+        :type verb: basestring
+        :type user_id: int
+        :type group_id: int
+        :type resource_id: int
+        :type privilege_id: int
+        :type assertion_user_id: int
+        :type flags: basestring
+        :type detail: basestring
+        :type member_group_id: int
+        :param verb: name of the routine making the change
+        :param user_id: id of affected user, if any
+        :param group_id: id of affected group, if any
+        :param resource_id: id of affected resource, if any
+        :param privilege_id: privilege granted, if any
+        :param assertion_user_id: user whose grant or invitation changed, if not the current user
+        :param flags: flags asserted, from __get_audit_flags
+        :param detail: uuid of the user, group, or resource asserted or retracted, or folder or tag name
+        :param member_group_id: id of group made a member of group_id, if any
+
+        Call this just before __commit, so that the event commits or rolls back with the change.
+        """
+        self.__cur.execute("""insert into audit_log (event_time, actor_user_id, verb, user_id, group_id, resource_id,
+                                                     member_group_id, privilege_id, assertion_user_id,
+                                                     flags, detail)
+                              values (""" + self.__backend.clock + """, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+                           (self.__user_id, verb, user_id, group_id, resource_id,
+                            member_group_id, privilege_id, assertion_user_id, flags, detail))
+
+    @staticmethod
+    def __get_audit_flags(active=False, admin=False, shareable=False, discoverable=False,
+                          public=False, immutable=False, published=False):
+        """
+        PRIVATE: encode flags for the audit log, one letter per flag that is set
+
+        :return: flag letters, in the order of the arguments
+        :rtype: basestring
+        """
+        return ''.join(letter for letter, flag in (('a', active), ('A', admin), ('s', shareable),
+                                                   ('d', discoverable), ('p', public),
+                                                   ('i', immutable), ('P', published)) if flag)
+
+    def __memoized(self, key, compute):
+        """
+        PRIVATE: answer a privilege question from the session memo if possible
+
+        :type key: tuple
+        :param key: the question, e.g., ('admin', user_uuid)
+        :param compute: function of no arguments that answers the question from the database
+        :return: the answer
+
+        Without memoize, this simply calls compute. Exceptions are not remembered.
+        """
+        if self.__memo is None:
+            return compute()
+        if key not in self.__memo:
+            self.__memo[key] = compute()
+        return self.__memo[key]
+
+    def __coalesced(self, key, compute):
+        """
+        PRIVATE: answer a privilege question, waiting for other sessions asking it at the same time
+
+        :type key: tuple
+        :param key: the question, e.g., ('privilege', resource_id, user_id)
+        :param compute: function of no arguments that answers the question from the database
+        :return: the answer
+
+        Questions are shared only between sessions reading the same database. Questions asked
+        while making a change are not shared, since the change may not be committed yet.
+        """
+        dsn = getattr(self.__cur.connection, 'dsn', None)
+        if self.__writing or dsn is None:
+            return compute()
+        return _single_flight((dsn,) + key, compute)
 
     ###########################################################
     # user handling
     ###########################################################
     # 'hs register user' for our own use.
+    @__writes
     def assert_user(self, user_login, user_name,  user_active=True, user_admin=False, user_uuid=None):
         """
         Register or update the registration of a user
@@ -242,9 +2048,14 @@ class HSAccessCore(object):
 
         This routine is not subject to access control restrictions.
         """
-        self.__cur.execute("""insert into users values (DEFAULT, %s, %s, %s, %s, %s, %s, DEFAULT)""",
+        self.__cur.execute("""insert into users (user_uuid, user_login, user_name, user_active, user_admin, assertion_user_id)
+                              values (%s, %s, %s, %s, %s, %s)
+                              returning user_id""",
                            (user_uuid, user_login, user_name, user_active, user_admin, assertion_user_id))
-        self.__conn.commit()
+        user_id = self.__cur.fetchone()['user_id']
+        self.__audit('assert_user', user_id=user_id, detail=user_uuid,
+                     flags=self.__get_audit_flags(active=user_active, admin=user_admin))
+        self.__commit()
 
     # this is the general idea but can be cleaned up with conditional code.
     def __assert_user_update(self, assertion_user_id, user_uuid, user_login, user_name,
@@ -272,14 +2083,19 @@ class HSAccessCore(object):
         """
         self.__cur.execute("""update users set user_login =%s, user_name=%s, user_active=%s, user_admin=%s,
                               assertion_user_id=%s, assertion_time=CURRENT_TIMESTAMP
-                              where user_uuid=%s""",
+                              where user_uuid=%s
+                              returning user_id""",
                            (user_login, user_name, user_active, user_admin, assertion_user_id, user_uuid))
-        self.__conn.commit()
+        user_id = self.__cur.fetchone()['user_id']
+        self.__audit('assert_user', user_id=user_id, detail=user_uuid,
+                     flags=self.__get_audit_flags(active=user_active, admin=user_admin))
+        self.__commit()
 
     ###########################################################
     # user state
     ###########################################################
     # test whether a login exists without recovering its id or metadata
+    @__reads
     def user_exists(self, user_uuid=None):
         """
         Determine whether a login name is registered in the HSAccess database
@@ -303,6 +2119,7 @@ class HSAccessCore(object):
             return False
 
     # test whether a user login has administrative privileges
+    @__reads
     def user_is_admin(self, user_uuid=None):
         """
         Determine whether a user identified by uuid has admin privileges
@@ -323,10 +2140,10 @@ class HSAccessCore(object):
             user_uuid = self.get_uuid()
         if not isinstance(user_uuid, basestring):
             raise HSAUsageException("user_uuid is not a unicode or str")
-        meta = self.get_user_metadata(user_uuid)
-        return meta['admin']
+        return self.__memoized(('admin', user_uuid), lambda: self.get_user_metadata(user_uuid)['admin'])
 
     # test whether a user login is entitled to make changes
+    @__reads
     def user_is_active(self, user_uuid=None):
         """
         Determine whether a user uuid is an active user
@@ -346,8 +2163,7 @@ class HSAccessCore(object):
             user_uuid = self.get_uuid()
         if not isinstance(user_uuid, basestring):
             raise HSAUsageException("user_uuid is not a unicode or str")
-        meta = self.get_user_metadata(user_uuid)
-        return meta['active']
+        return self.__memoized(('active', user_uuid), lambda: self.get_user_metadata(user_uuid)['active'])
 
     ###########################################################
     # user system metadata
@@ -363,7 +2179,7 @@ class HSAccessCore(object):
         :return: integer user id
         :rtype: int
         """
-        self.__cur.execute("select user_id from users where user_login=%s", (login,))
+        self.__execute_prepared('user_id_from_login', (login,))
         if self.__cur.rowcount > 1:
             raise HSAIntegrityException("More than one record for a specific user login")
         if self.__cur.rowcount > 0:
@@ -389,7 +2205,10 @@ class HSAccessCore(object):
             user_uuid = self.get_uuid()
         if not isinstance(user_uuid, basestring):
             raise HSAUsageException("user_uuid is not a unicode or str")
-        self.__cur.execute("select user_id from users where user_uuid=%s", (user_uuid,))
+        # the current user was looked up when the session started, and users are never deleted
+        if user_uuid == self.__user_uuid:
+            return self.__user_id
+        self.__execute_prepared('user_id_from_uuid', (user_uuid,))
         if self.__cur.rowcount > 1:
             raise HSAIntegrityException("More than one record for a specific user uuid")
         if self.__cur.rowcount > 0:
@@ -415,7 +2234,7 @@ class HSAccessCore(object):
             user_uuid = self.get_uuid()
         if not isinstance(user_uuid, basestring):
             raise HSAUsageException("user_uuid is not a unicode or str")
-        self.__cur.execute("select user_login from users where user_uuid=%s", (user_uuid,))
+        self.__execute_prepared('user_login_from_uuid', (user_uuid,))
         if self.__cur.rowcount > 1:
             raise HSAIntegrityException("More than one record for a specific user uuid")
         if self.__cur.rowcount > 0:
@@ -424,6 +2243,7 @@ class HSAccessCore(object):
             raise HSAUsageException("User uuid does not exist")
 
     # get a specific login uuid for use in requesting actions
+    @__reads
     def get_user_uuid_from_login(self, login):
         """
         PRIVATE: get user database id from login name
@@ -439,7 +2259,7 @@ class HSAccessCore(object):
         if not isinstance(login, basestring):
             raise HSAUsageException("login is not a string")
 
-        self.__cur.execute("select user_uuid from users where user_login=%s", (login,))
+        self.__execute_prepared('user_uuid_from_login', (login,))
         if self.__cur.rowcount > 1:
             raise HSAIntegrityException("More than one record for a specific user login")
         if self.__cur.rowcount > 0:
@@ -470,6 +2290,7 @@ class HSAccessCore(object):
     # CLI: hs_users
     ###########################################################
 
+    @__reads
     def get_users(self):
         """
         Get the registered user list
@@ -504,6 +2325,7 @@ class HSAccessCore(object):
             ]
         return result
 
+    @__reads
     def get_user_metadata(self, user_uuid=None):
         """
         Get metadata for a user as a dict record
@@ -539,6 +2361,7 @@ class HSAccessCore(object):
         else:
             raise HSAUsageException('User uuid does not exist')
 
+    @__writes
     def assert_user_metadata(self, metadata):
         """
         Assert changes in user metadata
@@ -572,6 +2395,7 @@ class HSAccessCore(object):
     ###########################################################
 
     # fetch a list of all group uuids
+    @__reads
     def get_groups(self):
         """
         Get information on all existing groups
@@ -600,6 +2424,7 @@ class HSAccessCore(object):
             result += [{'uuid': row['group_uuid'], 'name': row['group_name']}]
         return result
 
+    @__reads
     def get_groups_for_user(self, user_uuid=None):
         """
         Get a list of groups relevant to a specific user
@@ -634,6 +2459,7 @@ class HSAccessCore(object):
             result += [{'uuid': row['group_uuid'], 'name': row['group_name'], 'code': row['privilege_code']}]
         return result
 
+    @__reads
     def get_public_groups(self):
         """
         Get a list of groups relevant to a specific user
@@ -647,17 +2473,12 @@ class HSAccessCore(object):
                 'name': *name of group*, 
                 'uuid': *uuid of group* 
             }
+
+        The list is cached for all sessions in the process and rebuilt only when it changes.
         """
-        self.__cur.execute("""select g.group_uuid, g.group_name, 'ro' AS privilege_code
-                           from groups g
-                           where g.group_public=TRUE
-                           order by g.group_name, g.group_uuid""", ())
-        rows = self.__cur.fetchall()
-        result = []
-        for row in rows:
-            result += [{'uuid': row['group_uuid'], 'name': row['group_name'], 'code': row['privilege_code']}]
-        return result
+        return [dict(item) for item in self.__get_catalog('public_groups')['items']]
 
+    @__reads
     def get_discoverable_groups(self):
         """
         Get a list of groups that are discoverable
@@ -671,21 +2492,12 @@ class HSAccessCore(object):
                 'name': *name of group*, 
                 'uuid': *uuid of group* 
             }
+
+        The list is cached for all sessions in the process and rebuilt only when it changes.
         """
-        self.__cur.execute("""select g.group_uuid, g.group_name,
-                           CASE WHEN g.group_public THEN 'ro'
-                                ELSE 'none'
-                           END AS privilege_code
-                           from groups g
-                           where g.group_discoverable = TRUE
-                              OR g.group_public = TRUE
-                           order by g.group_name, g.group_uuid""")
-        rows = self.__cur.fetchall()
-        result = []
-        for row in rows:
-            result += [{'uuid': row['group_uuid'], 'name': row['group_name'], 'code': row['privilege_code']}]
-        return result
+        return [dict(item) for item in self.__get_catalog('discoverable_groups')['items']]
 
+    @__reads
     def get_group_members(self, group_uuid):
         """
         Get a list of members of a specific group
@@ -706,20 +2518,23 @@ class HSAccessCore(object):
         # THIS SHOULD HONOR group_public flags and user flags
         if not self.group_is_public(group_uuid) and not self.group_is_owned(group_uuid):
             raise HSAccessException("User must be owner or administrator")
+        # by id, so that the grouping in user_group_privilege is limited to this group
+        group_id = self.__get_group_id_from_uuid(group_uuid)
         self.__cur.execute("""select u.user_uuid, u.user_name, x.privilege_code
                               from groups g
                               left join user_group_privilege p on p.group_id=g.group_id
                               left join users u on u.user_id = p.user_id
                               left join privileges x on x.privilege_id=p.privilege_id
-                              where g.group_uuid=%s
+                              where g.group_id=%s
                               order by u.user_name, u.user_uuid""",
-                           (group_uuid,))
+                           (group_id,))
         rows = self.__cur.fetchall()
         result = []
         for row in rows:
             result += [{'uuid': row['user_uuid'], 'name': row['user_name'], 'code': row['privilege_code']}]
         return result
 
+    @__reads
     def get_group_metadata(self, group_uuid):
         """
         Get metadata for a group as a dict record
@@ -770,19 +2585,84 @@ class HSAccessCore(object):
         if self.__cur.rowcount > 1:
             raise HSAIntegrityException("More than one record for a specific group uuid")
         if self.__cur.rowcount > 0:
-            row = self.__cur.fetchone()
-            return {'uuid': row['group_uuid'],
-                    'name': row['group_name'],
-                    'active': row['group_active'],
-                    'shareable': row['group_shareable'],
-                    'discoverable': row['group_discoverable'],
-                    'public': row['group_public'],
-                    'asserting_login': row['user_assertion_login'],
-                    'asserting_uuid': row['user_assertion_uuid'],
-                    'assertion_time': row['assertion_time']}
+            return self.__group_metadata(self.__cur.fetchone())
         else:
             raise HSAUsageException("Group uuid does not exist")
 
+    @staticmethod
+    def __group_metadata(row):
+        """
+        PRIVATE: metadata of a group, as returned by get_group_metadata, from a row of groups
+        """
+        return {'uuid': row['group_uuid'],
+                'name': row['group_name'],
+                'active': row['group_active'],
+                'shareable': row['group_shareable'],
+                'discoverable': row['group_discoverable'],
+                'public': row['group_public'],
+                'asserting_login': row['user_assertion_login'],
+                'asserting_uuid': row['user_assertion_uuid'],
+                'assertion_time': row['assertion_time']}
+
+    @__reads
+    def get_group_summaries(self, group_uuids):
+        """
+        Get metadata for several groups, with the privilege of the current user over each
+
+        :type group_uuids: list[basestring]
+        :param group_uuids: uuids of groups
+        :return: dict from the uuid of each group to its summary
+        :rtype: dict[str, dict]
+
+        Each summary is a dictionary record with the structure::
+
+            {
+                'metadata': *metadata of group, as returned by get_group_metadata*,
+                'privilege': *as returned by get_cumulative_user_privilege_over_group*,
+                'user_privilege': *as returned by get_user_privilege_over_group*,
+                'member': *as returned by user_is_in_group*
+            }
+
+        This asks one query for all of the groups, rather than a few for each, so that a list of
+        groups is made into objects with the same number of queries however long it is.
+        """
+        group_uuids = list(group_uuids)
+        for group_uuid in group_uuids:
+            if not isinstance(group_uuid, basestring):
+                raise HSAUsageException("group_uuid is not a unicode or str")
+        if not group_uuids:
+            return {}
+        user_id = self.__get_user_id_from_uuid(self.get_uuid())
+        self.__cur.execute("""select g.group_uuid, g.group_name,
+          g.group_active, g.group_shareable, g.group_discoverable, g.group_public,
+          a.user_login as user_assertion_login, a.user_uuid as user_assertion_uuid, g.assertion_time,
+          c.privilege_id as cumulative_privilege_id, p.privilege_id as user_privilege_id
+          from groups g left join users a on g.assertion_user_id = a.user_id
+          left join cumulative_user_group_privilege c on c.group_id = g.group_id and c.user_id = %s
+          left join user_group_privilege p on p.group_id = g.group_id and p.user_id = %s
+          where """ + self.__backend.in_list('g.group_uuid'),
+                           (user_id, user_id, self.__backend.list_argument(group_uuids)))
+        result = {}
+        for row in self.__cur.fetchall():
+            if row['group_uuid'] in result:
+                raise HSAIntegrityException("More than one record for a specific group uuid")
+            # as in __get_cumulative_user_privilege_over_group and __get_user_privilege_over_group
+            if row['cumulative_privilege_id'] is not None:
+                pnum = row['cumulative_privilege_id']
+            elif row['group_public']:
+                pnum = self.__PRIVILEGE_RO
+            else:
+                pnum = self.__PRIVILEGE_NONE
+            unum = row['cumulative_privilege_id'] or self.__PRIVILEGE_NONE
+            result[row['group_uuid']] = {'metadata': self.__group_metadata(row),
+                                         'privilege': self.__PRIVILEGE_CODES[pnum-1],
+                                         'user_privilege': self.__PRIVILEGE_CODES[unum-1],
+                                         'member': row['user_privilege_id'] is not None}
+        if len(result) < len(set(group_uuids)):
+            raise HSAUsageException("Group uuid does not exist")
+        return result
+
+    @__writes
     def assert_group_metadata(self, metadata):
         """
         Assert changes in user metadata
@@ -817,7 +2697,7 @@ class HSAccessCore(object):
         """
         if not isinstance(group_uuid, basestring):
             raise HSAUsageException("group_uuid is not a unicode or str")
-        self.__cur.execute("select group_id from groups where group_uuid=%s", (group_uuid,))
+        self.__execute_prepared('group_id_from_uuid', (group_uuid,))
         if self.__cur.rowcount > 1:
             raise HSAIntegrityException("More than one record for a specific group uuid")
         if self.__cur.rowcount > 0:
@@ -845,6 +2725,7 @@ class HSAccessCore(object):
 
     # this is a no-frills assert user without object use
     # CLI: hs create group and hs modify group
+    @__writes
     def assert_group(self, group_name,
                      group_active=True, group_shareable=True, group_discoverable=True, group_public=True,
                      group_uuid=None, user_uuid=None):
@@ -966,10 +2847,17 @@ class HSAccessCore(object):
         2. An exception is raised if the group uuid already exists.
 
         """
-        self.__cur.execute("""insert into groups values (DEFAULT, %s, %s, %s, %s, %s, %s, %s, DEFAULT)""",
+        self.__cur.execute("""insert into groups (group_uuid, group_name, group_active, group_shareable,
+                                                  group_discoverable, group_public, assertion_user_id)
+                              values (%s, %s, %s, %s, %s, %s, %s)
+                              returning group_id""",
                            (group_uuid, group_name, group_active,
                             group_shareable, group_discoverable, group_public, assertion_user_id))
-        self.__conn.commit()
+        group_id = self.__cur.fetchone()['group_id']
+        self.__audit('assert_group', group_id=group_id, detail=group_uuid,
+                     flags=self.__get_audit_flags(active=group_active, shareable=group_shareable,
+                                                  discoverable=group_discoverable, public=group_public))
+        self.__commit()
 
     def __assert_group_update(self, assertion_user_id, group_uuid, group_name,
                               group_active, group_shareable, group_discoverable, group_public):
@@ -1000,15 +2888,21 @@ class HSAccessCore(object):
                               group_public=%s,
                               assertion_user_id=%s,
                               assertion_time=CURRENT_TIMESTAMP
-                              where group_uuid=%s""",
+                              where group_uuid=%s
+                              returning group_id""",
                            (group_name, group_active, group_shareable,
                             group_discoverable, group_public,
                             assertion_user_id, group_uuid))
-        self.__conn.commit()
+        group_id = self.__cur.fetchone()['group_id']
+        self.__audit('assert_group', group_id=group_id, detail=group_uuid,
+                     flags=self.__get_audit_flags(active=group_active, shareable=group_shareable,
+                                                  discoverable=group_discoverable, public=group_public))
+        self.__commit()
 
     # CLI: hs_delete_group
     # unsure whether this should be a possibility;
     # consider deactivate_group instead.
+    @__writes
     def retract_group(self, group_uuid):
         """
         Delete a group and all membership information
@@ -1033,16 +2927,17 @@ class HSAccessCore(object):
                 and not self.group_is_owned(group_uuid, self.get_uuid()):
             raise HSAccessException("Regular user must own group")
         group_id = self.__get_group_id_from_uuid(group_uuid)
-        self.__cur.execute("""delete from user_access_to_group where group_id=%s""", (group_id,))
-        # user_membership_in_group is now a view
-        # self.__cur.execute("""delete from user_membership_in_group where group_id=%s""", (group_id,))
+        # user_access_to_group records are removed by cascade logic.
+        # Deleting them first would leave the group without owners, which the database rejects.
         self.__cur.execute("""delete from groups where group_id=%s""", (group_id,))
-        self.__conn.commit()
+        self.__audit('retract_group', group_id=group_id, detail=group_uuid)
+        self.__commit()
 
     ###########################################################
     # group state
     ###########################################################
     # test whether a group exists without retrieving its metadata
+    @__reads
     def group_exists(self, group_uuid):
         """
         Determine whether group identifier (uuid) is registered
@@ -1063,6 +2958,7 @@ class HSAccessCore(object):
         except HSAUsageException:
             return False
 
+    @__reads
     def group_is_active(self, group_uuid):
         """
         True if a group is active
@@ -1077,6 +2973,7 @@ class HSAccessCore(object):
         meta = self.get_group_metadata(group_uuid)
         return meta['active']
 
+    @__reads
     def group_is_shareable(self, group_uuid):
         """
         True if a group is shareable
@@ -1093,6 +2990,7 @@ class HSAccessCore(object):
         meta = self.get_group_metadata(group_uuid)
         return meta['shareable']
 
+    @__reads
     def group_is_discoverable(self, group_uuid):
         """
         True if a group is discoverable
@@ -1109,6 +3007,7 @@ class HSAccessCore(object):
         meta = self.get_group_metadata(group_uuid)
         return meta['discoverable']  # or meta['public']
 
+    @__reads
     def group_is_public(self, group_uuid):
         """
         True if a group is public
@@ -1145,7 +3044,7 @@ class HSAccessCore(object):
         """
         if not isinstance(resource_uuid, basestring):
             raise HSAUsageException("resource_uuid is not a unicode or str")
-        self.__cur.execute("select resource_id from resources where resource_uuid=%s", (resource_uuid,))
+        self.__execute_prepared('resource_id_from_uuid', (resource_uuid,))
         if self.__cur.rowcount > 1:
             raise HSAIntegrityException("More than one record for a specific resource uuid")
         if self.__cur.rowcount > 0:
@@ -1175,6 +3074,7 @@ class HSAccessCore(object):
         else:
             raise HSAUsageException("Resource path does not exist")
 
+    @__reads
     def get_resource_metadata(self, resource_uuid):
         """
         Get metadata for a resource as a dict record
@@ -1233,28 +3133,97 @@ class HSAccessCore(object):
           r.resource_shareable,
           a.user_login as user_assertion_login,
           a.user_uuid as user_assertion_uuid,
-          r.assertion_time
+          r.assertion_time
+          from resources r left join users a on r.assertion_user_id = a.user_id
+          where r.resource_uuid=%s""", (resource_uuid,))
+        if self.__cur.rowcount > 1:
+            raise HSAIntegrityException("Database integrity violation: "
+                                        + "more than one record for a specific resource uuid")
+        if self.__cur.rowcount > 0:
+            return self.__resource_metadata(self.__cur.fetchone())
+        else:
+            raise HSAUsageException("Resource uuid does not exist")
+
+    @staticmethod
+    def __resource_metadata(row):
+        """
+        PRIVATE: metadata of a resource, as returned by get_resource_metadata, from a row of resources
+        """
+        return {'title': row['resource_title'],
+                'uuid':  row['resource_uuid'],
+                'path': row['resource_path'],
+                'discoverable': row['resource_discoverable'],
+                'public': row['resource_public'],
+                'immutable': row['resource_immutable'],
+                'published': row['resource_published'],
+                'shareable': row['resource_shareable'],
+                'asserting_login': row['user_assertion_login'],
+                'asserting_uuid': row['user_assertion_uuid'],
+                'assertion_time': row['assertion_time']}
+
+    @__reads
+    def get_resource_summaries(self, resource_uuids):
+        """
+        Get metadata for several resources, with the privilege of the current user over each
+
+        :type resource_uuids: list[basestring]
+        :param resource_uuids: uuids of resources
+        :return: dict from the uuid of each resource to its summary
+        :rtype: dict[str, dict]
+
+        Each summary is a dictionary record with the structure::
+
+            {
+                'metadata': *metadata of resource, as returned by get_resource_metadata*,
+                'privilege': *as returned by get_cumulative_user_privilege_over_resource*,
+                'user_privilege': *as returned by get_user_privilege_over_resource*
+            }
+
+        This asks one query for all of the resources, rather than a few for each, so that a list of
+        resources is made into objects with the same number of queries however long it is.
+        """
+        resource_uuids = list(resource_uuids)
+        for resource_uuid in resource_uuids:
+            if not isinstance(resource_uuid, basestring):
+                raise HSAUsageException("resource_uuid is not a unicode or str")
+        if not resource_uuids:
+            return {}
+        user_id = self.__get_user_id_from_uuid(self.get_uuid())
+        self.__cur.execute("""select r.resource_uuid, r.resource_path,
+          r.resource_title, r.resource_immutable, r.resource_published,
+          r.resource_discoverable, r.resource_public,
+          r.resource_shareable,
+          a.user_login as user_assertion_login,
+          a.user_uuid as user_assertion_uuid,
+          r.assertion_time,
+          c.privilege_id as cumulative_privilege_id, p.privilege_id as user_privilege_id
           from resources r left join users a on r.assertion_user_id = a.user_id
-          where r.resource_uuid=%s""", (resource_uuid,))
-        if self.__cur.rowcount > 1:
-            raise HSAIntegrityException("Database integrity violation: "
-                                        + "more than one record for a specific resource uuid")
-        if self.__cur.rowcount > 0:
-            row = self.__cur.fetchone()
-            return {'title': row['resource_title'],
-                    'uuid':  row['resource_uuid'],
-                    'path': row['resource_path'],
-                    'discoverable': row['resource_discoverable'],
-                    'public': row['resource_public'],
-                    'immutable': row['resource_immutable'],
-                    'published': row['resource_published'],
-                    'shareable': row['resource_shareable'],
-                    'asserting_login': row['user_assertion_login'],
-                    'asserting_uuid': row['user_assertion_uuid'],
-                    'assertion_time': row['assertion_time']}
-        else:
+          left join cumulative_user_resource_privilege c on c.resource_id = r.resource_id and c.user_id = %s
+          left join user_resource_privilege p on p.resource_id = r.resource_id and p.user_id = %s
+          where """ + self.__backend.in_list('r.resource_uuid'),
+                           (user_id, user_id, self.__backend.list_argument(resource_uuids)))
+        result = {}
+        for row in self.__cur.fetchall():
+            if row['resource_uuid'] in result:
+                raise HSAIntegrityException("Database integrity violation: "
+                                            + "more than one record for a specific user/resource pair")
+            # as in __fetch_cumulative_user_privilege_over_resource_by_id and
+            # __fetch_user_privilege_over_resource_by_id
+            if row['cumulative_privilege_id'] is not None:
+                pnum = row['cumulative_privilege_id']
+            elif row['resource_public']:
+                pnum = self.__PRIVILEGE_RO
+            else:
+                pnum = self.__PRIVILEGE_NONE
+            unum = row['user_privilege_id'] or self.__PRIVILEGE_NONE
+            result[row['resource_uuid']] = {'metadata': self.__resource_metadata(row),
+                                            'privilege': self.__PRIVILEGE_CODES[pnum-1],
+                                            'user_privilege': self.__PRIVILEGE_CODES[unum-1]}
+        if len(result) < len(set(resource_uuids)):
             raise HSAUsageException("Resource uuid does not exist")
+        return result
 
+    @__writes
     def assert_resource_metadata(self, metadata):
         """
         Assert changes in resource metadata
@@ -1276,6 +3245,7 @@ class HSAccessCore(object):
     # CLI: currently this can only be done properly through django
     # but we need a debugging command "hs register path" for our own use
 
+    @__writes
     def assert_resource(self, resource_path, resource_title,
                         resource_uuid=None, user_uuid=None,
                         resource_immutable=False, resource_published=False,
@@ -1452,12 +3422,22 @@ class HSAccessCore(object):
 
         Note: this routine is not subject to access control restrictions.
         """
-        self.__cur.execute("""insert into resources values (DEFAULT, %s, %s, %s, %s, %s, %s, %s, %s, %s, DEFAULT)""",
+        self.__cur.execute("""insert into resources (resource_uuid, resource_path, resource_title,
+                                                     resource_immutable, resource_published,
+                                                     resource_discoverable, resource_public,
+                                                     resource_shareable, assertion_user_id)
+                              values (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                              returning resource_id""",
                            (resource_uuid, resource_path, resource_title,
                             resource_immutable, resource_published,
                             resource_discoverable, resource_public,
                             resource_shareable, requesting_user_id))
-        self.__conn.commit()
+        resource_id = self.__cur.fetchone()['resource_id']
+        self.__audit('assert_resource', resource_id=resource_id, detail=resource_uuid,
+                     flags=self.__get_audit_flags(shareable=resource_shareable,
+                                                  discoverable=resource_discoverable, public=resource_public,
+                                                  immutable=resource_immutable, published=resource_published))
+        self.__commit()
 
     # subfunction: update a resource whose uuid is known
     def __assert_resource_update(self, requesting_user_id, resource_uuid,
@@ -1501,18 +3481,25 @@ class HSAccessCore(object):
                               resource_discoverable=%s, resource_public=%s,
                               resource_shareable=%s,
                               assertion_user_id=%s, assertion_time=CURRENT_TIMESTAMP
-                              where resource_uuid=%s""",
+                              where resource_uuid=%s
+                              returning resource_id""",
                            (resource_path, resource_title,
                             resource_immutable, resource_published,
                             resource_discoverable, resource_public,
                             resource_shareable,
                             requesting_user_id, resource_uuid))
-        self.__conn.commit()
+        resource_id = self.__cur.fetchone()['resource_id']
+        self.__audit('assert_resource', resource_id=resource_id, detail=resource_uuid,
+                     flags=self.__get_audit_flags(shareable=resource_shareable,
+                                                  discoverable=resource_discoverable, public=resource_public,
+                                                  immutable=resource_immutable, published=resource_published))
+        self.__commit()
 
     # CLI: hs delete resource
     # unsure whether this should be a possibility;
     # consider deactivate_group instead.
 
+    @__writes
     def retract_resource(self, resource_uuid):
         """
         Delete a resource and all privilege information
@@ -1541,11 +3528,13 @@ class HSAccessCore(object):
         # self.__cur.execute("""delete from user_access_to_resource where group_id=%s""", (group_id,))
 
         self.__cur.execute("""delete from resources where resource_id=%s""", (resource_id,))
-        self.__conn.commit()
+        self.__audit('retract_resource', resource_id=resource_id, detail=resource_uuid)
+        self.__commit()
 
     ###########################################################
     # resource state
     ###########################################################
+    @__reads
     def resource_exists(self, resource_uuid):
         """
         Determine whether a resource is registered in the database
@@ -1566,6 +3555,7 @@ class HSAccessCore(object):
         except HSAUsageException:
             return False
 
+    @__reads
     def resource_is_immutable(self, resource_uuid):
         """
         Whether resource is flagged as immutable
@@ -1593,6 +3583,7 @@ class HSAccessCore(object):
         meta = self.get_resource_metadata(resource_uuid)
         return meta['immutable']  # or meta['published']
 
+    @__reads
     def resource_is_published(self, resource_uuid):
         """
         Whether resource is flagged as published
@@ -1608,6 +3599,7 @@ class HSAccessCore(object):
         meta = self.get_resource_metadata(resource_uuid)
         return meta['published']
 
+    @__reads
     def resource_is_discoverable(self, resource_uuid):
         """
         Whether resource is flagged as discoverable
@@ -1622,6 +3614,7 @@ class HSAccessCore(object):
         meta = self.get_resource_metadata(resource_uuid)
         return meta['discoverable']  # or meta['public']
 
+    @__reads
     def resource_is_public(self, resource_uuid):
         """
         Whether resource is flagged as public
@@ -1634,6 +3627,7 @@ class HSAccessCore(object):
         meta = self.get_resource_metadata(resource_uuid)
         return meta['public']
 
+    @__reads
     def resource_is_shareable(self, resource_uuid):
         """
         Whether resource is flagged as shareable
@@ -1693,15 +3687,12 @@ class HSAccessCore(object):
         2. no sharing for a group
 
         Thus, one may not assert these states.
+
+        The privileges table is fixed by the schema, so this does not consult the database.
         """
-        self.__cur.execute("select privilege_id from privileges where privilege_code=%s", (code,))
-        if self.__cur.rowcount > 1:
-            raise HSAIntegrityException("Database integrity violation: "
-                                        + "more than one record for a specific privilege code")
-        if self.__cur.rowcount > 0:
-            return self.__cur.fetchone()['privilege_id']
-        else:
-            raise HSAUsageException("Privilege code '" + code + "' does not exist")
+        if code in self.__PRIVILEGE_CODES:
+            return self.__PRIVILEGE_CODES.index(code) + 1
+        raise HSAUsageException("Privilege code '" + code + "' does not exist")
 
     ###########################################################
     # I am forced to choose between two alternatives, neither of which is desirable.
@@ -1718,6 +3709,7 @@ class HSAccessCore(object):
     # primitive resource privilege interface does not include the resource-local
     # flags that override user flags for data access. Thus it is a lower-level interface.
     ###########################################################
+    @__reads
     def get_user_privilege_over_resource(self, resource_uuid):
         """
         Get privilege code for user over a resource
@@ -1778,9 +3770,13 @@ class HSAccessCore(object):
         return self.__get_user_privilege_over_resource_by_id(resource_id, user_id)
 
     def __get_user_privilege_over_resource_by_id(self, resource_id, user_id):
-        self.__cur.execute("""select user_id, resource_id, privilege_id from user_resource_privilege
-                              where user_id=%s and resource_id=%s""",
-                           (user_id, resource_id))
+        _trace_decision(user_id, resource_id)
+        key = ('privilege', resource_id, user_id)
+        return self.__memoized(key, lambda: self.__coalesced(
+            key, lambda: self.__fetch_user_privilege_over_resource_by_id(resource_id, user_id)))
+
+    def __fetch_user_privilege_over_resource_by_id(self, resource_id, user_id):
+        self.__execute_prepared('user_privilege_over_resource', (user_id, resource_id))
         if self.__cur.rowcount > 1:
             raise HSAIntegrityException("Database integrity violation: "
                                         + "more than one record for a specific user/resource pair")
@@ -1799,6 +3795,7 @@ class HSAccessCore(object):
     # flags that override user flags for data access.
     ###########################################################
 
+    @__reads
     def get_cumulative_user_privilege_over_resource(self, resource_uuid, user_uuid=None):
         """
         Get privilege code for user over a resource
@@ -1873,14 +3870,20 @@ class HSAccessCore(object):
         """
         user_id = self.__get_user_id_from_uuid(user_uuid)
         resource_id = self.__get_resource_id_from_uuid(resource_uuid)
+        _trace_decision(user_id, resource_id)
+        key = ('cumulative', resource_id, user_id)
+        return self.__memoized(key, lambda: self.__coalesced(
+            key, lambda: self.__fetch_cumulative_user_privilege_over_resource_by_id(
+                resource_id, user_id, resource_uuid)))
 
+    def __fetch_cumulative_user_privilege_over_resource_by_id(self, resource_id, user_id, resource_uuid):
         # This is the query that determines cumulative privilege for a resource. It returns
         # 1 for owner
         # 2 for read/write
         # 3 for read-only
-        self.__cur.execute("""select user_id, resource_id, privilege_id from cumulative_user_resource_privilege
-                              where user_id=%s and resource_id=%s""",
-                           (user_id, resource_id))
+        if self.__denial_filter is not None and not self.__denial_filter.may_hold(user_id, resource_id):
+            return self.__PRIVILEGE_NONE
+        self.__execute_prepared('cumulative_user_privilege_over_resource', (user_id, resource_id))
         if self.__cur.rowcount > 1:
             raise HSAIntegrityException("Database integrity violation: "
                                         + "more than one record for a specific user/resource pair")
@@ -1971,15 +3974,11 @@ class HSAccessCore(object):
         resource_is_readwrite, resource_is_readonly.
         """
         privilege_id = self.__get_privilege_id_from_code(code)
+        # cumulative privilege already makes public resources readable
         actual_priv = self.__get_cumulative_user_privilege_over_resource(resource_uuid, user_uuid)
-        if actual_priv <= privilege_id:
-            return True
-        else:
-            if privilege_id == 3 and self.resource_is_public(resource_uuid):
-                return True
-            else:
-                return False
+        return actual_priv <= privilege_id
 
+    @__reads
     def resource_is_owned(self, resource_uuid, user_uuid=None):
         """
         Check whether a given resource is owned by a specific user
@@ -2005,6 +4004,7 @@ class HSAccessCore(object):
 
         return self.__resource_accessible(user_uuid, resource_uuid, 'own')
 
+    @__reads
     def resource_is_readwrite(self, resource_uuid, user_uuid=None):
         """
         Check whether a given resource is read/write to a specific user
@@ -2027,6 +4027,7 @@ class HSAccessCore(object):
 
         return self.__resource_cumulatively_accessible(user_uuid, resource_uuid, 'rw')
 
+    @__reads
     def resource_is_readable(self, resource_uuid, user_uuid=None):
         """
         Check whether a given resource is readable by a specific user
@@ -2061,6 +4062,7 @@ class HSAccessCore(object):
     # The sharing privileges for a user are a logical OR of all granted sharing privileges from all sources
     ###########################################################
 
+    @__writes
     def share_resource_with_user(self, resource_uuid, user_uuid, privilege_code='ro'):
         """
         Share a specific resource with a specific user
@@ -2100,21 +4102,22 @@ class HSAccessCore(object):
 
         # access control logic: cannot grant sharing above own privilege
         if not self.user_is_admin(self.get_uuid()):
-            if not self.resource_is_owned(resource_uuid) and not self.resource_is_shareable(resource_uuid):
+            # use join to access privilege records; this also decides ownership
+            user_priv = self.__get_user_privilege_over_resource_by_id(resource_id, requesting_id)
+            if user_priv > self.__PRIVILEGE_OWN and not self.resource_is_shareable(resource_uuid):
                 raise HSAccessException("Resource is not shareable by non-owners")
-            # use join to access privilege records
-            user_priv = self.__get_user_privilege_over_resource(resource_uuid)
             if user_priv > self.__PRIVILEGE_RO:
                 raise HSAccessException("User has no privilege over resource")
             if user_priv > privilege_id:
                 raise HSAccessException("User has insufficient privilege over resource")
             if user_uuid == self.get_uuid():
-                if self.resource_is_owned(resource_uuid):
-                    if self.get_number_of_resource_owners(resource_uuid) == 1:
-                        raise HSAccessException("Cannot remove last owner of resource")
+                self.__share_resource_with_user(requesting_id, user_id, resource_id, privilege_id,
+                                                "Cannot remove last owner of resource")
+                return
         self.__share_resource_with_user(requesting_id, user_id, resource_id, privilege_id)
 
-    def __share_resource_with_user(self, requesting_id, user_id, resource_id, privilege_id):
+    def __share_resource_with_user(self, requesting_id, user_id, resource_id, privilege_id,
+                                   last_owner_message="Cannot remove last resource owner, including self"):
         """
         Share a resource with a user at a given privilege level.
 
@@ -2122,22 +4125,23 @@ class HSAccessCore(object):
         :type user_id: int
         :type resource_id: int
         :type privilege_id: int
+        :type last_owner_message: basestring
         :param requesting_id: id of requesting user
         :param user_id: user id of user to which to grant privilege
         :param resource_id: resource id to which to grant privilege
         :param privilege_id: privilege to grant
+        :param last_owner_message: explanation to give if this would leave the resource without an owner
 
+        The database refuses to remove the last owner of a resource (see __check_last_owner).
         """
         #  sufficient privileges present to share this resource
-        if self.__user_access_to_resource_exists(user_id, resource_id, requesting_id):
-            # don't let user remove last owner.
-            if self.__get_number_of_resource_owners_by_id(resource_id) > 1 \
-                    or self.__get_user_privilege_over_resource_by_id(resource_id, user_id) > 1:
+        try:
+            if self.__user_access_to_resource_exists(user_id, resource_id, requesting_id):
                 self.__share_resource_user_update(requesting_id, user_id, resource_id, privilege_id)
             else:
-                raise HSAccessException("Cannot remove last resource owner, including self")
-        else:
-            self.__share_resource_user_add(requesting_id, user_id, resource_id, privilege_id)
+                self.__share_resource_user_add(requesting_id, user_id, resource_id, privilege_id)
+        except self.__backend.Error as e:
+            self.__check_last_owner(e, last_owner_message)
 
     def __user_access_to_resource_exists(self, user_id, resource_id, asserting_user_id):
         """
@@ -2188,7 +4192,9 @@ class HSAccessCore(object):
                               assertion_time=CURRENT_TIMESTAMP
                               where user_id=%s and resource_id=%s and assertion_user_id=%s""",
                            (privilege_id, user_id, resource_id, requesting_id))
-        self.__conn.commit()
+        self.__audit('share_resource_with_user', user_id=user_id, resource_id=resource_id,
+                     privilege_id=privilege_id, assertion_user_id=requesting_id)
+        self.__commit()
 
     def __share_resource_user_add(self, requesting_id, user_id, resource_id, privilege_id):
         """
@@ -2208,10 +4214,14 @@ class HSAccessCore(object):
 
         Note: this routine is not subject to access control.
         """
-        self.__cur.execute("""insert into user_access_to_resource values (DEFAULT, %s, %s, %s, %s, DEFAULT)""",
+        self.__cur.execute("""insert into user_access_to_resource (user_id, resource_id, privilege_id, assertion_user_id)
+                              values (%s, %s, %s, %s)""",
                            (user_id, resource_id, privilege_id, requesting_id))
-        self.__conn.commit()
+        self.__audit('share_resource_with_user', user_id=user_id, resource_id=resource_id,
+                     privilege_id=privilege_id, assertion_user_id=requesting_id)
+        self.__commit()
 
+    @__writes
     def unshare_resource_with_user(self,  resource_uuid, user_uuid=None):
         """
         Remove all sharing with user (owner only)
@@ -2245,13 +4255,13 @@ class HSAccessCore(object):
         if self.user_is_admin(self.get_uuid()) \
                 or self.resource_is_owned(resource_uuid) \
                 or user_uuid == self.get_uuid():
-            if self.get_number_of_resource_owners(resource_uuid) > 1 \
-                    or not self.resource_is_owned(resource_uuid, user_uuid):
+            try:
                 self.__cur.execute("""delete from user_access_to_resource where user_id = %s and resource_id = %s""",
                                    (user_id, resource_id))
-                self.__conn.commit()
-            else:
-                raise HSAccessException("Cannot remove only resource owner, including self")
+            except self.__backend.Error as e:
+                self.__check_last_owner(e, "Cannot remove only resource owner, including self")
+            self.__audit('unshare_resource_with_user', user_id=user_id, resource_id=resource_id)
+            self.__commit()
         else:
             raise HSAccessException("Regular user must own resource")
 
@@ -2269,6 +4279,7 @@ class HSAccessCore(object):
     # - you are an administrator
     # ##########################################################
 
+    @__writes
     def share_resource_with_group(self, resource_uuid, group_uuid, privilege_code='ro'):
         """
         Share a resource with a group of users
@@ -2373,7 +4384,9 @@ class HSAccessCore(object):
                               assertion_time=CURRENT_TIMESTAMP where group_id=%s
                               and resource_id=%s and assertion_user_id=%s""",
                            (privilege_id, group_id, resource_id, requesting_id))
-        self.__conn.commit()
+        self.__audit('share_resource_with_group', group_id=group_id, resource_id=resource_id,
+                     privilege_id=privilege_id, assertion_user_id=requesting_id)
+        self.__commit()
 
     def __share_resource_group_add(self, requesting_id, group_id, resource_id, privilege_id):
         """
@@ -2392,10 +4405,14 @@ class HSAccessCore(object):
 
         The group sharing record must not exist or an exception is raised.
         """
-        self.__cur.execute("""insert into group_access_to_resource values (DEFAULT, %s, %s, %s, %s, DEFAULT)""",
+        self.__cur.execute("""insert into group_access_to_resource (group_id, resource_id, privilege_id, assertion_user_id)
+                              values (%s, %s, %s, %s)""",
                            (group_id, resource_id, privilege_id, requesting_id))
-        self.__conn.commit()
+        self.__audit('share_resource_with_group', group_id=group_id, resource_id=resource_id,
+                     privilege_id=privilege_id, assertion_user_id=requesting_id)
+        self.__commit()
 
+    @__writes
     def unshare_resource_with_group(self, resource_uuid, group_uuid):
         """
         Remove all sharing with user (owner or administrator only)
@@ -2419,7 +4436,8 @@ class HSAccessCore(object):
         if self.user_is_admin(self.get_uuid()) or self.group_is_owned(group_uuid):
             self.__cur.execute("""delete from group_access_to_resource where group_id = %s and resource_id=%s""",
                                (group_id, resource_id))
-            self.__conn.commit()
+            self.__audit('unshare_resource_with_group', group_id=group_id, resource_id=resource_id)
+            self.__commit()
         else:
             raise HSAccessException("Regular user must own group")
 
@@ -2427,6 +4445,7 @@ class HSAccessCore(object):
     # group membership
     ###########################################################
     # refactored to remove duplication between group privilege and membership
+    @__reads
     def user_is_in_group(self, group_uuid, user_uuid=None):
         """
         Check whether a user is a member of a group
@@ -2449,9 +4468,7 @@ class HSAccessCore(object):
             raise HSAUsageException("group_uuid is not a string")
         user_id = self.__get_user_id_from_uuid(user_uuid)
         group_id = self.__get_group_id_from_uuid(group_uuid)
-        self.__cur.execute("""select privilege_id from user_group_privilege
-                              where user_id=%s and group_id=%s""",
-                           (user_id, group_id))
+        self.__execute_prepared('user_privilege_over_group', (user_id, group_id))
         if self.__cur.rowcount > 1:
             raise HSAIntegrityException("More than one group membership record for a user and group")
         if self.__cur.rowcount > 0:
@@ -2531,7 +4548,7 @@ class HSAccessCore(object):
     #     if not (self.user_in_group(group_uuid, user_uuid)):
     #         self.__cur.execute("insert into user_membership_in_group VALUES (DEFAULT, %s, %s, %s, DEFAULT)",
     #                           (user_id, group_id, requesting_id))
-    #         self.__conn.commit()
+    #         self.__commit()
     #     # self.share_group_with_user(group_uuid, user_uuid, 'ro')
     #
     # # CLI: hs_remove_user_from_group
@@ -2565,6 +4582,7 @@ class HSAccessCore(object):
     # cumulative resource privilege interface includes group-local
     # flags that override user flags for data access.
     ###########################################################
+    @__reads
     def get_cumulative_user_privilege_over_group(self, group_uuid, user_uuid=None):
         """
         Get privilege code for user over a group
@@ -2608,6 +4626,7 @@ class HSAccessCore(object):
         else:
             raise HSAIntegrityException("Invalid privilege number")
 
+    @__reads
     def get_user_privilege_over_group(self, group_uuid, user_uuid=None):
         """
         Get privilege code for user over a group
@@ -2669,9 +4688,7 @@ class HSAccessCore(object):
         group_id = self.__get_group_id_from_uuid(group_uuid)
         # THIS IS THE QUERY THAT DETERMINES GROUP ACCESS
         # SAME CODES AS FOR USER PRIVILEGE
-        self.__cur.execute("""select privilege_id from cumulative_user_group_privilege
-                              where user_id=%s and group_id=%s""",
-                           (user_id, group_id))
+        self.__execute_prepared('cumulative_user_privilege_over_group', (user_id, group_id))
         if self.__cur.rowcount > 1:
             raise HSAIntegrityException("More than one user group privilege tuple for one granting user")
         if self.__cur.rowcount > 0:
@@ -2701,9 +4718,7 @@ class HSAccessCore(object):
         group_id = self.__get_group_id_from_uuid(group_uuid)
         # THIS IS THE QUERY THAT DETERMINES GROUP ACCESS
         # SAME CODES AS FOR USER PRIVILEGE
-        self.__cur.execute("""select privilege_id from cumulative_user_group_privilege
-                              where user_id=%s and group_id=%s""",
-                           (user_id, group_id))
+        self.__execute_prepared('cumulative_user_privilege_over_group', (user_id, group_id))
         if self.__cur.rowcount > 1:
             raise HSAIntegrityException("More than one user group privilege tuple for one granting user")
         if self.__cur.rowcount > 0:
@@ -2736,6 +4751,7 @@ class HSAccessCore(object):
                 return False
 
     # can remove group and disinvite group members.
+    @__reads
     def group_is_owned(self, group_uuid, user_uuid=None):
         """
         Check whether a group is owned by a user
@@ -2756,6 +4772,7 @@ class HSAccessCore(object):
         return self.__group_cumulatively_accessible(user_uuid, group_uuid, 'own')
 
     # can invite members to group
+    @__reads
     def group_is_readwrite(self, group_uuid, user_uuid=None):
         """
         Check whether a group is owned by a user
@@ -2776,6 +4793,7 @@ class HSAccessCore(object):
         return self.__group_cumulatively_accessible(user_uuid, group_uuid, 'rw')
 
     # minimal group membership: can see members but cannot add/invite them
+    @__reads
     def group_is_readable(self, group_uuid, user_uuid=None):
         """
         Check whether a group is readable by a user
@@ -2796,6 +4814,7 @@ class HSAccessCore(object):
         return self.__group_cumulatively_accessible(user_uuid, group_uuid, 'ro')
 
     # CLI: hs invite ....
+    @__writes
     def invite_user_to_group(self, group_uuid, user_uuid, privilege_code='ro'):
         """
         Invite a user into a group. The user must accept in a separate step.
@@ -2847,7 +4866,9 @@ class HSAccessCore(object):
                               where user_id=%s and group_id=%s
                                 and assertion_user_id=%s""",
                            (privilege_id, user_id, group_id, requesting_id))
-        self.__conn.commit()
+        self.__audit('invite_user_to_group', user_id=user_id, group_id=group_id,
+                     privilege_id=privilege_id, assertion_user_id=requesting_id)
+        self.__commit()
 
     def __invite_group_user_add(self, requesting_id, user_id, group_id, privilege_id):
         """
@@ -2862,9 +4883,12 @@ class HSAccessCore(object):
         :param group_id: int: id of group to be modified
         :param privilege_id: int: id of privilege to be installed
         """
-        self.__cur.execute("""insert into user_invitations_to_group values (DEFAULT, %s, %s, %s, %s, DEFAULT)""",
+        self.__cur.execute("""insert into user_invitations_to_group (user_id, group_id, privilege_id, assertion_user_id)
+                              values (%s, %s, %s, %s)""",
                            (user_id, group_id, privilege_id, requesting_id))
-        self.__conn.commit()
+        self.__audit('invite_user_to_group', user_id=user_id, group_id=group_id,
+                     privilege_id=privilege_id, assertion_user_id=requesting_id)
+        self.__commit()
 
     # determine whether an invitation exists already
     def __user_invite_to_group_exists(self, requesting_id, group_id, user_id):
@@ -2917,6 +4941,7 @@ class HSAccessCore(object):
 
     # a user can only revoke one's own invitations
     # CLI: hs uninvite ....
+    @__writes
     def uninvite_user_to_group(self, group_uuid, user_uuid):
         """
         Uninvite a user the current user invited; does not undo other invitations
@@ -2937,9 +4962,12 @@ class HSAccessCore(object):
             self.__cur.execute("""delete from user_invitations_to_group where user_id=%s
                                and group_id=%s and assertion_user_id=%s""",
                                (user_id, group_id, requesting_id))
-            self.__conn.commit()
+            self.__audit('uninvite_user_to_group', user_id=user_id, group_id=group_id,
+                         assertion_user_id=requesting_id)
+            self.__commit()
 
     # CLI hs ls invitations
+    @__reads
     def get_group_invitations_for_user(self, user_uuid=None):
         """
         Get a list of invitations to join groups that can be accepted or refused
@@ -2989,6 +5017,7 @@ class HSAccessCore(object):
         return result
 
     # CLI hs ls invitations
+    @__reads
     def get_group_invitations_sent_by_user(self, user_uuid=None):
         """
         Get a list of invitations to join groups that can be uninvited
@@ -3043,6 +5072,7 @@ class HSAccessCore(object):
         return result
 
     # CLI: hs accept ...
+    @__writes
     def accept_invitation_to_group(self, group_uuid, host_uuid):
         """
         Accept an invitation to join a group
@@ -3071,6 +5101,7 @@ class HSAccessCore(object):
             raise HSAccessException("No group invitation for user")
 
     # CLI: hs refuse
+    @__writes
     def refuse_invitation_to_group(self, group_uuid, host_uuid):
         """
         Refuse an invitation to join a group
@@ -3097,6 +5128,7 @@ class HSAccessCore(object):
     # resource sharing invitations
     #################################################
         # CLI: hs invite ....
+    @__writes
     def invite_user_to_resource(self, resource_uuid, user_uuid, privilege_code='ro'):
         """
         Invite a user into a resource. The user must accept in a separate step.
@@ -3151,7 +5183,9 @@ class HSAccessCore(object):
                               where user_id=%s and resource_id=%s
                                 and assertion_user_id=%s""",
                            (privilege_id, user_id, resource_id, requesting_id))
-        self.__conn.commit()
+        self.__audit('invite_user_to_resource', user_id=user_id, resource_id=resource_id,
+                     privilege_id=privilege_id, assertion_user_id=requesting_id)
+        self.__commit()
 
     def __invite_resource_user_add(self, requesting_id, user_id, resource_id, privilege_id):
         """
@@ -3166,9 +5200,12 @@ class HSAccessCore(object):
         :param resource_id: int: id of resource to be modified
         :param privilege_id: int: id of privilege to be installed
         """
-        self.__cur.execute("""insert into user_invitations_to_resource values (DEFAULT, %s, %s, %s, %s, DEFAULT)""",
+        self.__cur.execute("""insert into user_invitations_to_resource (user_id, resource_id, privilege_id, assertion_user_id)
+                              values (%s, %s, %s, %s)""",
                            (user_id, resource_id, privilege_id, requesting_id))
-        self.__conn.commit()
+        self.__audit('invite_user_to_resource', user_id=user_id, resource_id=resource_id,
+                     privilege_id=privilege_id, assertion_user_id=requesting_id)
+        self.__commit()
 
     # determine whether an invitation exists already
     def __user_invite_to_resource_exists(self, requesting_id, resource_id, user_id):
@@ -3221,6 +5258,7 @@ class HSAccessCore(object):
 
     # a user can only revoke one's own invitations
     # CLI: hs uninvite ....
+    @__writes
     def uninvite_user_to_resource(self, resource_uuid, user_uuid):
         """
         Uninvite a user the current user invited; does not undo other invitations
@@ -3244,9 +5282,12 @@ class HSAccessCore(object):
             self.__cur.execute("""delete from user_invitations_to_resource where user_id=%s
                               and resource_id=%s and assertion_user_id=%s""",
                                (user_id, resource_id, requesting_id))
-            self.__conn.commit()
+            self.__audit('uninvite_user_to_resource', user_id=user_id, resource_id=resource_id,
+                         assertion_user_id=requesting_id)
+            self.__commit()
 
     # CLI hs ls invitations
+    @__reads
     def get_resource_invitations_for_user(self, user_uuid=None):
         """
         Get a list of invitations to join resources that can be accepted or refused
@@ -3295,6 +5336,7 @@ class HSAccessCore(object):
         return result
 
     # CLI hs ls invitations
+    @__reads
     def get_resource_invitations_sent_by_user(self, user_uuid=None):
         """
         Get a list of invitations to join resources that can be uninvited
@@ -3328,7 +5370,7 @@ class HSAccessCore(object):
                               left join users u on u.user_id = i.user_id
                               left join users a on a.user_id = i.assertion_user_id
                               left join privileges p on p.privilege_id=i.privilege_id
-                              where i.assertion_user_id=%s
+                              where a.user_uuid=%s
                               order by i.assertion_time desc""",
                            (user_uuid,))
         rows = self.__cur.fetchall()
@@ -3343,6 +5385,7 @@ class HSAccessCore(object):
         return result
 
     # CLI: hs accept ...
+    @__writes
     def accept_invitation_to_resource(self, resource_uuid, host_uuid):
         """
         Accept an invitation to join a resource
@@ -3372,6 +5415,7 @@ class HSAccessCore(object):
             raise HSAccessException("No resource invitation for user")
 
     # CLI: hs refuse
+    @__writes
     def refuse_invitation_to_resource(self, resource_uuid, host_uuid):
         """
         Refuse an invitation to join a resource
@@ -3397,6 +5441,7 @@ class HSAccessCore(object):
 
     #  for now, couple group membership with group privilege
     # self.assert_user_in_group(group_uuid, user_uuid)
+    @__writes
     def share_group_with_user(self, group_uuid, user_uuid, privilege_code='ro'):
         """
         DEPRECATED: Attempt to share a group with a user: this allows read/write to the group membership list
@@ -3426,8 +5471,7 @@ class HSAccessCore(object):
         2. User is made a member of the group at the chosen level.
 
         This may be repeated without harm to downgrade or upgrade members one has previously invited.
-
-        :todo: not safe from removing last owner
+        The last owner of a group cannot be downgraded.
         """
         if not isinstance(user_uuid, basestring):
             raise HSAUsageException("user_uuid is not a string")
@@ -3449,11 +5493,10 @@ class HSAccessCore(object):
             if user_priv > privilege_id:
                 raise HSAccessException("User has insufficient privilege for group")
         if user_uuid == self.get_uuid():
-            if self.group_is_owned(group_uuid):
-                if self.get_number_of_group_owners(group_uuid) == 1:
-                    raise HSAccessException("Cannot remove last owner of group")
-
-        self.__share_group_with_user(requesting_id, user_id, group_id, privilege_id)
+            self.__share_group_with_user(requesting_id, user_id, group_id, privilege_id,
+                                         "Cannot remove last owner of group")
+        else:
+            self.__share_group_with_user(requesting_id, user_id, group_id, privilege_id)
         # for now, couple group membership with group privilege; the following is obsolete
         # self.assert_user_in_group(group_uuid, user_uuid)
 
@@ -3481,23 +5524,30 @@ class HSAccessCore(object):
         else:
             return False
 
-    def __share_group_with_user(self, requesting_id, user_id, group_id, privilege_id):
+    def __share_group_with_user(self, requesting_id, user_id, group_id, privilege_id,
+                                last_owner_message="Cannot remove last group owner, including self"):
         """
         PRIVATE: unpoliced share of group with user
 
         :type requesting_id: int
         :type user_id: int
         :type group_id: int
+        :type last_owner_message: basestring
         :param requesting_id: internal id of requesting user
         :param user_id: internal id of user to gain privilege
         :param group_id: internal id of group to which to grant privilege
+        :param last_owner_message: explanation to give if this would leave the group without an owner
 
         This is a helper routine for 'share_group_with_user'. It does not have access control.
+        The database refuses to remove the last owner of a group (see __check_last_owner).
         """
-        if self.__user_access_to_group_exists(requesting_id, user_id, group_id):
-            self.__share_group_user_update(requesting_id, user_id, group_id, privilege_id)
-        else:
-            self.__share_group_user_add(requesting_id, user_id, group_id, privilege_id)
+        try:
+            if self.__user_access_to_group_exists(requesting_id, user_id, group_id):
+                self.__share_group_user_update(requesting_id, user_id, group_id, privilege_id)
+            else:
+                self.__share_group_user_add(requesting_id, user_id, group_id, privilege_id)
+        except self.__backend.Error as e:
+            self.__check_last_owner(e, last_owner_message)
 
     def __share_group_user_update(self, requesting_id, user_id, group_id, privilege_id):
         """
@@ -3519,7 +5569,9 @@ class HSAccessCore(object):
                               assertion_time=CURRENT_TIMESTAMP
                               where user_id=%s and group_id=%s and assertion_user_id=%s""",
                            (privilege_id, user_id, group_id, requesting_id))
-        self.__conn.commit()
+        self.__audit('share_group_with_user', user_id=user_id, group_id=group_id,
+                     privilege_id=privilege_id, assertion_user_id=requesting_id)
+        self.__commit()
 
     def __share_group_user_add(self, requesting_id, user_id, group_id, privilege_id):
         """
@@ -3537,11 +5589,15 @@ class HSAccessCore(object):
         This is a helper routine for 'share_group_with_user'. It does not have access control.
         There must not already be a privilege record for the user, group, and current user.
         """
-        self.__cur.execute("""insert into user_access_to_group values (DEFAULT, %s, %s, %s, %s, DEFAULT)""",
+        self.__cur.execute("""insert into user_access_to_group (user_id, group_id, privilege_id, assertion_user_id)
+                              values (%s, %s, %s, %s)""",
                            (user_id, group_id, privilege_id, requesting_id))
-        self.__conn.commit()
+        self.__audit('share_group_with_user', user_id=user_id, group_id=group_id,
+                     privilege_id=privilege_id, assertion_user_id=requesting_id)
+        self.__commit()
 
     # CLI: hs group remove ...
+    @__writes
     def unshare_group_with_user(self, group_uuid, user_uuid=None):
         """
         Attempt to unshare a group with a user
@@ -3575,20 +5631,130 @@ class HSAccessCore(object):
         if self.user_is_admin(self.get_uuid()) \
                 or self.group_is_owned(group_uuid) \
                 or (user_uuid == self.get_uuid() and self.user_is_in_group(group_uuid, user_uuid)):
-            if self.get_number_of_group_owners(group_uuid) > 1 or not self.group_is_owned(group_uuid, user_uuid):
+            try:
                 self.__cur.execute("delete from user_access_to_group where group_id=%s and user_id=%s",
                                    (group_id, user_id))
-                self.__conn.commit()
-            else:
-                raise HSAccessException("Cannot remove last group owner, including self")
+            except self.__backend.Error as e:
+                self.__check_last_owner(e, "Cannot remove last group owner, including self")
+            self.__audit('unshare_group_with_user', user_id=user_id, group_id=group_id)
+            self.__commit()
             # self.retract_user_from_group(user_uuid, group_uuid)
         else:
             raise HSAccessException("Regular user must own group")
 
+    ###########################################################
+    # groups of groups
+    ###########################################################
+
+    @__writes
+    def share_group_with_group(self, group_uuid, member_group_uuid):
+        """
+        Make the members of one group members of another
+
+        :type group_uuid: basestring
+        :type member_group_uuid: basestring
+        :param group_uuid: group to contain the other
+        :param member_group_uuid: group whose members join group_uuid
+
+        Members of member_group_uuid, and of any groups it contains, gain the privileges over
+        resources that are shared with group_uuid or with any group that contains it. They do not
+        gain privilege over group_uuid itself, and are not listed among its members.
+        Membership cannot be circular.
+
+        Restrictions:
+
+        1. The current user must own group_uuid and be a member of member_group_uuid,
+           or be an administrator.
+        """
+        if not isinstance(group_uuid, basestring):
+            raise HSAUsageException("group_uuid is not a string")
+        if not isinstance(member_group_uuid, basestring):
+            raise HSAUsageException("member_group_uuid is not a string")
+        group_id = self.__get_group_id_from_uuid(group_uuid)
+        member_group_id = self.__get_group_id_from_uuid(member_group_uuid)
+        if not self.user_is_admin():
+            if not self.group_is_owned(group_uuid):
+                raise HSAccessException("Regular user must own group")
+            if not self.user_is_in_group(member_group_uuid):
+                raise HSAccessException("User is not a member of the group")
+        requesting_id = self.__get_user_id_from_uuid(self.get_uuid())
+        try:
+            self.__cur.execute("""insert into group_access_to_group (group_id, member_group_id, assertion_user_id)
+                                  select %s, %s, %s where not exists
+                                      (select 1 from group_access_to_group where group_id=%s and member_group_id=%s)""",
+                               (group_id, member_group_id, requesting_id, group_id, member_group_id))
+        except self.__backend.Error as e:
+            self.__conn.rollback()
+            if self.__backend.error_code(e) == self.__CIRCULAR_GROUP_SQLSTATE:
+                raise HSAUsageException("Group membership would be circular")
+            raise
+        self.__audit('share_group_with_group', group_id=group_id, member_group_id=member_group_id,
+                     assertion_user_id=requesting_id)
+        self.__commit()
+
+    @__writes
+    def unshare_group_with_group(self, group_uuid, member_group_uuid):
+        """
+        Remove a group from another group
+
+        :type group_uuid: basestring
+        :type member_group_uuid: basestring
+        :param group_uuid: group containing the other
+        :param member_group_uuid: group to remove
+
+        Restrictions:
+
+        1. The current user must own either group, or be an administrator.
+        """
+        if not isinstance(group_uuid, basestring):
+            raise HSAUsageException("group_uuid is not a string")
+        if not isinstance(member_group_uuid, basestring):
+            raise HSAUsageException("member_group_uuid is not a string")
+        group_id = self.__get_group_id_from_uuid(group_uuid)
+        member_group_id = self.__get_group_id_from_uuid(member_group_uuid)
+        if not self.user_is_admin() \
+                and not self.group_is_owned(group_uuid) \
+                and not self.group_is_owned(member_group_uuid):
+            raise HSAccessException("Regular user must own group")
+        self.__cur.execute("""delete from group_access_to_group where group_id=%s and member_group_id=%s""",
+                           (group_id, member_group_id))
+        if self.__cur.rowcount < 1:
+            raise HSAUsageException("Group is not a member of group")
+        self.__audit('unshare_group_with_group', group_id=group_id, member_group_id=member_group_id)
+        self.__commit()
+
+    @__reads
+    def get_member_groups(self, group_uuid):
+        """
+        List the groups that are members of a group
+
+        :type group_uuid: basestring
+        :param group_uuid: group of interest
+        :return: list of groups that are direct members, sorted by name
+        :rtype: list
+
+        Each group is reported as::
+
+            {
+                'uuid': *uuid of group*,
+                'name': *name of group*
+            }
+
+        Note: this is not subject to access control.
+        """
+        if not isinstance(group_uuid, basestring):
+            raise HSAUsageException("group_uuid is not a string")
+        group_id = self.__get_group_id_from_uuid(group_uuid)
+        self.__cur.execute("""select g.group_uuid, g.group_name from group_access_to_group a
+                              join groups g on g.group_id=a.member_group_id
+                              where a.group_id=%s order by g.group_name""", (group_id,))
+        return [{'uuid': row['group_uuid'], 'name': row['group_name']} for row in self.__cur.fetchall()]
+
     ###########################################################
     # faceted information retrieval
     ###########################################################
     # CLI: hs ls resources
+    @__reads
     def get_resources_held_by_user(self, user_uuid=None):
         """
         Make a list of resources held by user, sorted by title
@@ -3627,6 +5793,7 @@ class HSAccessCore(object):
                            'privilege': row['privilege_code']})
         return result
 
+    @__reads
     def get_users_holding_resource(self, resource_uuid):
         """
         Make a list of resources held by user, sorted by title
@@ -3664,6 +5831,106 @@ class HSAccessCore(object):
                            'privilege': row['privilege_code']})
         return result
 
+    def get_effective_readers(self, resource_uuid, min_privilege='ro'):
+        """
+        Find everyone who can access a resource at a given level, e.g., for notifications
+
+        :type resource_uuid: basestring
+        :type min_privilege: basestring
+        :param resource_uuid: uuid of resource
+        :param min_privilege: least privilege of interest: 'ro' (readers), 'rw' (writers), or 'own' (owners)
+        :return: dict describing who has access
+        :rtype: dict
+
+        This returns a dict of the form::
+
+            {
+                'public': *True if everyone has access, because the resource is public*,
+                'readers': *iterator over users with privilege, as below*
+            }
+
+        where each user is reported as::
+
+            {
+                'uuid': *uuid of user*,
+                'name': *name of user*,
+                'login': *login of user*,
+                'privilege': *effective privilege code*
+            }
+
+        Privilege is effective privilege: it accounts for direct grants and grants to groups,
+        including groups that contain the user's groups (see share_group_with_group), only counts
+        active users and groups, and accounts for immutable resources, as in
+        get_cumulative_user_privilege_over_resource. Public access is reported rather than
+        enumerated, so 'readers' only includes users with privilege of their own. Users are
+        reported in no particular order.
+
+        'readers' reads users from the database in batches as it is consumed, so that very large
+        groups need not fit in memory. It must be consumed or closed before this session makes any
+        change, because changes end the transaction in which it reads.
+
+        Note: this is not currently subject to access control.
+        """
+        if not isinstance(resource_uuid, basestring):
+            raise HSAUsageException("resource_uuid is not a string")
+        privilege_id = self.__get_privilege_id_from_code(min_privilege)
+        if privilege_id > self.__PRIVILEGE_RO:
+            raise HSAUsageException("min_privilege must be 'own', 'rw', or 'ro'")
+        resource_id = self.__get_resource_id_from_uuid(resource_uuid)
+        public = self.resource_is_public(resource_uuid) and privilege_id == self.__PRIVILEGE_RO
+        return {'public': public, 'readers': self.__get_effective_readers(resource_id, privilege_id)}
+
+    def __get_effective_readers(self, resource_id, privilege_id):
+        """
+        PRIVATE: generate users with effective privilege over a resource at or above a level
+
+        :type resource_id: int
+        :type privilege_id: int
+        :param resource_id: id of resource
+        :param privilege_id: least privilege of interest
+
+        Grants are expanded through group nesting and membership using group_closure and the
+        (resource_id, group_id, privilege_id) and (group_id, user_id, privilege_id) indexes, so the
+        expansion does not visit the grant tables.
+        Results are read through a server-side cursor.
+        """
+        cur = self.__backend.stream_cursor(self.__conn)
+        try:
+            cur.execute("""select u.user_uuid, u.user_name, u.user_login, p.privilege_code
+                           from (select g.user_id, min(g.privilege_id) as privilege_id
+                                 from (select a.user_id, a.privilege_id
+                                       from user_access_to_resource a
+                                       where a.resource_id=%s
+                                       union all
+                                       select m.user_id, ga.privilege_id
+                                       from group_access_to_resource ga
+                                       join groups gr on gr.group_id=ga.group_id and gr.group_active
+                                       join group_closure c on c.ancestor_group_id=ga.group_id
+                                       join groups sg on sg.group_id=c.descendant_group_id and sg.group_active
+                                       join user_access_to_group m on m.group_id=c.descendant_group_id
+                                       where ga.resource_id=%s) g
+                                 group by g.user_id) h
+                           join users u on u.user_id=h.user_id and u.user_active
+                           join resources r on r.resource_id=%s
+                           join privileges p on p.privilege_id =
+                               case when (r.resource_immutable or r.resource_published) and h.privilege_id < 3 then 3
+                                    else h.privilege_id
+                               end
+                           where p.privilege_id <= %s""",
+                        (resource_id, resource_id, resource_id, privilege_id))
+            for row in cur:
+                yield {'uuid': row['user_uuid'],
+                       'name': row['user_name'],
+                       'login': row['user_login'],
+                       'privilege': row['privilege_code']}
+        finally:
+            if not cur.closed and not self.__conn.closed:
+                try:
+                    cur.close()
+                except self.__backend.Error:
+                    pass
+
+    @__reads
     def get_resources_held_by_group(self, group_uuid):
         """
         Retrieve resources accessible to a specific group.
@@ -3702,6 +5969,7 @@ class HSAccessCore(object):
                            'privilege': row['privilege_code']})
         return result
 
+    @__reads
     def get_groups_holding_resource(self, resource_uuid):
         """
         Retrieve resources accessible to a specific group.
@@ -3739,6 +6007,7 @@ class HSAccessCore(object):
                            'privilege': row['privilege_code']})
         return result
 
+    @__reads
     def get_public_resources(self):
         """
         Make a list of public resources, sorted by title
@@ -3756,20 +6025,12 @@ class HSAccessCore(object):
             }
 
         Note: this is not currently subject to access control.
+
+        The list is cached for all sessions in the process and rebuilt only when it changes.
         """
-        self.__cur.execute("""SELECT resource_uuid, resource_title, resource_path,
-                           'ro' AS privilege_code
-                           FROM resources
-                           WHERE resource_public
-                           ORDER BY resource_title""")
-        result = []
-        for row in self.__cur:
-            result.append({'uuid': row['resource_uuid'],
-                           'title': row['resource_title'],
-                           'path': row['resource_path'],
-                           'privilege': row['privilege_code']})
-        return result
+        return [dict(item) for item in self.__get_catalog('public_resources')['items']]
 
+    @__reads
     def get_discoverable_resources(self):
         """
         Make a list of public resources, sorted by title
@@ -3787,24 +6048,109 @@ class HSAccessCore(object):
             }
 
         Note: this is not currently subject to access control.
+
+        The list is cached for all sessions in the process and rebuilt only when it changes.
         """
-        self.__cur.execute("""SELECT resource_uuid, resource_title, resource_path,
-                           CASE WHEN resource_public THEN 'ro'
-                                ELSE 'none'
-                           END AS privilege_code
-                           FROM resources
-                           WHERE resource_discoverable is TRUE
-                              OR resource_public is TRUE
-                           ORDER BY resource_title""")
-        result = []
-        for row in self.__cur:
-            result.append({'uuid': row['resource_uuid'],
-                           'title': row['resource_title'],
-                           'path': row['resource_path'],
-                           'privilege': row['privilege_code']})
-        return result
+        return [dict(item) for item in self.__get_catalog('discoverable_resources')['items']]
+
+    @__reads
+    def get_catalog_page(self, catalog, page=0, page_size=None):
+        """
+        Get one page of a public or discoverable catalog, serialized as JSON
+
+        :type catalog: basestring
+        :type page: int
+        :type page_size: int
+        :param catalog: one of 'public_resources', 'discoverable_resources', 'public_groups',
+            or 'discoverable_groups'
+        :param page: page number, starting at 0
+        :param page_size: number of entries per page; omit for the default of 50
+        :return: JSON text of a page
+        :rtype: str
+
+        The page is a JSON object of the form::
+
+            {
+                'catalog': *catalog name*,
+                'version': *catalog version*,
+                'page': *page number*,
+                'page_size': *entries per page*,
+                'total': *number of entries in the catalog*,
+                'items': *entries, as returned by the corresponding get_ method*
+            }
+
+        Pages are serialized once per catalog version and shared by every session in the process.
+        The version changes whenever the catalog does, so it can serve as an HTTP ETag.
+        """
+        if page_size is None:
+            page_size = self.__CATALOG_PAGE_SIZE
+        if not isinstance(page, int) or page < 0:
+            raise HSAUsageException("page is not a non-negative integer")
+        if not isinstance(page_size, int) or page_size < 1:
+            raise HSAUsageException("page_size is not a positive integer")
+        entry = self.__get_catalog(catalog)
+        key = (page, page_size)
+        text = entry['pages'].get(key)
+        if text is None:
+            items = entry['items']
+            text = json.dumps({'catalog': catalog,
+                               'version': entry['version'],
+                               'page': page,
+                               'page_size': page_size,
+                               'total': len(items),
+                               'items': items[page * page_size:(page + 1) * page_size]},
+                              sort_keys=True)
+            entry['pages'][key] = text
+        return text
+
+    def __get_catalog(self, catalog):
+        """
+        PRIVATE: get the current version of a catalog from the process-wide cache
+
+        :type catalog: basestring
+        :param catalog: name of a catalog in __CATALOGS
+        :return: dict with the catalog 'version', its sorted 'items', and serialized 'pages'
+        :rtype: dict
+
+        The cache is checked with one primary key read of catalog_versions. If the catalog
+        has changed, it is read again along with its version in a single query, so the
+        items always match the version they are filed under. Callers must not modify the
+        returned items.
+        """
+        if catalog not in self.__CATALOGS:
+            raise HSAUsageException("Unknown catalog '" + str(catalog) + "'")
+        catalog_name, query = self.__CATALOGS[catalog]
+        key = (self.__cur.connection.dsn, catalog)
+        self.__cur.execute("select catalog_version from catalog_versions where catalog_name=%s",
+                           (catalog_name,))
+        version = self.__cur.fetchone()['catalog_version']
+        with _catalog_cache_lock:
+            entry = _catalog_cache.get(key)
+        if entry is not None and entry['version'] == version:
+            return entry
+
+        self.__cur.execute(query)
+        rows = self.__cur.fetchall()
+        items = []
+        for row in rows:
+            if catalog_name == 'resources' and row['resource_uuid'] is not None:
+                items.append({'uuid': row['resource_uuid'],
+                              'title': row['resource_title'],
+                              'path': row['resource_path'],
+                              'privilege': row['privilege_code']})
+            elif catalog_name == 'groups' and row['group_uuid'] is not None:
+                items.append({'uuid': row['group_uuid'],
+                              'name': row['group_name'],
+                              'code': row['privilege_code']})
+        entry = {'version': rows[0]['catalog_version'], 'items': items, 'pages': {}}
+        with _catalog_cache_lock:
+            current = _catalog_cache.get(key)
+            if current is None or current['version'] < entry['version']:
+                _catalog_cache[key] = entry
+        return entry
 
     # CLI: hs ls groups
+    @__reads
     def get_groups_of_user(self, user_uuid=None):
         """
         Make a list of groups in which a user is a member.
@@ -3839,36 +6185,315 @@ class HSAccessCore(object):
             result.append({'uuid': row['group_uuid'], 'name': row['group_name']})
         return result
 
-    # ##########################################################
-    # stubs for folder subsystem
-    # ##########################################################
+    # ##########################################################
+    # search
+    # ##########################################################
+    __SEARCH_LIMIT = 20
+
+    def __escape_like(self, text):
+        """
+        PRIVATE: escape text so that LIKE matches it literally
+
+        :type text: basestring
+        :param text: text to match
+        :return: text with LIKE wildcards and the escape character escaped
+        :rtype: basestring
+        """
+        return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+    def __in_list(self, values):
+        """
+        PRIVATE: SQL list of parameters for the values, for use with "in"
+
+        :type values: list
+        :param values: the values, passed as parameters after those before the list
+        :return: e.g., "(%s, %s)"; an empty list matches nothing
+        :rtype: basestring
+        """
+        if len(values) == 0:
+            return "(null)"
+        return "(" + ", ".join(["%s"] * len(values)) + ")"
+
+    def __values_table(self, column, count):
+        """
+        PRIVATE: SQL query with one row per parameter, for use as a table
+
+        :type column: basestring
+        :type count: int
+        :param column: name of the one column
+        :param count: number of rows, passed as parameters
+        :rtype: basestring
+        """
+        return " union all ".join(["select %s as " + column] * count)
+
+    def __check_search(self, query, limit):
+        """
+        PRIVATE: check the arguments of a search
+
+        :type query: basestring
+        :type limit: int
+        :param query: search text
+        :param limit: largest number of results; None for the default
+        :return: the words of the query, in lower case, and the limit
+        :rtype: (list[basestring], int)
+        """
+        if not isinstance(query, basestring):
+            raise HSAUsageException("query is not a string")
+        if limit is None:
+            limit = self.__SEARCH_LIMIT
+        if not isinstance(limit, int) or limit < 1:
+            raise HSAUsageException("limit is not a positive integer")
+        words = re.findall(r'[^\W_]+', query.lower(), re.UNICODE)
+        return words, limit
+
+    def __get_prefix_words(self, words):
+        """
+        PRIVATE: search argument that matches text containing words beginning with each of words
+        """
+        return self.__backend.words_argument(words)
+
+    @__reads
+    def search_resources(self, query, limit=None):
+        """
+        Search resource titles
+
+        :type query: basestring
+        :type limit: int
+        :param query: words to search for; each must begin a word of the title
+        :param limit: largest number of results to return; default 20
+        :return: list of resources containing dict items, best matches first
+        :rtype: list[dict[str, str]]
+
+        This returns resources that the current user can discover, in the format::
+
+            {
+                'uuid': *uuid of resource*,
+                'title': *title of resource*,
+                'path': *path of resource*,
+                'privilege': *privilege code*
+            }
+
+        A resource can be discovered if it is discoverable or public, or if the user holds privilege
+        over it. Administrators can discover every resource. The search uses a full-text index on titles
+        (a scan, with the SQLite backend); "dog che" matches "all about dog chewies".
+        """
+        words, limit = self.__check_search(query, limit)
+        if len(words) == 0:
+            return []
+        user_id = self.__get_user_id_from_uuid(self.get_uuid())
+        self.__cur.execute("""select r.resource_uuid, r.resource_title, r.resource_path, p.privilege_code
+                              from resources r
+                              left join cumulative_user_resource_privilege c
+                                  on c.user_id=%s and c.resource_id=r.resource_id
+                              left join privileges p on p.privilege_id =
+                                  coalesce(c.privilege_id, case when r.resource_public then 3 else 4 end)
+                              where """ + self.__backend.match_words('r.resource_title') + """
+                              and (r.resource_discoverable or r.resource_public or c.privilege_id <= 3 or %s)
+                              order by """ + self.__backend.rank_words('r.resource_title') + """ desc,
+                                  r.resource_title, r.resource_uuid
+                              limit %s""",
+                           (user_id, self.__get_prefix_words(words), self.user_is_admin(),
+                            self.__get_prefix_words(words), limit))
+        result = []
+        for row in self.__cur:
+            result.append({'uuid': row['resource_uuid'],
+                           'title': row['resource_title'],
+                           'path': row['resource_path'],
+                           'privilege': row['privilege_code']})
+        return result
+
+    @__reads
+    def search_users(self, prefix, limit=None):
+        """
+        Search active users by login or name, e.g., to autocomplete "share with..."
+
+        :type prefix: basestring
+        :type limit: int
+        :param prefix: beginning of a login, or of any word of a name
+        :param limit: largest number of results to return; default 20
+        :return: list of user dict items, logins that match first
+        :rtype: list[dict[str, str]]
+
+        This returns a list of dictionaries of the form::
+
+            {
+                'uuid': *user uuid*,
+                'login': *user_login*,
+                'name': *user name*
+            }
+
+        Matching ignores case. Inactive users are never returned, since nothing can be shared with them.
+        """
+        if not isinstance(prefix, basestring):
+            raise HSAUsageException("prefix is not a string")
+        words, limit = self.__check_search(prefix, limit)
+        prefix = prefix.strip().lower()
+        if prefix == '':
+            return []
+        pattern = self.__escape_like(prefix) + '%'
+        if len(words) == 0:
+            name_words = ''  # matches no names
+        else:
+            name_words = self.__get_prefix_words(words)
+        self.__cur.execute("""select user_uuid, user_login, user_name from users
+                              where user_active
+                              and (lower(user_login) like %s escape '\\'
+                                   or """ + self.__backend.match_words("coalesce(user_name, '')") + """)
+                              order by lower(user_login) like %s escape '\\' desc, user_login
+                              limit %s""",
+                           (pattern, name_words, pattern, limit))
+        result = []
+        for row in self.__cur:
+            result.append({'uuid': row['user_uuid'],
+                           'login': row['user_login'],
+                           'name': row['user_name']})
+        return result
+
+    @__reads
+    def search_groups(self, query, limit=None):
+        """
+        Search group names
+
+        :type query: basestring
+        :type limit: int
+        :param query: words to search for; each must begin a word of the group name
+        :param limit: largest number of results to return; default 20
+        :return: list of dicts describing groups, best matches first
+        :rtype: list[dict[str, str]]
+
+        This returns groups that the current user can discover, in the format::
+
+            {
+                'uuid': *uuid of group*,
+                'name': *name of group*,
+                'code': *privilege code*
+            }
+
+        A group can be discovered if it is discoverable or public, or if the user is a member.
+        Administrators can discover every group.
+        """
+        words, limit = self.__check_search(query, limit)
+        if len(words) == 0:
+            return []
+        user_id = self.__get_user_id_from_uuid(self.get_uuid())
+        self.__cur.execute("""select g.group_uuid, g.group_name, p.privilege_code
+                              from groups g
+                              left join user_group_privilege m on m.user_id=%s and m.group_id=g.group_id
+                              left join privileges p on p.privilege_id =
+                                  coalesce(m.privilege_id, case when g.group_public then 3 else 4 end)
+                              where """ + self.__backend.match_words('g.group_name') + """
+                              and (g.group_discoverable or g.group_public or m.privilege_id is not null or %s)
+                              order by """ + self.__backend.rank_words('g.group_name') + """ desc,
+                                  g.group_name, g.group_uuid
+                              limit %s""",
+                           (user_id, self.__get_prefix_words(words), self.user_is_admin(),
+                            self.__get_prefix_words(words), limit))
+        result = []
+        for row in self.__cur:
+            result.append({'uuid': row['group_uuid'], 'name': row['group_name'], 'code': row['privilege_code']})
+        return result
+
+    # ##########################################################
+    # folder subsystem
+    # Folders are hierarchical and stored as materialized paths:
+    # the folder 'c' inside 'b' inside 'a' is named 'a/b/c'.
+    # ##########################################################
+    def __get_folder_path(self, folder_name):
+        """
+        PRIVATE: normalize a folder name to its materialized path
+
+        :type folder_name: basestring
+        :param folder_name: folder name, e.g., 'a/b/c' or '/a/b/c/'
+        :return: path with no empty components, e.g., 'a/b/c'
+        :rtype: basestring
+        """
+        if not isinstance(folder_name, basestring):
+            raise HSAUsageException("folder_name is not a string")
+        parts = [p for p in folder_name.split('/') if p != '']
+        if len(parts) == 0:
+            raise HSAUsageException("folder_name is empty")
+        return '/'.join(parts)
+
+    def __get_folder_subtree_pattern(self, folder_path):
+        """
+        PRIVATE: LIKE pattern matching every folder strictly below a folder path
+        """
+        return self.__escape_like(folder_path) + '/%'
+
+    def __get_folder_id(self, folder_path, user_id):
+        """
+        PRIVATE: get the database id of a folder of a user
+
+        :type folder_path: basestring
+        :type user_id: int
+        :param folder_path: normalized folder path
+        :param user_id: id of the user who owns the folder
+        :return: folder id
+        :rtype: int
+        """
+        self.__cur.execute("""select user_folder_id from user_folders
+                              where assertion_user_id=%s and user_folder_name=%s""",
+                           (user_id, folder_path))
+        if self.__cur.rowcount < 1:
+            raise HSAUsageException("Folder does not exist")
+        return self.__cur.fetchone()['user_folder_id']
+
+    @__writes
     def assert_folder(self, folder_name):
         """
-        STUB: Create a folder in the user_folders relation
+        Create a folder in the user_folders relation
 
         :type folder_name: basestring
-        :param folder_name: The name of the folder
+        :param folder_name: The name of the folder, e.g., 'a/b/c'
 
         Uses self.get_uuid(): the identity of the current user.
         Folders are local to the current user.
+        Missing ancestor folders ('a' and 'a/b') are created as well.
+        Asserting an existing folder does nothing.
         """
-        return
-
+        folder_path = self.__get_folder_path(folder_name)
+        if not self.user_is_active(self.get_uuid()):
+            raise HSAccessException("User is inactive")
+        user_id = self.__get_user_id_from_uuid(self.get_uuid())
+        parts = folder_path.split('/')
+        ancestors = ['/'.join(parts[:i]) for i in range(1, len(parts) + 1)]
+        self.__cur.execute("""insert into user_folders (user_folder_name, assertion_user_id)
+                              select a.name, %s from (""" + self.__values_table('name', len(ancestors)) + """) a
+                              where not exists (select 1 from user_folders f
+                                                where f.assertion_user_id=%s and f.user_folder_name=a.name)""",
+                           [user_id] + ancestors + [user_id])
+        self.__audit('assert_folder', detail=folder_path)
+        self.__commit()
+
+    @__writes
     def retract_folder(self, folder_name):
         """
-        STUB: Remove a folder; things in the folder become "unfiled"
+        Remove a folder; things in the folder become "unfiled"
 
         :type folder_name: basestring
         :param folder_name: The name of the folder
 
         Uses: self.get_uuid(): the identity of the current user.
         Folders are local to the current user.
+        Folders inside the folder are removed too, and their contents also become unfiled.
         """
-        return
-
+        folder_path = self.__get_folder_path(folder_name)
+        if not self.user_is_active(self.get_uuid()):
+            raise HSAccessException("User is inactive")
+        user_id = self.__get_user_id_from_uuid(self.get_uuid())
+        self.__get_folder_id(folder_path, user_id)  # check existence
+        # cascade removes resources from folders
+        self.__cur.execute("""delete from user_folders
+                              where assertion_user_id=%s
+                              and (user_folder_name=%s or user_folder_name like %s escape '\\')""",
+                           (user_id, folder_path, self.__get_folder_subtree_pattern(folder_path)))
+        self.__audit('retract_folder', detail=folder_path)
+        self.__commit()
+
+    @__writes
     def assert_resource_in_folder(self, resource_uuid, folder_name):
         """
-        STUB: Put a resource into a previously created folder
+        Put a resource into a previously created folder
 
         :type resource_uuid: basestring
         :type folder_name: basestring
@@ -3877,34 +6502,73 @@ class HSAccessCore(object):
 
         Uses self.get_uuid(): the identity of the current user.
         Folders are local to the current user.
+        A resource is in at most one folder of a user; asserting a new folder moves it.
+        The user must be able to read the resource.
         """
-        return
+        if not isinstance(resource_uuid, basestring):
+            raise HSAUsageException("resource_uuid is not a string")
+        folder_path = self.__get_folder_path(folder_name)
+        if not self.user_is_active(self.get_uuid()):
+            raise HSAccessException("User is inactive")
+        if not self.resource_is_readable(resource_uuid, self.get_uuid()):
+            raise HSAccessException("Resource must be readable")
+        user_id = self.__get_user_id_from_uuid(self.get_uuid())
+        resource_id = self.__get_resource_id_from_uuid(resource_uuid)
+        folder_id = self.__get_folder_id(folder_path, user_id)
+        self.__cur.execute("""delete from user_folder_of_resource where user_id=%s and resource_id=%s""",
+                           (user_id, resource_id))
+        self.__cur.execute("""insert into user_folder_of_resource (user_id, user_folder_id, resource_id)
+                              values (%s, %s, %s)""",
+                           (user_id, folder_id, resource_id))
+        self.__audit('assert_resource_in_folder', resource_id=resource_id, detail=folder_path)
+        self.__commit()
 
+    @__writes
     def retract_resource_in_folder(self, resource_uuid, folder_name):
         """
-        STUB: Remove a resource from a folder; it becomes unfiled.
+        Remove a resource from a folder; it becomes unfiled.
 
         :type resource_uuid: basestring
         :type folder_name: basestring
         :param resource_uuid: identifier of resource to put into folder
         :param folder_name: name of the folder
         """
-        return
-
+        if not isinstance(resource_uuid, basestring):
+            raise HSAUsageException("resource_uuid is not a string")
+        folder_path = self.__get_folder_path(folder_name)
+        if not self.user_is_active(self.get_uuid()):
+            raise HSAccessException("User is inactive")
+        user_id = self.__get_user_id_from_uuid(self.get_uuid())
+        resource_id = self.__get_resource_id_from_uuid(resource_uuid)
+        folder_id = self.__get_folder_id(folder_path, user_id)
+        self.__cur.execute("""delete from user_folder_of_resource
+                              where user_id=%s and user_folder_id=%s and resource_id=%s""",
+                           (user_id, folder_id, resource_id))
+        if self.__cur.rowcount < 1:
+            raise HSAUsageException("Resource is not in folder")
+        self.__audit('retract_resource_in_folder', resource_id=resource_id, detail=folder_path)
+        self.__commit()
+
+    @__reads
     def get_folders(self):
         """
-        STUB: Return a list of folders for this user
+        Return a list of folders for this user
 
-        :return: A list of folder names
+        :return: A sorted list of folder names, e.g., ['a', 'a/b', 'a/b/c']
         :rtype: list[basestring] 
 
         Uses self.get_uuid(): current user identity
         """
-        return
+        user_id = self.__get_user_id_from_uuid(self.get_uuid())
+        self.__cur.execute("""select user_folder_name from user_folders
+                              where assertion_user_id=%s order by user_folder_name""",
+                           (user_id,))
+        return [row['user_folder_name'] for row in self.__cur]
 
+    @__reads
     def get_resources_in_folders(self, folder=None):
         """
-        STUB: Get a structured dictionary of folders and their contents
+        Get a structured dictionary of folders and their contents
 
         :type folder: basestring
         :param folder: the optional name of a folder to use as the top of the hierarchy
@@ -3915,25 +6579,84 @@ class HSAccessCore(object):
 
         This returns a dictionary structure of the form::
 
-<<<<<<< HEAD
-            { folder: { resource_uuid : { title : <resource title>, 'access' : <access code> }}}
-=======
             { 'folder': { 'resource_uuid': { 'title' : *resource title*, 'access' : *access code* }}}
->>>>>>> master
+
+        where 'folder' is the full name of each folder, e.g., 'a/b/c', and the access code is
+        one of 'own', 'rw', 'ro', or 'none', as in get_cumulative_user_privilege_over_resource.
+        Empty folders map to empty dicts.
 
         1. If folder is None, report on the whole hierarchy of user folders
 
-        2.  If folder is not None, report on only one chosen folder.
+        2. If folder is not None, report on that folder and all folders inside it.
 
+        The whole report is computed by a single query.
         """
-        return
+        user_id = self.__get_user_id_from_uuid(self.get_uuid())
+        query = """select f.user_folder_name, r.resource_uuid, r.resource_title, p.privilege_code
+                   from user_folders f
+                   left join user_folder_of_resource fr on fr.user_folder_id=f.user_folder_id
+                   left join resources r on r.resource_id=fr.resource_id
+                   left join cumulative_user_resource_privilege c
+                       on c.user_id=f.assertion_user_id and c.resource_id=r.resource_id
+                   left join privileges p on p.privilege_id =
+                       coalesce(c.privilege_id, case when r.resource_public then 3 else 4 end)
+                   where f.assertion_user_id=%s"""
+        if folder is None:
+            self.__cur.execute(query, (user_id,))
+        else:
+            folder_path = self.__get_folder_path(folder)
+            self.__get_folder_id(folder_path, user_id)  # check existence
+            self.__cur.execute(query + " and (f.user_folder_name=%s or f.user_folder_name like %s escape '\\')",
+                               (user_id, folder_path, self.__get_folder_subtree_pattern(folder_path)))
+        result = {}
+        for row in self.__cur:
+            contents = result.setdefault(row['user_folder_name'], {})
+            if row['resource_uuid'] is not None:
+                contents[row['resource_uuid']] = {'title': row['resource_title'],
+                                                  'access': row['privilege_code']}
+        return result
 
     # ##########################################################
-    # stubs for tag subsystem
+    # tag subsystem
     # ##########################################################
+    def __get_tag_name(self, tag_name):
+        """
+        PRIVATE: check and normalize a tag name
+
+        :type tag_name: basestring
+        :param tag_name: name of a tag
+        :return: tag name without surrounding whitespace
+        :rtype: basestring
+        """
+        if not isinstance(tag_name, basestring):
+            raise HSAUsageException("tag_name is not a string")
+        tag_name = tag_name.strip()
+        if tag_name == '':
+            raise HSAUsageException("tag_name is empty")
+        return tag_name
+
+    def __get_tag_id(self, tag_name, user_id):
+        """
+        PRIVATE: get the database id of a tag of a user
+
+        :type tag_name: basestring
+        :type user_id: int
+        :param tag_name: normalized tag name
+        :param user_id: id of the user who owns the tag
+        :return: tag id
+        :rtype: int
+        """
+        self.__cur.execute("""select user_tag_id from user_tags
+                              where assertion_user_id=%s and user_tag_name=%s""",
+                           (user_id, tag_name))
+        if self.__cur.rowcount < 1:
+            raise HSAUsageException("Tag does not exist")
+        return self.__cur.fetchone()['user_tag_id']
+
+    @__writes
     def assert_tag(self, tag_name):
         """
-        STUB: Create a tag in the user_tags relation
+        Create a tag in the user_tags relation
 
         :type tag_name: basestring
         :param tag_name: The name of the tag
@@ -3941,13 +6664,23 @@ class HSAccessCore(object):
         Uses self.get_uuid(): the identity of the current user.
 
         Registers a tag for later uses. This assures that tags are unambiguous when applied.
-        Folders are local to the current user.
+        Tags are local to the current user. Asserting an existing tag does nothing.
         """
-        return
-
+        tag_name = self.__get_tag_name(tag_name)
+        if not self.user_is_active(self.get_uuid()):
+            raise HSAccessException("User is inactive")
+        user_id = self.__get_user_id_from_uuid(self.get_uuid())
+        self.__cur.execute("""insert into user_tags (user_tag_name, assertion_user_id)
+                              select %s, %s where not exists
+                                  (select 1 from user_tags where assertion_user_id=%s and user_tag_name=%s)""",
+                           (tag_name, user_id, user_id, tag_name))
+        self.__audit('assert_tag', detail=tag_name)
+        self.__commit()
+
+    @__writes
     def retract_tag(self, tag_name):
         """
-        STUB: Remove a tag; things in the tag become "untagged"
+        Remove a tag; things in the tag become "untagged"
 
         :type tag_name: basestring
         :param tag_name: The name of the tag
@@ -3955,13 +6688,22 @@ class HSAccessCore(object):
         Uses self.get_uuid(): the identity of the current user.
 
         Unregisters a tag along with all of uses of that tag on resources.
-        Folders are local to the current user.
+        Tags are local to the current user.
         """
-        return
+        tag_name = self.__get_tag_name(tag_name)
+        if not self.user_is_active(self.get_uuid()):
+            raise HSAccessException("User is inactive")
+        user_id = self.__get_user_id_from_uuid(self.get_uuid())
+        tag_id = self.__get_tag_id(tag_name, user_id)
+        # cascade removes tag from resources
+        self.__cur.execute("""delete from user_tags where user_tag_id=%s""", (tag_id,))
+        self.__audit('retract_tag', detail=tag_name)
+        self.__commit()
 
+    @__writes
     def assert_resource_has_tag(self, resource_uuid, tag_name):
         """
-        STUB: Assign a resource a previously created tag
+        Assign a resource a previously created tag
 
         :type resource_uuid: basestring
         :type tag_name: basestring
@@ -3970,13 +6712,31 @@ class HSAccessCore(object):
 
         Uses self.get_uuid(): the identity of the current user.
         Tags are local to the current user.
-        Multiple asserts with different tags apply all of them
+        Multiple asserts with different tags apply all of them.
+        The user must be able to read the resource.
         """
-        return
-
+        if not isinstance(resource_uuid, basestring):
+            raise HSAUsageException("resource_uuid is not a string")
+        tag_name = self.__get_tag_name(tag_name)
+        if not self.user_is_active(self.get_uuid()):
+            raise HSAccessException("User is inactive")
+        if not self.resource_is_readable(resource_uuid, self.get_uuid()):
+            raise HSAccessException("Resource must be readable")
+        user_id = self.__get_user_id_from_uuid(self.get_uuid())
+        resource_id = self.__get_resource_id_from_uuid(resource_uuid)
+        tag_id = self.__get_tag_id(tag_name, user_id)
+        self.__cur.execute("""insert into user_tags_of_resource (user_id, user_tag_id, resource_id)
+                              select %s, %s, %s where not exists
+                                  (select 1 from user_tags_of_resource
+                                   where user_id=%s and user_tag_id=%s and resource_id=%s)""",
+                           (user_id, tag_id, resource_id, user_id, tag_id, resource_id))
+        self.__audit('assert_resource_has_tag', resource_id=resource_id, detail=tag_name)
+        self.__commit()
+
+    @__writes
     def retract_resource_has_tag(self, resource_uuid, tag_name):
         """
-        STUB: Remove a tag from a resource; it becomes untagged.
+        Remove a tag from a resource; it becomes untagged.
 
         :type resource_uuid: basestring
         :type tag_name: basestring
@@ -3987,22 +6747,42 @@ class HSAccessCore(object):
         Tags are local to the current user.
         This removes an assertion of one tag while leaving the others alone.
         """
-        return
-
+        if not isinstance(resource_uuid, basestring):
+            raise HSAUsageException("resource_uuid is not a string")
+        tag_name = self.__get_tag_name(tag_name)
+        if not self.user_is_active(self.get_uuid()):
+            raise HSAccessException("User is inactive")
+        user_id = self.__get_user_id_from_uuid(self.get_uuid())
+        resource_id = self.__get_resource_id_from_uuid(resource_uuid)
+        tag_id = self.__get_tag_id(tag_name, user_id)
+        self.__cur.execute("""delete from user_tags_of_resource
+                              where user_id=%s and user_tag_id=%s and resource_id=%s""",
+                           (user_id, tag_id, resource_id))
+        if self.__cur.rowcount < 1:
+            raise HSAUsageException("Resource does not have tag")
+        self.__audit('retract_resource_has_tag', resource_id=resource_id, detail=tag_name)
+        self.__commit()
+
+    @__reads
     def get_tags(self):
         """
-        STUB: Return a list of tags for this user
+        Return a list of tags for this user
 
-        :return: A list of tag names
+        :return: A sorted list of tag names
         :rtype: list[basestring] 
 
         Uses self.get_uuid(): current user identity
         """
-        return
+        user_id = self.__get_user_id_from_uuid(self.get_uuid())
+        self.__cur.execute("""select user_tag_name from user_tags
+                              where assertion_user_id=%s order by user_tag_name""",
+                           (user_id,))
+        return [row['user_tag_name'] for row in self.__cur]
 
+    @__reads
     def get_resources_by_tag(self, tag=None):
         """
-        STUB: Get a structured dictionary of tags and their contents
+        Get a structured dictionary of tags and their contents
 
         :type tag: basestring
         :param tag: the name of a tag to use
@@ -4014,14 +6794,121 @@ class HSAccessCore(object):
 
             { 'tag': { 'resource_uuid' : { 'title' : *resource title*, 'access' : *access code* }}}
 
+        where the access code is one of 'own', 'rw', 'ro', or 'none', as in
+        get_cumulative_user_privilege_over_resource. Unused tags map to empty dicts.
+
         If tag argument is not None, report on only one tag.
         """
-        return
+        user_id = self.__get_user_id_from_uuid(self.get_uuid())
+        query = """select t.user_tag_name, r.resource_uuid, r.resource_title, p.privilege_code
+                   from user_tags t
+                   left join user_tags_of_resource tr on tr.user_tag_id=t.user_tag_id
+                   left join resources r on r.resource_id=tr.resource_id
+                   left join cumulative_user_resource_privilege c
+                       on c.user_id=t.assertion_user_id and c.resource_id=r.resource_id
+                   left join privileges p on p.privilege_id =
+                       coalesce(c.privilege_id, case when r.resource_public then 3 else 4 end)
+                   where t.assertion_user_id=%s"""
+        if tag is None:
+            self.__cur.execute(query, (user_id,))
+        else:
+            tag_name = self.__get_tag_name(tag)
+            self.__get_tag_id(tag_name, user_id)  # check existence
+            self.__cur.execute(query + " and t.user_tag_name=%s", (user_id, tag_name))
+        result = {}
+        for row in self.__cur:
+            contents = result.setdefault(row['user_tag_name'], {})
+            if row['resource_uuid'] is not None:
+                contents[row['resource_uuid']] = {'title': row['resource_title'],
+                                                  'access': row['privilege_code']}
+        return result
+
+    @__reads
+    def get_resources_by_tags(self, all_of=None, any_of=None):
+        """
+        Get the resources that carry a combination of tags
+
+        :type all_of: list[basestring]
+        :type any_of: list[basestring]
+        :param all_of: resources must have every one of these tags
+        :param any_of: resources must have at least one of these tags
+        :return: A dict object of matching resources
+        :rtype: dict[basestring] 
+
+        Uses: self.get_uuid(): the current user.
+        This returns a dictionary structure of the form::
+
+            { 'resource_uuid' : { 'title' : *resource title*, 'access' : *access code* }}
+
+        At least one of all_of and any_of must be non-empty. When both are given, resources
+        must satisfy both. Tags that the user has not created match nothing.
+
+        The intersection is computed by a single query over the (user, tag, resource) index.
+        """
+        if all_of is None:
+            all_of = []
+        if any_of is None:
+            any_of = []
+        if not isinstance(all_of, (list, tuple, set)):
+            raise HSAUsageException("all_of is not a list")
+        if not isinstance(any_of, (list, tuple, set)):
+            raise HSAUsageException("any_of is not a list")
+        all_of = sorted(set(self.__get_tag_name(t) for t in all_of))
+        any_of = sorted(set(self.__get_tag_name(t) for t in any_of))
+        if len(all_of) == 0 and len(any_of) == 0:
+            raise HSAUsageException("No tags given")
+        user_id = self.__get_user_id_from_uuid(self.get_uuid())
+        self.__cur.execute("""select r.resource_uuid, r.resource_title, p.privilege_code
+                              from (select tr.resource_id
+                                    from user_tags t
+                                    join user_tags_of_resource tr on tr.user_tag_id=t.user_tag_id
+                                    where t.assertion_user_id=%s
+                                    and t.user_tag_name in """ + self.__in_list(all_of + any_of) + """
+                                    group by tr.resource_id
+                                    having count(case when t.user_tag_name in """ + self.__in_list(all_of) + \
+                           """ then 1 end) = %s
+                                    and (%s or max(case when t.user_tag_name in """ + self.__in_list(any_of) + \
+                           """ then 1 else 0 end) = 1)) m
+                              join resources r on r.resource_id=m.resource_id
+                              left join cumulative_user_resource_privilege c
+                                  on c.user_id=%s and c.resource_id=r.resource_id
+                              left join privileges p on p.privilege_id =
+                                  coalesce(c.privilege_id, case when r.resource_public then 3 else 4 end)""",
+                           [user_id] + all_of + any_of + all_of + [len(all_of), len(any_of) == 0] + any_of + [user_id])
+        result = {}
+        for row in self.__cur:
+            result[row['resource_uuid']] = {'title': row['resource_title'],
+                                            'access': row['privilege_code']}
+        return result
+
+    @__reads
+    def get_tag_counts(self):
+        """
+        Count the resources the current user can read under each of the user's tags
+
+        :return: A dict of tag names to resource counts
+        :rtype: dict[basestring, int]
+
+        Uses self.get_uuid(): the current user.
+
+        Unused tags have count 0. Counts are kept up to date by the database as tags
+        and privileges change, so this is a single indexed read.
+        """
+        user_id = self.__get_user_id_from_uuid(self.get_uuid())
+        self.__cur.execute("""select t.user_tag_name, c.resource_count
+                              from user_tag_counts c join user_tags t on t.user_tag_id=c.user_tag_id
+                              where c.user_id=%s""",
+                           (user_id,))
+        result = {}
+        for row in self.__cur:
+            result[row['user_tag_name']] = row['resource_count']
+        return result
 
     ####################################################################
     # statistics
     ####################################################################
 
+    @__reads
     def get_number_of_resource_owners(self, resource_uuid):
         """
         Count the number of resource owners for a resource, for reporting purposes.
@@ -4030,6 +6917,8 @@ class HSAccessCore(object):
         :param resource_uuid: identifier of resource to report upon
         :return: number of owners
         :rtype: int
+
+        Only active owners are counted. The count is maintained by the database.
         """
         if not isinstance(resource_uuid, basestring):
             raise HSAUsageException("resource_uuid is not a string")
@@ -4038,11 +6927,11 @@ class HSAccessCore(object):
         return self.__get_number_of_resource_owners_by_id(resource_id)
 
     def __get_number_of_resource_owners_by_id(self, resource_id):
-        self.__cur.execute("""select count(distinct user_id) as count from user_resource_privilege
-                              where resource_id=%s and privilege_id=1""",
+        self.__cur.execute("""select resource_owner_count from resources where resource_id=%s""",
                            (resource_id,))
-        return self.__cur.fetchone()['count']
+        return self.__cur.fetchone()['resource_owner_count']
 
+    @__reads
     def get_number_of_group_owners(self, group_uuid):
         """
         Count the number of resource owners for a resource, for reporting purposes.
@@ -4051,6 +6940,8 @@ class HSAccessCore(object):
         :param group_uuid: identifier of group to report upon
         :return: number of owners
         :rtype: int
+
+        Only active owners are counted. The count is maintained by the database.
         """
         if not isinstance(group_uuid, basestring):
             raise HSAUsageException("group_uuid is not a string")
@@ -4058,11 +6949,11 @@ class HSAccessCore(object):
         return self.__get_number_of_group_owners_by_id(group_id)
 
     def __get_number_of_group_owners_by_id(self, group_id):
-        self.__cur.execute("""SELECT count(distinct user_id) AS count FROM user_group_privilege
-                              WHERE group_id=%s and privilege_id=1""",
+        self.__cur.execute("""select group_owner_count from groups where group_id=%s""",
                            (group_id,))
-        return self.__cur.fetchone()['count']
+        return self.__cur.fetchone()['group_owner_count']
 
+    @__reads
     def get_number_of_resources_owned_by_user(self, user_uuid=None):
         """
         Count the number of resources owned by a user.
@@ -4078,13 +6969,10 @@ class HSAccessCore(object):
             user_uuid = self.get_uuid()
         if not isinstance(user_uuid, basestring):
             raise HSAUsageException("user_uuid is not a string")
-        user_id = self.__get_user_id_from_uuid(user_uuid)
-        self.__cur.execute("""SELECT count(DISTINCT resource_id) AS count FROM user_resource_privilege
-                              WHERE user_id=%s AND privilege_id=1""",
-                           (user_id,))
-        return self.__cur.fetchone()['count']
+        return self.__get_user_statistic(user_uuid, 'resources_owned')
 
     # get the number of groups the user owns
+    @__reads
     def get_number_of_groups_owned_by_user(self, user_uuid=None):
         """
         Count the number of groups owned by a user.
@@ -4100,13 +6988,10 @@ class HSAccessCore(object):
             user_uuid = self.get_uuid()
         if not isinstance(user_uuid, basestring):
             raise HSAUsageException("user_uuid is not a string")
-        user_id = self.__get_user_id_from_uuid(user_uuid)
-        self.__cur.execute("""SELECT count(distinct group_id) AS count FROM user_group_privilege
-                              WHERE user_id=%s AND privilege_id=1""",
-                           (user_id,))
-        return self.__cur.fetchone()['count']
+        return self.__get_user_statistic(user_uuid, 'groups_owned')
 
     # measure the number of resources the user can access
+    @__reads
     def get_number_of_resources_held_by_user(self, user_uuid=None):
         """
         Count the number of resources held by a user.
@@ -4122,16 +7007,13 @@ class HSAccessCore(object):
             user_uuid = self.get_uuid()
         if not isinstance(user_uuid, basestring):
             raise HSAUsageException("user_uuid is not a string")
-        user_id = self.__get_user_id_from_uuid(user_uuid)
-        self.__cur.execute("""SELECT count(distinct resource_id) AS count FROM user_resource_privilege
-                              WHERE user_id=%s""",
-                           (user_id,))
-        return self.__cur.fetchone()['count']
+        return self.__get_user_statistic(user_uuid, 'resources_held')
 
     # measure the number of resources the user can access
     # note: group membership and access are currently synonymous
     # I am utilizing group access as the count.
 
+    @__reads
     def get_number_of_groups_of_user(self, user_uuid=None):
         """
         Count the number of groups in which a user is a member
@@ -4149,11 +7031,1009 @@ class HSAccessCore(object):
             raise HSAUsageException("user_uuid is not a string")
         if not self.user_exists(user_uuid):
             raise HSAUsageException("User uuid does not exist")
+        return self.__get_user_statistic(user_uuid, 'groups_joined')
+
+    def __get_user_statistic(self, user_uuid, statistic):
+        """
+        PRIVATE: read one of the counters that the database maintains for a user
+
+        :type user_uuid: basestring
+        :type statistic: basestring
+        :param user_uuid: uuid of user
+        :param statistic: column of user_statistics, e.g., 'resources_owned'
+        :return: value of the counter
+        :rtype: int
+        """
         user_id = self.__get_user_id_from_uuid(user_uuid)
-        self.__cur.execute("""select count(distinct group_id) as count from user_group_privilege
-                              where user_id=%s""",
-                           (user_id,))
-        return self.__cur.fetchone()['count']
+        self.__cur.execute("select " + statistic + " from user_statistics where user_id=%s", (user_id,))
+        if self.__cur.rowcount < 1:
+            raise HSAIntegrityException("No statistics for user; run recount")
+        return self.__cur.fetchone()[statistic]
+
+    @__writes
+    def recount(self):
+        """
+        Repair the counts that the database maintains (administrators only)
+
+        :return: number of counts that were wrong and have been corrected
+        :rtype: int
+
+        The statistics above, owner counts, and tag counts are kept up to date by the database
+        as privileges change. If that maintenance has been bypassed, e.g., by loading data with
+        triggers disabled, this recomputes every count from the privilege records.
+        """
+        if not self.user_is_admin():
+            raise HSAccessException("User is not an administrator")
+        corrected = self.__backend.recount(self.__cur)
+        self.__audit('recount')
+        self.__commit()
+        return corrected
+
+    ##################################################################################
+    # bulk import
+    ##################################################################################
+
+    # kind -> (field of the input, column of the staging table), in the order kinds are merged
+    __IMPORT_FIELDS = (
+        ('users', (('login', 'user_login'), ('name', 'user_name'), ('uuid', 'user_uuid'),
+                   ('active', 'user_active'), ('admin', 'user_admin'))),
+        ('groups', (('uuid', 'group_uuid'), ('name', 'group_name'), ('owner', 'owner_login'),
+                    ('active', 'group_active'), ('shareable', 'group_shareable'),
+                    ('discoverable', 'group_discoverable'), ('public', 'group_public'))),
+        ('resources', (('uuid', 'resource_uuid'), ('path', 'resource_path'), ('title', 'resource_title'),
+                       ('owner', 'owner_login'), ('immutable', 'resource_immutable'),
+                       ('published', 'resource_published'), ('discoverable', 'resource_discoverable'),
+                       ('public', 'resource_public'), ('shareable', 'resource_shareable'))),
+        ('memberships', (('group', 'group_uuid'), ('user', 'user_login'), ('privilege', 'privilege_code'),
+                         ('grantor', 'grantor_login'))),
+        ('grants', (('resource', 'resource_uuid'), ('user', 'user_login'), ('group', 'group_uuid'),
+                    ('privilege', 'privilege_code'), ('grantor', 'grantor_login'))),
+    )
+    # internal ids resolved for each kind, besides the staged columns
+    __IMPORT_IDS = {
+        'users': ('user_id',),
+        'groups': ('group_id', 'owner_id'),
+        'resources': ('resource_id', 'owner_id'),
+        'memberships': ('group_id', 'user_id', 'grantor_id', 'privilege_id'),
+        'grants': ('resource_id', 'user_id', 'group_id', 'grantor_id', 'privilege_id'),
+    }
+
+    @__writes
+    def bulk_import(self, users=None, groups=None, resources=None, memberships=None, grants=None,
+                    format='csv'):
+        """
+        Register users, groups, and resources, and grant privileges, in bulk (administrators only)
+
+        :type format: basestring
+        :param users: stream of users, with fields login, name, uuid, active, and admin
+        :param groups: stream of groups, with fields uuid, name, owner, active, shareable,
+            discoverable, and public
+        :param resources: stream of resources, with fields uuid, path, title, owner, immutable,
+            published, discoverable, public, and shareable
+        :param memberships: stream of privileges over groups, with fields group, user, privilege,
+            and grantor
+        :param grants: stream of privileges over resources, with fields resource, user or group,
+            privilege, and grantor
+        :param format: 'csv' for CSV with a header naming the fields present, in any order, or
+            'jsonl' for one JSON object per line
+        :return: dict with the number of records imported of each kind ('users', 'groups',
+            'resources', 'memberships', and 'grants'), and 'rejects', a list of dicts with keys
+            'kind', 'row' (counting records from 1), and 'reason', for the records not imported
+        :rtype: dict
+
+        Users, owners, and grantors are named by login; groups and resources by uuid. A stream
+        may refer to what an earlier stream imports. Each record is merged like the corresponding
+        call: assert_user, assert_group and assert_resource on behalf of the owner, which is only
+        needed for new groups and resources, share_group_with_user, and share_resource_with_user or
+        share_resource_with_group on behalf of the grantor (by default, the current user).
+        Missing fields of existing users, groups, and resources are left as they are; those of
+        new ones take the defaults of those calls. Privileges are 'own', 'rw', or 'ro'.
+
+        Records are checked together rather than one at a time. A record is rejected if it is
+        incomplete or malformed, repeats an earlier record, refers to something that does not
+        exist, takes the uuid or path of another object, or would leave a group or resource
+        without owners. Unlike the calls it stands for, this does not require grantors to hold
+        the privileges they grant. Everything else is imported in one transaction, and audited
+        as if by those calls.
+
+        Tag counts and user statistics are brought up to date once, after the records are merged,
+        rather than for each record: the triggers that keep them skip the grants of this
+        transaction. Owner counts and the last-owner check are maintained for each record as
+        usual. Changes by other sessions are maintained as usual; those to the groups and
+        resources imported wait until the import commits. Denial filters are rebuilt. This
+        requires the postgres backend.
+        """
+        if self.__backend is not _backends['postgres']:
+            raise HSAUsageException("bulk import requires the postgres backend")
+        if format not in ('csv', 'jsonl'):
+            raise HSAUsageException("format must be 'csv' or 'jsonl'")
+        if not self.user_is_admin():
+            raise HSAccessException("User is not an administrator")
+        streams = {'users': users, 'groups': groups, 'resources': resources,
+                   'memberships': memberships, 'grants': grants}
+        for kind, fields in self.__IMPORT_FIELDS:
+            self.__import_stage(kind, fields, streams[kind], format)
+        # the count triggers of the grant tables skip this transaction (see db/database.psql)
+        self.__cur.execute("insert into hs_bulk_imports (txid) values (txid_current())")
+        self.__import_users()
+        self.__import_groups()
+        self.__import_resources()
+        self.__import_memberships()
+        self.__import_grants()
+        self.__cur.execute("delete from hs_bulk_imports where txid=txid_current()")
+        self.__import_recount()
+        self.__cur.execute("select pg_notify('hs_grants', 'rebuild')")
+
+        report = {'rejects': []}
+        for kind, fields in self.__IMPORT_FIELDS:
+            self.__cur.execute("select count(*) as imported from hs_import_" + kind + " where reason is null")
+            report[kind] = int(self.__cur.fetchone()['imported'])
+            self.__cur.execute("select row_number, reason from hs_import_" + kind +
+                               " where reason is not null order by row_number")
+            report['rejects'].extend({'kind': kind, 'row': int(row['row_number']), 'reason': row['reason']}
+                                     for row in self.__cur.fetchall())
+        self.__commit()
+        return report
+
+    def __import_stage(self, kind, fields, stream, format):
+        """
+        PRIVATE: copy a stream into the staging table of its kind, hs_import_<kind>
+
+        :type kind: basestring
+        :type fields: tuple
+        :type format: basestring
+        :param kind: 'users', 'groups', 'resources', 'memberships', or 'grants'
+        :param fields: (field of the input, column of the staging table) for the kind
+        :param stream: file-like object, or None for none of this kind
+        :param format: 'csv' or 'jsonl'
+
+        Staged values are text, checked and converted when merged. A record's reason is set
+        when it is rejected.
+        """
+        names = [name for name, column in fields]
+        columns = dict(fields)
+        self.__cur.execute("create temporary table hs_import_" + kind +
+                           " (row_number bigserial, reason text, " +
+                           ", ".join(column + " text" for name, column in fields) + ", " +
+                           ", ".join(id_column + " integer" for id_column in self.__IMPORT_IDS[kind]) +
+                           ", created boolean not null default false) on commit drop")
+        if stream is None:
+            return
+        if format == 'csv':
+            header = next(csv.reader([stream.readline()]), [])
+            header = [name.strip().lower() for name in header]
+            if not header:
+                return
+            unknown = [name for name in header if name not in columns]
+            if unknown or len(set(header)) != len(header):
+                raise HSAUsageException("%s header must name distinct fields among %s"
+                                        % (kind, ", ".join(names)))
+            copy = ("copy hs_import_" + kind + " (" + ", ".join(columns[name] for name in header) +
+                    ") from stdin with (format csv)")
+        else:
+            stream = _ImportStream(stream, names)
+            copy = ("copy hs_import_" + kind + " (" + ", ".join(columns[name] for name in names) +
+                    ", reason) from stdin with (format csv)")
+        try:
+            self.__cur.copy_expert(copy, stream)
+        except psycopg2.DataError as e:
+            raise HSAUsageException("%s are not valid %s: %s" % (kind, format, e.diag.message_primary))
+        self.__cur.execute("analyze hs_import_" + kind)
+
+    def __import_reject(self, kind, reason, condition):
+        """
+        PRIVATE: reject the records of a kind not yet rejected that meet a condition
+
+        :type kind: basestring
+        :type reason: basestring
+        :type condition: basestring
+        :param condition: SQL condition on the staged record s
+        """
+        self.__cur.execute("update hs_import_" + kind + " s set reason=%s where s.reason is null and (" +
+                           condition + ")", (reason,))
+
+    def __import_check_text(self, kind, column, name, length, required=True):
+        """
+        PRIVATE: reject records of a kind whose text field is missing or too long
+        """
+        if required:
+            self.__import_reject(kind, name + " is required", "coalesce(s." + column + ", '') = ''")
+        self.__import_reject(kind, name + " is too long", "length(s." + column + ") > " + str(length))
+
+    def __import_check_flags(self, kind, columns):
+        """
+        PRIVATE: reject records of a kind whose flags are neither true nor false
+
+        :type columns: tuple
+        :param columns: staging columns of the flags, e.g., 'user_active'
+        """
+        for column in columns:
+            self.__import_reject(kind, column.split('_', 1)[1] + " must be true or false",
+                                 "s." + column + " !~* " +
+                                 "'^[[:space:]]*(t|true|y|yes|on|1|f|false|n|no|off|0)[[:space:]]*$'")
+
+    def __import_check_unique(self, kind, columns, reason):
+        """
+        PRIVATE: reject records of a kind that repeat an earlier accepted record in some columns
+
+        :type columns: tuple
+        :param columns: staging columns that must be unique; records whose first is missing are not checked
+        """
+        self.__cur.execute("update hs_import_" + kind + """ s set reason=%s
+                              from (select row_number, row_number() over (partition by """ + ", ".join(columns) +
+                           """ order by row_number) as repeat
+                                    from hs_import_""" + kind + " where reason is null and " + columns[0] +
+                           """ is not null) d
+                              where s.row_number=d.row_number and d.repeat > 1""", (reason,))
+
+    @staticmethod
+    def __import_flag(column, default):
+        """
+        PRIVATE: SQL for a staged flag as a boolean, or default if it is missing
+        """
+        return "coalesce(nullif(trim(s." + column + "), '')::boolean, " + default + ")"
+
+    def __import_users(self):
+        """
+        PRIVATE: check and merge staged users, as assert_user
+        """
+        self.__import_check_text('users', 'user_login', 'login', 40)
+        self.__import_check_text('users', 'user_name', 'name', 200, required=False)
+        self.__import_check_text('users', 'user_uuid', 'uuid', 32, required=False)
+        self.__import_check_flags('users', ('user_active', 'user_admin'))
+        self.__import_check_unique('users', ('user_login',), "login appears more than once")
+        self.__import_check_unique('users', ('user_uuid',), "uuid appears more than once")
+        self.__import_reject('users', "login is registered with another uuid",
+                             """s.user_uuid is not null and exists (select 1 from users u
+                                where u.user_login=s.user_login and u.user_uuid<>s.user_uuid)""")
+        self.__import_reject('users', "uuid belongs to another user",
+                             """exists (select 1 from users u
+                                where u.user_uuid=s.user_uuid and u.user_login<>s.user_login)""")
+        self.__cur.execute("""update hs_import_users s set user_id=u.user_id from users u
+                              where s.reason is null and u.user_login=s.user_login""")
+        self.__cur.execute("""update users u set user_name=coalesce(s.user_name, u.user_name),
+                              user_active=""" + self.__import_flag('user_active', 'u.user_active') + """,
+                              user_admin=""" + self.__import_flag('user_admin', 'u.user_admin') + """,
+                              assertion_user_id=%s, assertion_time=CURRENT_TIMESTAMP
+                              from hs_import_users s where s.reason is null and u.user_id=s.user_id""",
+                           (self.__user_id,))
+        self.__cur.execute("""update hs_import_users s set created=true where s.reason is null and s.user_id is null""")
+        # new users without uuids get them as from assert_user
+        self.__cur.execute("select row_number from hs_import_users where created and user_uuid is null")
+        rows = [row['row_number'] for row in self.__cur.fetchall()]
+        if rows:
+            self.__cur.execute("""update hs_import_users s set user_uuid=n.user_uuid
+                                  from unnest(%s::bigint[], %s::text[]) as n(row_number, user_uuid)
+                                  where s.row_number=n.row_number""",
+                               (rows, [uuid.uuid4().hex for _ in rows]))
+        self.__cur.execute("""insert into users (user_uuid, user_login, user_name, user_active, user_admin,
+                                                 assertion_user_id)
+                              select s.user_uuid, s.user_login, s.user_name, """ +
+                           self.__import_flag('user_active', 'true') + ", " +
+                           self.__import_flag('user_admin', 'false') + """, %s
+                              from hs_import_users s where s.created order by s.row_number""",
+                           (self.__user_id,))
+        self.__cur.execute("""update hs_import_users s set user_id=u.user_id from users u
+                              where s.created and u.user_login=s.user_login""")
+        self.__cur.execute("""insert into audit_log (event_time, actor_user_id, verb, user_id, flags, detail)
+                              select clock_timestamp(), %s, 'assert_user', u.user_id,
+                                     case when u.user_active then 'a' else '' end ||
+                                     case when u.user_admin then 'A' else '' end, u.user_uuid
+                              from hs_import_users s join users u on u.user_id=s.user_id
+                              where s.reason is null order by s.row_number""", (self.__user_id,))
+
+    def __import_owners(self, kind, table, id_column, uuid_column):
+        """
+        PRIVATE: resolve staged groups or resources and their owners, rejecting unknown owners
+        """
+        self.__cur.execute("update hs_import_" + kind + " s set " + id_column + "=o." + id_column +
+                           " from " + table + " o where s.reason is null and o." + uuid_column +
+                           "=s." + uuid_column)
+        self.__cur.execute("update hs_import_" + kind + """ s set owner_id=u.user_id from users u
+                              where s.reason is null and u.user_login=s.owner_login""")
+        self.__import_reject(kind, "owner is required",
+                             "s." + id_column + " is null and coalesce(s.owner_login, '') = ''")
+        self.__import_reject(kind, "owner does not exist", "s.owner_login is not null and s.owner_id is null")
+        self.__cur.execute("update hs_import_" + kind + " s set created=true where s.reason is null and s." +
+                           id_column + " is null")
+
+    def __import_groups(self):
+        """
+        PRIVATE: check and merge staged groups, as assert_group on behalf of their owners
+        """
+        self.__import_check_text('groups', 'group_uuid', 'uuid', 40)
+        self.__import_check_text('groups', 'group_name', 'name', 40, required=False)
+        self.__import_check_flags('groups', ('group_active', 'group_shareable', 'group_discoverable', 'group_public'))
+        self.__import_check_unique('groups', ('group_uuid',), "uuid appears more than once")
+        self.__import_owners('groups', 'groups', 'group_id', 'group_uuid')
+        self.__import_reject('groups', "name is required", "s.created and coalesce(s.group_name, '') = ''")
+        self.__cur.execute("update hs_import_groups s set created=false where s.reason is not null")
+        self.__cur.execute("""update groups g set group_name=coalesce(s.group_name, g.group_name),
+                              group_active=""" + self.__import_flag('group_active', 'g.group_active') + """,
+                              group_shareable=""" + self.__import_flag('group_shareable', 'g.group_shareable') + """,
+                              group_discoverable=""" +
+                           self.__import_flag('group_discoverable', 'g.group_discoverable') + """,
+                              group_public=""" + self.__import_flag('group_public', 'g.group_public') + """,
+                              assertion_user_id=%s, assertion_time=CURRENT_TIMESTAMP
+                              from hs_import_groups s where s.reason is null and g.group_id=s.group_id""",
+                           (self.__user_id,))
+        self.__cur.execute("""insert into groups (group_uuid, group_name, group_active, group_shareable,
+                                                  group_discoverable, group_public, assertion_user_id)
+                              select s.group_uuid, s.group_name, """ +
+                           ", ".join(self.__import_flag(c, 'true') for c in
+                                     ('group_active', 'group_shareable', 'group_discoverable', 'group_public')) +
+                           """, s.owner_id from hs_import_groups s where s.created order by s.row_number""")
+        self.__cur.execute("""update hs_import_groups s set group_id=g.group_id from groups g
+                              where s.created and g.group_uuid=s.group_uuid""")
+        self.__cur.execute("""insert into user_access_to_group (user_id, group_id, privilege_id, assertion_user_id)
+                              select s.owner_id, s.group_id, 1, s.owner_id
+                              from hs_import_groups s where s.created""")
+        self.__cur.execute("""insert into audit_log (event_time, actor_user_id, verb, group_id, flags, detail)
+                              select clock_timestamp(), %s, 'assert_group', g.group_id,
+                                     case when g.group_active then 'a' else '' end ||
+                                     case when g.group_shareable then 's' else '' end ||
+                                     case when g.group_discoverable then 'd' else '' end ||
+                                     case when g.group_public then 'p' else '' end, g.group_uuid
+                              from hs_import_groups s join groups g on g.group_id=s.group_id
+                              where s.reason is null order by s.row_number""", (self.__user_id,))
+        self.__cur.execute("""insert into audit_log (event_time, actor_user_id, verb, user_id, group_id,
+                                                     privilege_id, assertion_user_id)
+                              select clock_timestamp(), %s, 'share_group_with_user', s.owner_id, s.group_id,
+                                     1, s.owner_id
+                              from hs_import_groups s where s.created order by s.row_number""",
+                           (self.__user_id,))
+
+    def __import_resources(self):
+        """
+        PRIVATE: check and merge staged resources, as assert_resource on behalf of their owners
+        """
+        self.__import_check_text('resources', 'resource_uuid', 'uuid', 40)
+        self.__import_check_text('resources', 'resource_path', 'path', 1000, required=False)
+        self.__import_check_text('resources', 'resource_title', 'title', 200, required=False)
+        self.__import_check_flags('resources', ('resource_immutable', 'resource_published', 'resource_discoverable',
+                                                'resource_public', 'resource_shareable'))
+        self.__import_check_unique('resources', ('resource_uuid',), "uuid appears more than once")
+        self.__import_check_unique('resources', ('resource_path',), "path appears more than once")
+        self.__import_reject('resources', "path belongs to another resource",
+                             """exists (select 1 from resources r
+                                where r.resource_path=s.resource_path and r.resource_uuid<>s.resource_uuid)""")
+        self.__import_owners('resources', 'resources', 'resource_id', 'resource_uuid')
+        self.__import_reject('resources', "path is required", "s.created and coalesce(s.resource_path, '') = ''")
+        self.__import_reject('resources', "title is required",
+                             "s.created and coalesce(s.resource_title, '') = ''")
+        self.__cur.execute("update hs_import_resources s set created=false where s.reason is not null")
+        flags = (('resource_immutable', 'false'), ('resource_published', 'false'),
+                 ('resource_discoverable', 'false'), ('resource_public', 'false'),
+                 ('resource_shareable', 'true'))
+        self.__cur.execute("""update resources r set resource_path=coalesce(s.resource_path, r.resource_path),
+                              resource_title=coalesce(s.resource_title, r.resource_title), """ +
+                           ", ".join(c + "=" + self.__import_flag(c, 'r.' + c) for c, default in flags) + """,
+                              assertion_user_id=%s, assertion_time=CURRENT_TIMESTAMP
+                              from hs_import_resources s where s.reason is null and r.resource_id=s.resource_id""",
+                           (self.__user_id,))
+        self.__cur.execute("""insert into resources (resource_uuid, resource_path, resource_title, """ +
+                           ", ".join(c for c, default in flags) + """, assertion_user_id)
+                              select s.resource_uuid, s.resource_path, s.resource_title, """ +
+                           ", ".join(self.__import_flag(c, default) for c, default in flags) + """, s.owner_id
+                              from hs_import_resources s where s.created order by s.row_number""")
+        self.__cur.execute("""update hs_import_resources s set resource_id=r.resource_id from resources r
+                              where s.created and r.resource_uuid=s.resource_uuid""")
+        self.__cur.execute("""insert into user_access_to_resource (user_id, resource_id, privilege_id,
+                                                                   assertion_user_id)
+                              select s.owner_id, s.resource_id, 1, s.owner_id
+                              from hs_import_resources s where s.created""")
+        self.__cur.execute("""insert into audit_log (event_time, actor_user_id, verb, resource_id, flags, detail)
+                              select clock_timestamp(), %s, 'assert_resource', r.resource_id,
+                                     case when r.resource_shareable then 's' else '' end ||
+                                     case when r.resource_discoverable then 'd' else '' end ||
+                                     case when r.resource_public then 'p' else '' end ||
+                                     case when r.resource_immutable then 'i' else '' end ||
+                                     case when r.resource_published then 'P' else '' end, r.resource_uuid
+                              from hs_import_resources s join resources r on r.resource_id=s.resource_id
+                              where s.reason is null order by s.row_number""", (self.__user_id,))
+        self.__cur.execute("""insert into audit_log (event_time, actor_user_id, verb, user_id, resource_id,
+                                                     privilege_id, assertion_user_id)
+                              select clock_timestamp(), %s, 'share_resource_with_user', s.owner_id,
+                                     s.resource_id, 1, s.owner_id
+                              from hs_import_resources s where s.created order by s.row_number""",
+                           (self.__user_id,))
+
+    def __import_privileges(self, kind):
+        """
+        PRIVATE: resolve the grantors and privileges of staged memberships or grants
+        """
+        self.__cur.execute("update hs_import_" + kind + """ s set user_id=u.user_id from users u
+                              where s.reason is null and u.user_login=s.user_login""")
+        self.__cur.execute("update hs_import_" + kind + """ s set group_id=g.group_id from groups g
+                              where s.reason is null and g.group_uuid=s.group_uuid""")
+        self.__cur.execute("update hs_import_" + kind + """ s set grantor_id=u.user_id from users u
+                              where s.reason is null and u.user_login=s.grantor_login""")
+        self.__cur.execute("update hs_import_" + kind + """ s set grantor_id=%s
+                              where s.reason is null and s.grantor_login is null""", (self.__user_id,))
+        self.__cur.execute("update hs_import_" + kind + """ s set privilege_id=p.privilege_id from privileges p
+                              where s.reason is null and p.privilege_code=lower(trim(s.privilege_code))
+                              and p.privilege_id < 4""")
+        self.__import_reject(kind, "privilege is required", "coalesce(s.privilege_code, '') = ''")
+        self.__import_reject(kind, "privilege must be 'own', 'rw', or 'ro'", "s.privilege_id is null")
+        self.__import_reject(kind, "user does not exist", "s.user_login is not null and s.user_id is null")
+        self.__import_reject(kind, "group does not exist", "s.group_uuid is not null and s.group_id is null")
+        self.__import_reject(kind, "grantor does not exist", "s.grantor_id is null")
+
+    def __import_check_owners(self, kind, table, object_column, reason):
+        """
+        PRIVATE: reject staged grants that would leave a group or resource without owners
+
+        :type kind: basestring
+        :type table: basestring
+        :type object_column: basestring
+        :param kind: 'memberships' or 'grants'
+        :param table: the table of user grants the kind is merged into
+        :param object_column: 'group_id' or 'resource_id'
+
+        Only records that replace an active user's grant of 'own' with a lesser one can remove an
+        owner, as the database checks. Those are found first; they are rejected, all of them for
+        an object, if no active user's grant of 'own' over the object would remain or be imported.
+        """
+        self.__cur.execute("create temporary table hs_import_downgrades on commit drop as" +
+                           " select s.row_number, s." + object_column + " as object_id" +
+                           " from hs_import_" + kind + " s join " + table + " a on a." + object_column +
+                           "=s." + object_column + """ and a.user_id=s.user_id
+                              and a.assertion_user_id=s.grantor_id and a.privilege_id=1
+                              join users u on u.user_id=s.user_id and u.user_active
+                              where s.reason is null and s.privilege_id > 1""")
+        self.__cur.execute("update hs_import_" + kind + """ s set reason=%s from hs_import_downgrades d
+                              where s.row_number=d.row_number
+                              and not exists (select 1 from """ + table + " a" +
+                           " join users u on u.user_id=a.user_id and u.user_active where a." + object_column +
+                           """=d.object_id and a.privilege_id=1
+                                  and not exists (select 1 from hs_import_""" + kind + " t where t.reason is null" +
+                           " and t." + object_column + """=a.""" + object_column + """ and t.user_id=a.user_id
+                                      and t.grantor_id=a.assertion_user_id and t.privilege_id > 1))
+                              and not exists (select 1 from hs_import_""" + kind + " t" +
+                           " join users u on u.user_id=t.user_id and u.user_active where t.reason is null" +
+                           " and t." + object_column + """=d.object_id and t.privilege_id=1)""", (reason,))
+        self.__cur.execute("drop table hs_import_downgrades")
+
+    def __import_memberships(self):
+        """
+        PRIVATE: check and merge staged memberships, as share_group_with_user on behalf of their grantors
+        """
+        self.__import_reject('memberships', "group is required", "coalesce(s.group_uuid, '') = ''")
+        self.__import_reject('memberships', "user is required", "coalesce(s.user_login, '') = ''")
+        self.__import_privileges('memberships')
+        self.__import_check_unique('memberships', ('group_id', 'user_id', 'grantor_id'),
+                                   "membership appears more than once")
+        self.__cur.execute("create index on hs_import_memberships (group_id, user_id, grantor_id)")
+        self.__import_check_owners('memberships', 'user_access_to_group', 'group_id',
+                                   "would remove the last owner of the group")
+        self.__cur.execute("""insert into user_access_to_group (user_id, group_id, privilege_id, assertion_user_id)
+                              select s.user_id, s.group_id, s.privilege_id, s.grantor_id
+                              from hs_import_memberships s where s.reason is null order by s.row_number
+                              on conflict (user_id, group_id, assertion_user_id) do update
+                              set privilege_id=excluded.privilege_id, assertion_time=CURRENT_TIMESTAMP""")
+        self.__cur.execute("""insert into audit_log (event_time, actor_user_id, verb, user_id, group_id,
+                                                     privilege_id, assertion_user_id)
+                              select clock_timestamp(), %s, 'share_group_with_user', s.user_id, s.group_id,
+                                     s.privilege_id, s.grantor_id
+                              from hs_import_memberships s where s.reason is null order by s.row_number""",
+                           (self.__user_id,))
+
+    def __import_grants(self):
+        """
+        PRIVATE: check and merge staged grants, as share_resource_with_user or share_resource_with_group
+        on behalf of their grantors
+        """
+        self.__import_reject('grants', "resource is required", "coalesce(s.resource_uuid, '') = ''")
+        self.__import_reject('grants', "exactly one of user and group is required",
+                             "(coalesce(s.user_login, '') = '') = (coalesce(s.group_uuid, '') = '')")
+        self.__cur.execute("""update hs_import_grants s set resource_id=r.resource_id from resources r
+                              where s.reason is null and r.resource_uuid=s.resource_uuid""")
+        self.__import_reject('grants', "resource does not exist", "s.resource_id is null")
+        self.__import_privileges('grants')
+        self.__import_reject('grants', "groups cannot own resources", "s.group_id is not null and s.privilege_id=1")
+        self.__import_check_unique('grants', ('resource_id', 'user_id', 'group_id', 'grantor_id'),
+                                   "grant appears more than once")
+        self.__cur.execute("create index on hs_import_grants (resource_id, user_id, grantor_id)")
+        self.__import_check_owners('grants', 'user_access_to_resource', 'resource_id',
+                                   "would remove the last owner of the resource")
+        self.__cur.execute("""insert into user_access_to_resource (user_id, resource_id, privilege_id,
+                                                                   assertion_user_id)
+                              select s.user_id, s.resource_id, s.privilege_id, s.grantor_id
+                              from hs_import_grants s where s.reason is null and s.user_id is not null
+                              order by s.row_number
+                              on conflict (user_id, resource_id, assertion_user_id) do update
+                              set privilege_id=excluded.privilege_id, assertion_time=CURRENT_TIMESTAMP""")
+        self.__cur.execute("""insert into group_access_to_resource (group_id, resource_id, privilege_id,
+                                                                    assertion_user_id)
+                              select s.group_id, s.resource_id, s.privilege_id, s.grantor_id
+                              from hs_import_grants s where s.reason is null and s.group_id is not null
+                              order by s.row_number
+                              on conflict (group_id, resource_id, assertion_user_id) do update
+                              set privilege_id=excluded.privilege_id, assertion_time=CURRENT_TIMESTAMP""")
+        self.__cur.execute("""insert into audit_log (event_time, actor_user_id, verb, user_id, group_id, resource_id,
+                                                     privilege_id, assertion_user_id)
+                              select clock_timestamp(), %s,
+                                     case when s.user_id is not null then 'share_resource_with_user'
+                                          else 'share_resource_with_group' end,
+                                     s.user_id, s.group_id, s.resource_id, s.privilege_id, s.grantor_id
+                              from hs_import_grants s where s.reason is null order by s.row_number""",
+                           (self.__user_id,))
+
+    def __import_recount(self):
+        """
+        PRIVATE: bring up to date the counts that the skipped triggers would have maintained
+
+        These are the statistics and tag counts of the users whose privileges may have changed.
+        """
+        # the planner must know of the records just merged to count them quickly
+        for table in ('users', 'groups', 'resources', 'user_access_to_resource', 'user_access_to_group',
+                      'group_access_to_resource'):
+            self.__cur.execute("analyze " + table)
+        # an object may be owned only by inactive users, as after its owner is deactivated
+        self.__cur.execute("""select 1 from hs_import_resources s where s.reason is null and not exists
+                                  (select 1 from user_access_to_resource a
+                                   where a.resource_id=s.resource_id and a.privilege_id=1)
+                              union all
+                              select 1 from hs_import_groups s where s.reason is null and not exists
+                                  (select 1 from user_access_to_group a
+                                   where a.group_id=s.group_id and a.privilege_id=1)""")
+        if self.__cur.rowcount > 0:
+            raise HSAIntegrityException("Bulk import would leave a group or resource without owners")
+        self.__cur.execute("""select hs_refresh_user_statistics(array(
+                                  select owner_id from hs_import_groups where created
+                                  union select owner_id from hs_import_resources where created
+                                  union select user_id from hs_import_memberships where reason is null
+                                  union select user_id from hs_import_grants
+                                  where reason is null and user_id is not null
+                                  union select a.user_id from hs_import_grants s
+                                  join group_closure c on c.ancestor_group_id=s.group_id
+                                  join user_access_to_group a on a.group_id=c.descendant_group_id
+                                  where s.reason is null)),
+                                     hs_refresh_tag_counts(array(
+                                  select user_id from hs_import_memberships where reason is null
+                                  union select user_id from hs_import_grants
+                                  where reason is null and user_id is not null
+                                  union select t.user_id from hs_import_grants s
+                                  join user_tags_of_resource t on t.resource_id=s.resource_id
+                                  where s.reason is null and s.group_id is not null))""")
+
+    ##################################################################################
+    # ACL export
+    ##################################################################################
+
+    # file -> query for its rows; text other than privilege codes is only in the dictionaries, *_uuids
+    __EXPORT_FILES = (
+        ('privileges', "select privilege_id, privilege_code from privileges"),
+        ('users', "select user_id, user_active, user_admin from users"),
+        ('user_uuids', "select user_id, user_uuid, user_login, user_name from users"),
+        ('groups', """select group_id, group_active, group_shareable, group_discoverable, group_public,
+                             group_owner_count from groups"""),
+        ('group_uuids', "select group_id, group_uuid, group_name from groups"),
+        ('resources', """select resource_id, resource_discoverable, resource_public, resource_immutable,
+                                resource_published, resource_shareable, resource_owner_count from resources"""),
+        ('resource_uuids', "select resource_id, resource_uuid, resource_path, resource_title from resources"),
+        ('user_access_to_resource', """select user_id, resource_id, privilege_id, assertion_user_id as grantor_id,
+                                              assertion_time from user_access_to_resource"""),
+        ('user_access_to_group', """select user_id, group_id, privilege_id, assertion_user_id as grantor_id,
+                                           assertion_time from user_access_to_group"""),
+        ('group_access_to_resource', """select group_id, resource_id, privilege_id, assertion_user_id as grantor_id,
+                                               assertion_time from group_access_to_resource"""),
+        ('group_access_to_group', """select group_id, member_group_id, assertion_user_id as grantor_id,
+                                            assertion_time from group_access_to_group"""),
+        ('cumulative_user_resource_privilege',
+         "select user_id, resource_id, privilege_id from cumulative_user_resource_privilege"),
+        ('cumulative_user_group_privilege',
+         "select user_id, group_id, privilege_id from cumulative_user_group_privilege"),
+        ('cumulative_group_resource_privilege',
+         "select group_id, resource_id, privilege_id from cumulative_group_resource_privilege"),
+    )
+
+    @__reads
+    def export_acl(self, directory, compresslevel=6):
+        """
+        Export all users, groups, resources, and privileges to gzipped CSV files (administrators only)
+
+        :type directory: basestring
+        :type compresslevel: int
+        :param directory: existing directory in which to write the files
+        :param compresslevel: gzip compression level, from 1 (fastest) to 9 (smallest)
+        :return: dict from the name of each file written, without '.csv.gz', to its number of rows
+        :rtype: dict
+
+        Each file is CSV with a header, named for what it holds, e.g., users.csv.gz. Users, groups,
+        and resources are identified by integer ids. Their uuids, logins, names, titles, and paths
+        are in the dictionaries user_uuids, group_uuids, and resource_uuids, and the codes of
+        privilege ids are in privileges. Besides the grants (user_access_to_resource,
+        user_access_to_group, group_access_to_resource, and group_access_to_group), the files
+        cumulative_user_resource_privilege, cumulative_user_group_privilege, and
+        cumulative_group_resource_privilege hold the privilege of each user over each resource
+        and group, and of each group over each resource, as privilege checks decide it.
+
+        Every file is read from one snapshot of the database, so that the files agree with one
+        another. Rows are streamed from the database to the files, so memory does not grow with
+        their size. Existing files are overwritten. This requires the postgres backend.
+        """
+        if self.__backend is not _backends['postgres']:
+            raise HSAUsageException("ACL export requires the postgres backend")
+        if not isinstance(directory, basestring) or not os.path.isdir(directory):
+            raise HSAUsageException("directory does not exist")
+        if not self.user_is_admin():
+            raise HSAccessException("User is not an administrator")
+        conn = self.__cur.connection
+        autocommit = conn.autocommit
+        conn.rollback()
+        self.__cur.execute(("begin" if autocommit else "set transaction") +
+                           " isolation level repeatable read, read only")
+        rows = {}
+        try:
+            for name, query in self.__EXPORT_FILES:
+                sink = _ExportSink(os.path.join(directory, name + '.csv.gz'), compresslevel)
+                try:
+                    self.__cur.copy_expert("copy (" + query + ") to stdout with (format csv, header)", sink)
+                finally:
+                    sink.close()
+                rows[name] = self.__cur.rowcount
+        finally:
+            if autocommit:
+                self.__cur.execute("rollback")
+            else:
+                conn.rollback()
+        return rows
+
+    ##################################################################################
+    # audit log
+    ##################################################################################
+
+    @__reads
+    def get_resource_history(self, resource_uuid, since=None, until=None):
+        """
+        List the changes made to a resource, including after it has been retracted
+
+        :type resource_uuid: basestring
+        :type since: datetime.datetime
+        :type until: datetime.datetime
+        :param resource_uuid: uuid of resource
+        :param since: earliest time of interest; omit for all history
+        :param until: time before which events are of interest; omit for the present
+        :return: list of events, oldest first, as returned by get_user_actions
+        :rtype: list
+
+        Restrictions:
+
+        1. Only the owner of the resource or an administrator can do this.
+
+        2. Only an administrator can see the history of a resource that has been retracted.
+        """
+        resource_id = self.__get_audited_resource_id(resource_uuid)
+        return self.__get_audit_events('e.resource_id=%s', resource_id, since, until)
+
+    def __get_audited_resource_id(self, resource_uuid):
+        """
+        PRIVATE: get the id of a resource whose history the current user may see
+
+        :type resource_uuid: basestring
+        :param resource_uuid: uuid of resource, which may have been retracted
+        :return: internal id of resource
+        :rtype: int
+
+        Owners and administrators may see the history of a resource; only administrators
+        may see the history of a resource that has been retracted.
+        """
+        if not isinstance(resource_uuid, basestring):
+            raise HSAUsageException("resource_uuid is not a string")
+        if self.resource_exists(resource_uuid):
+            if not self.user_is_admin() and not self.resource_is_owned(resource_uuid):
+                raise HSAccessException("Regular user must own resource")
+            return self.__get_resource_id_from_uuid(resource_uuid)
+        if not self.user_is_admin():
+            raise HSAccessException("User is not an administrator")
+        self.__cur.execute("""select resource_id from audit_log
+                              where verb='retract_resource' and detail=%s""", (resource_uuid,))
+        if self.__cur.rowcount < 1:
+            raise HSAUsageException("Resource uuid does not exist")
+        return self.__cur.fetchone()['resource_id']
+
+    @__reads
+    def get_user_actions(self, user_uuid=None, since=None, until=None):
+        """
+        List the changes made by a user
+
+        :type user_uuid: basestring
+        :type since: datetime.datetime
+        :type until: datetime.datetime
+        :param user_uuid: uuid of user; omit for current user
+        :param since: earliest time of interest; omit for all history
+        :param until: time before which events are of interest; omit for the present
+        :return: list of events, oldest first
+        :rtype: list
+
+        Each event is a dict of the form::
+
+            {
+                'time': *when the change was committed*,
+                'verb': *name of the routine that made the change, e.g., 'share_resource_with_user'*,
+                'actor': *uuid of user making the change*,
+                'user': *uuid of affected user, or None*,
+                'group': *uuid of affected group, or None*,
+                'member_group': *uuid of group made a member of 'group', or None*,
+                'resource': *uuid of affected resource, or None*,
+                'privilege': *privilege code granted, or None*,
+                'asserter': *uuid of user whose grant or invitation changed, or None*,
+                'flags': *letters for flags asserted, or None*,
+                'detail': *uuid asserted or retracted, or folder or tag name, or None*
+            }
+
+        Flag letters are 'a' active, 'A' admin, 's' shareable, 'd' discoverable, 'p' public,
+        'i' immutable, and 'P' published. Groups and resources that have since been retracted
+        are reported as None.
+
+        Restrictions:
+
+        1. Only the user in question or an administrator can do this.
+        """
+        if user_uuid is None:
+            user_uuid = self.get_uuid()
+        if not isinstance(user_uuid, basestring):
+            raise HSAUsageException("user_uuid is not a string")
+        if user_uuid != self.get_uuid() and not self.user_is_admin():
+            raise HSAccessException("User is not an administrator")
+        user_id = self.__get_user_id_from_uuid(user_uuid)
+        return self.__get_audit_events('e.actor_user_id=%s', user_id, since, until)
+
+    @__writes
+    def checkpoint_audit_log(self):
+        """
+        Record the current state of privilege for point-in-time queries (administrators only)
+
+        :return: time of the checkpoint
+        :rtype: datetime.datetime
+
+        get_cumulative_user_privilege_over_resource_at replays the audit log from the latest
+        checkpoint before the time in question, so this should be run periodically, e.g., weekly,
+        to bound that replay. Changes wait while the checkpoint is taken.
+        """
+        if not self.user_is_admin():
+            raise HSAccessException("User is not an administrator")
+        checkpoint_time = self.__backend.checkpoint_audit_log(self.__cur)
+        self.__audit('checkpoint_audit_log')
+        self.__commit()
+        return checkpoint_time
+
+    @__reads
+    def get_cumulative_user_privilege_over_resource_at(self, resource_uuid, user_uuid, timestamp):
+        """
+        Get privilege code for user over a resource as it was at a past time
+
+        :type resource_uuid: basestring
+        :type user_uuid: basestring
+        :type timestamp: datetime.datetime
+        :param resource_uuid: uuid of resource, which may have been retracted since
+        :param user_uuid: uuid of user
+        :param timestamp: time of interest
+        :return: one of 'own', 'rw', 'ro', or 'none', as in get_cumulative_user_privilege_over_resource
+        :rtype: basestring
+
+        Privilege is reconstructed from the latest checkpoint (see checkpoint_audit_log) at or
+        before the time of interest plus the changes logged between the two, and accounts for
+        groups, resource flags, and users and groups that were inactive at the time.
+
+        Restrictions:
+
+        1. Only the owner of the resource or an administrator can do this.
+
+        2. Only an administrator can ask about a resource that has been retracted.
+        """
+        if not isinstance(user_uuid, basestring):
+            raise HSAUsageException("user_uuid is not a string")
+        resource_id = self.__get_audited_resource_id(resource_uuid)
+        user_id = self.__get_user_id_from_uuid(user_uuid)
+        pnum = self.__replay_privilege(self.__get_privilege_events_at(resource_id, user_id, timestamp),
+                                       resource_id, user_id)
+        return self.__PRIVILEGE_CODES[pnum-1]
+
+    def __get_privilege_events_at(self, resource_id, user_id, timestamp):
+        """
+        PRIVATE: list the assertions that determine privilege of a user over a resource at a time
+
+        :type resource_id: int
+        :type user_id: int
+        :param resource_id: id of resource
+        :param user_id: id of user
+        :param timestamp: time of interest
+        :return: rows of the latest checkpoint at or before the time, then later events in order
+        :rtype: list
+
+        These are the assertions about the resource and the user, all group nesting, and the
+        flags of the groups involved.
+        """
+        columns = """verb, assertion_user_id, user_id, group_id, resource_id, member_group_id,
+                     privilege_id, flags"""
+        self.__cur.execute("""select checkpoint_id, checkpoint_time from audit_checkpoints
+                              where checkpoint_time <= %s
+                              order by checkpoint_time desc limit 1""", (timestamp,))
+        checkpoint = self.__cur.fetchone()
+        state = []
+        since = ""
+        args = [timestamp]
+        if checkpoint is not None:
+            self.__cur.execute("select " + columns + """ from audit_checkpoint_state
+                                  where checkpoint_id=%s
+                                  and (resource_id=%s or user_id=%s or verb='share_group_with_group')""",
+                               (checkpoint['checkpoint_id'], resource_id, user_id))
+            state = self.__cur.fetchall()
+            since = " and event_time >= %s"
+            args.append(checkpoint['checkpoint_time'])
+        self.__cur.execute("select " + columns + """, event_time, event_id from audit_log
+                              where (resource_id=%s or user_id=%s
+                                     or verb in ('share_group_with_group', 'unshare_group_with_group'))
+                              and event_time <= %s""" + since,
+                           [resource_id, user_id] + args)
+        events = self.__cur.fetchall()
+
+        # whether groups were active
+        group_ids = set()
+        for row in state + events:
+            group_ids.update(g for g in (row['group_id'], row['member_group_id']) if g is not None)
+        group_ids = list(group_ids)
+        if group_ids:
+            if checkpoint is not None:
+                self.__cur.execute("select " + columns + """ from audit_checkpoint_state
+                                      where checkpoint_id=%s and group_id in """ + self.__in_list(group_ids) +
+                                   " and verb='assert_group'",
+                                   [checkpoint['checkpoint_id']] + group_ids)
+                state += self.__cur.fetchall()
+            self.__cur.execute("select " + columns + """, event_time, event_id from audit_log
+                                  where group_id in """ + self.__in_list(group_ids) + """
+                                  and verb in ('assert_group', 'retract_group')
+                                  and event_time <= %s""" + since,
+                               group_ids + args)
+            events += self.__cur.fetchall()
+        return state + sorted(events, key=lambda row: (row['event_time'], row['event_id']))
+
+    def __replay_privilege(self, events, resource_id, user_id):
+        """
+        PRIVATE: compute cumulative privilege of a user over a resource from assertions
+
+        :type events: list
+        :type resource_id: int
+        :type user_id: int
+        :param events: assertions in order, as from __get_privilege_events_at
+        :param resource_id: id of resource
+        :param user_id: id of user
+        :return: privilege id, as computed by the view cumulative_user_resource_privilege
+        :rtype: int
+        """
+        user_active = False
+        resource_flags = None           # None if the resource does not exist
+        user_grants = {}                # asserting user -> privilege
+        group_grants = {}               # group -> asserting user -> privilege
+        memberships = set()             # groups of user
+        groups_active = {}              # group -> whether active
+        nesting = set()                 # (group, member group)
+        for row in events:
+            verb = row['verb']
+            group_id = row['group_id']
+            on_resource = row['resource_id'] == resource_id
+            for_user = row['user_id'] == user_id
+            if verb == 'assert_user' and for_user:
+                user_active = 'a' in row['flags']
+            elif verb == 'assert_group':
+                groups_active[group_id] = 'a' in row['flags']
+            elif verb == 'retract_group':
+                groups_active.pop(group_id, None)
+                group_grants.pop(group_id, None)
+                memberships.discard(group_id)
+                nesting = set(edge for edge in nesting if group_id not in edge)
+            elif verb == 'assert_resource' and on_resource:
+                resource_flags = row['flags']
+            elif verb == 'retract_resource' and on_resource:
+                resource_flags = None
+                user_grants = {}
+                group_grants = {}
+            elif verb == 'share_resource_with_user' and on_resource and for_user:
+                user_grants[row['assertion_user_id']] = row['privilege_id']
+            elif verb == 'unshare_resource_with_user' and on_resource and for_user:
+                user_grants = {}
+            elif verb == 'share_resource_with_group' and on_resource:
+                group_grants.setdefault(group_id, {})[row['assertion_user_id']] = row['privilege_id']
+            elif verb == 'unshare_resource_with_group' and on_resource:
+                group_grants.pop(group_id, None)
+            elif verb == 'share_group_with_user' and for_user:
+                memberships.add(group_id)
+            elif verb == 'unshare_group_with_user' and for_user:
+                memberships.discard(group_id)
+            elif verb == 'share_group_with_group':
+                nesting.add((group_id, row['member_group_id']))
+            elif verb == 'unshare_group_with_group':
+                nesting.discard((group_id, row['member_group_id']))
+
+        if resource_flags is None:
+            return self.__PRIVILEGE_NONE
+        grants = []
+        if user_active:
+            grants.extend(user_grants.values())
+            member_of = set(g for g in memberships if groups_active.get(g, False))
+            for group_id, privileges in group_grants.items():
+                if groups_active.get(group_id, False) and member_of & self.__get_nested_groups(group_id, nesting):
+                    grants.extend(privileges.values())
+        if grants:
+            pnum = min(grants)
+            if ('i' in resource_flags or 'P' in resource_flags) and pnum < self.__PRIVILEGE_RO:
+                return self.__PRIVILEGE_RO
+        else:
+            pnum = self.__PRIVILEGE_NONE
+        if 'p' in resource_flags and pnum > self.__PRIVILEGE_RO:
+            return self.__PRIVILEGE_RO
+        return pnum
+
+    @staticmethod
+    def __get_nested_groups(group_id, nesting):
+        """
+        PRIVATE: find a group and the groups it contains, as group_closure does
+
+        :type group_id: int
+        :type nesting: set
+        :param group_id: id of group
+        :param nesting: set of (group, member group) pairs
+        :return: ids of group and all groups it contains
+        :rtype: set
+        """
+        found = set([group_id])
+        frontier = [group_id]
+        while frontier:
+            parent = frontier.pop()
+            for group, member in nesting:
+                if group == parent and member not in found:
+                    found.add(member)
+                    frontier.append(member)
+        return found
+
+    def __get_audit_events(self, condition, subject_id, since, until):
+        """
+        PRIVATE: read events from the audit log
+
+        :type condition: basestring
+        :type subject_id: int
+        :param condition: SQL condition selecting events by subject_id; must match an audit_log index
+        :param subject_id: id of the subject of interest
+        :param since: earliest time of interest, or None
+        :param until: time before which events are of interest, or None
+        :return: list of events, oldest first
+        :rtype: list
+
+        The time range lets the database skip partitions outside it.
+        """
+        query = """select e.event_time, e.verb, a.user_uuid as actor, u.user_uuid, g.group_uuid,
+                          mg.group_uuid as member_group, r.resource_uuid, p.privilege_code,
+                          s.user_uuid as asserter, e.flags, e.detail
+                   from audit_log e
+                   left join users a on a.user_id=e.actor_user_id
+                   left join users u on u.user_id=e.user_id
+                   left join groups g on g.group_id=e.group_id
+                   left join groups mg on mg.group_id=e.member_group_id
+                   left join resources r on r.resource_id=e.resource_id
+                   left join privileges p on p.privilege_id=e.privilege_id
+                   left join users s on s.user_id=e.assertion_user_id
+                   where """ + condition
+        args = [subject_id]
+        if since is not None:
+            query += " and e.event_time >= %s"
+            args.append(since)
+        if until is not None:
+            query += " and e.event_time < %s"
+            args.append(until)
+        self.__cur.execute(query + " order by e.event_time, e.event_id", args)
+        return [{'time': row['event_time'],
+                 'verb': row['verb'],
+                 'actor': row['actor'],
+                 'user': row['user_uuid'],
+                 'group': row['group_uuid'],
+                 'member_group': row['member_group'],
+                 'resource': row['resource_uuid'],
+                 'privilege': row['privilege_code'],
+                 'asserter': row['asserter'],
+                 'flags': row['flags'],
+                 'detail': row['detail']} for row in self.__cur.fetchall()]
 
     ##################################################################################
     # quick utility routines for obtaining current user information
@@ -4181,6 +8061,7 @@ class HSAccessCore(object):
     # reset everything for testing
     #################################################
 
+    @__writes
     def __global_reset(self, are_you_sure):
         """
         PRIVATE: Delete all data from the database except for starting situation, for testing.
@@ -4193,23 +8074,31 @@ class HSAccessCore(object):
         """
         if self.user_is_admin():
             if are_you_sure == "yes, I'm sure":
+                # resources and groups are briefly without owners, unless they go first
+                self.__backend.defer_constraints(self.__cur)
                 self.__cur.execute("delete from user_tags_of_resource")
                 self.__cur.execute("delete from user_folder_of_resource")
-                self.__cur.execute("delete from group_access_to_resource")
                 # self.__cur.execute("delete from user_membership_in_group")
                 self.__cur.execute("delete from user_invitations_to_resource")
                 self.__cur.execute("delete from user_invitations_to_group")
+                self.__cur.execute("delete from group_access_to_group")
+                self.__cur.execute("delete from groups")
+                self.__cur.execute("delete from resources")
+                self.__cur.execute("delete from group_access_to_resource")
                 self.__cur.execute("delete from user_access_to_group")
                 self.__cur.execute("delete from user_access_to_resource")
                 self.__cur.execute("delete from user_folders")
                 self.__cur.execute("delete from user_tags")
-                self.__cur.execute("delete from groups")
-                self.__cur.execute("delete from resources")
                 self.__cur.execute("delete from users where user_id != 1")
-                self.__conn.commit()
+                self.__backend.clear_audit_log(self.__cur)
+                self.__cur.execute("delete from audit_checkpoints")
+                self.__commit()
         else:
             raise HSAccessException("User is not an administrator")
 
+    # routing markers are only used while defining this class
+    del __reads, __writes
+
 ############################################################
 # class encapsulates all access control actions, including convenience functions
 # Members of this class that are not inherited do not contact iRODS directly
@@ -4219,9 +8108,12 @@ class HSAccess(HSAccessCore):
     Access control class for HydroShare Users, Resources, and Groups
     """
     def __init__(self, irods_user, irods_password,
-                 db_database, db_user, db_password, db_host, db_port):
+                 db_database, db_user, db_password, db_host, db_port,
+                 pool=None, memoize=False, replicas=None, backend='postgres', denial_filter=False):
         HSAccessCore.__init__(self, irods_user, irods_password,
-                              db_database, db_user, db_password, db_host, db_port)
+                              db_database, db_user, db_password, db_host, db_port,
+                              pool=pool, memoize=memoize, replicas=replicas, backend=backend,
+                              denial_filter=denial_filter)
 
     def __del__(self):
         HSAccessCore.__del__(self)
@@ -1,8 +1,55 @@
 __author__ = 'Alva'
 import HSAlib
+import HSAQueryBudgets
+import HSAccessObjects
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import psycopg2
+import psycopg2.pool
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
 import unittest
 from pprint import pprint
 
+# backend to test (from HSA_TEST_BACKEND): 'postgres', the default, or 'sqlite'
+BACKEND = os.environ.get('HSA_TEST_BACKEND', 'postgres')
+# database to test against: name (from HSA_TEST_DATABASE), user, password, host, and port.
+# HSAParallelTests gives each of its workers a copy of its own. For SQLite, the name is that of
+# a file, which setUpModule makes afresh from db/database.sqlite.
+if BACKEND == 'sqlite':
+    DATABASE = (os.environ.get('HSA_TEST_DATABASE', os.path.join(tempfile.gettempdir(), 'hs_test.db')),
+                None, None, None, None)
+else:
+    DATABASE = (os.environ.get('HSA_TEST_DATABASE', 'acouch'), 'acouch', 'xyzzy', 'localhost', '5432')
+
+# tests of what only the postgres backend offers: pools, replicas, denial filters, and the like
+postgres_only = unittest.skipUnless(BACKEND == 'postgres', "requires the postgres backend")
+
+
+def setUpModule():
+    if BACKEND == 'sqlite':
+        for path in (DATABASE[0], DATABASE[0] + '-wal', DATABASE[0] + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+        db = sqlite3.connect(DATABASE[0])
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'db', 'database.sqlite')) as f:
+            db.executescript(f.read())
+        db.close()
+    # every call the tests make must stay within the budget of statements of its method
+    HSAQueryBudgets.install()
+
+
+def tearDownModule():
+    HSAQueryBudgets.uninstall()
+
 
 def startup(login):
     """ log into the access control system (without password)
@@ -10,7 +57,7 @@ def startup(login):
     :param login: login name to use for user
     :return:
     """
-    return HSAlib.HSAccess(login, 'unused', 'acouch', 'acouch', 'xyzzy', 'localhost', '5432')
+    return HSAlib.HSAccess(login, 'unused', *DATABASE, backend=BACKEND)
 
 
 def match_lists(l1, l2):
@@ -1977,6 +2024,69 @@ class T11PreserveOwnership(unittest.TestCase):
             self.assertEqual(e.value, 'Cannot remove last owner of resource', 
                              "Invalid exception was '"+e.value+"'")
 
+    def test_02_unshare_last_owner(self):
+        "Cannot unshare the last owner, but can unshare one of several"
+        ha = startup('dog')
+        with self.assertRaises(HSAlib.HSAccessException) as cm:
+            ha.unshare_resource_with_user(self.scratching, self.dog)
+        self.assertEqual(cm.exception.value, 'Cannot remove only resource owner, including self')
+        with self.assertRaises(HSAlib.HSAccessException) as cm:
+            ha.unshare_group_with_user(self.felines, self.dog)
+        self.assertEqual(cm.exception.value, 'Cannot remove last group owner, including self')
+        # the session is still usable after a refusal
+        ha.share_resource_with_user(self.scratching, self.cat, 'own')
+        ha.share_group_with_user(self.felines, self.cat, 'own')
+        self.assertEqual(ha.get_number_of_resource_owners(self.scratching), 2)
+        self.assertEqual(ha.get_number_of_group_owners(self.felines), 2)
+        ha.unshare_resource_with_user(self.scratching, self.dog)
+        ha.unshare_group_with_user(self.felines, self.dog)
+        self.assertEqual(ha.get_number_of_resource_owners(self.scratching), 1)
+        self.assertEqual(ha.get_number_of_group_owners(self.felines), 1)
+        self.assertFalse(ha.resource_is_owned(self.scratching))
+        self.assertFalse(ha.group_is_owned(self.felines))
+
+    def test_03_admin_cannot_remove_last_owner(self):
+        "Administrators cannot remove the last owner either"
+        ha = startup('admin')
+        with self.assertRaises(HSAlib.HSAccessException):
+            ha.unshare_resource_with_user(self.scratching, self.dog)
+        with self.assertRaises(HSAlib.HSAccessException):
+            ha.unshare_group_with_user(self.felines, self.dog)
+        self.assertTrue(ha.resource_is_owned(self.scratching, self.dog))
+        self.assertTrue(ha.group_is_owned(self.felines, self.dog))
+
+    def test_04_inactive_co_owner(self):
+        "An inactive co-owner does not count, and the last active owner may be deactivated"
+        ha = startup('dog')
+        ha.share_resource_with_user(self.scratching, self.cat, 'own')
+        ha.share_group_with_user(self.felines, self.cat, 'own')
+        admin = startup('admin')
+        admin.make_user_not_active(self.cat)
+        self.assertEqual(ha.get_number_of_resource_owners(self.scratching), 1)
+        self.assertEqual(ha.get_number_of_group_owners(self.felines), 1)
+        with self.assertRaises(HSAlib.HSAccessException):
+            ha.unshare_resource_with_user(self.scratching, self.dog)
+        with self.assertRaises(HSAlib.HSAccessException):
+            ha.unshare_group_with_user(self.felines, self.dog)
+        with self.assertRaises(HSAlib.HSAccessException):
+            ha.share_resource_with_user(self.scratching, self.dog, 'rw')
+        self.assertTrue(ha.resource_is_owned(self.scratching))
+        self.assertTrue(ha.group_is_owned(self.felines))
+        # the inactive co-owner can be removed
+        ha.unshare_resource_with_user(self.scratching, self.cat)
+        ha.share_resource_with_user(self.scratching, self.cat, 'own')
+        admin.make_user_active(self.cat)
+        self.assertEqual(ha.get_number_of_resource_owners(self.scratching), 2)
+        self.assertEqual(ha.get_number_of_group_owners(self.felines), 2)
+        # deactivating the last active owner is allowed, and leaves no active owner
+        admin.make_user_not_active(self.cat)
+        admin.make_user_not_active(self.dog)
+        self.assertEqual(admin.get_number_of_resource_owners(self.scratching), 0)
+        self.assertEqual(admin.get_number_of_group_owners(self.felines), 0)
+        admin.make_user_active(self.dog)
+        self.assertEqual(admin.get_number_of_resource_owners(self.scratching), 1)
+        self.assertEqual(admin.get_number_of_group_owners(self.felines), 1)
+
 class T12ProgrammingErrors(unittest.TestCase):
     def setUp(self):
         ha = startup('admin')
@@ -2198,5 +2308,1542 @@ class T15CreateGroup(unittest.TestCase):
         self.assertFalse(self.ha.group_is_owned(self.meowers))
 
 
+@postgres_only
+class T16PooledSessions(unittest.TestCase):
+    def setUp(self):
+        ha = startup('admin')
+        ha._HSAccessCore__global_reset("yes, I'm sure")
+        self.cat = ha.assert_user('cat', 'not a dog', True, False)
+        self.dog = ha.assert_user('dog', 'a little arfer', True, False)
+        ha = startup('cat')
+        self.whiskers = ha.assert_resource('/cat/whiskers', 'all about whiskers')
+        ha.make_resource_not_public(self.whiskers)
+        self.pool = HSAlib.get_connection_pool(*DATABASE)
+
+    def pooled(self, login, memoize=False):
+        return HSAlib.HSAccess(login, 'unused', *DATABASE, pool=self.pool, memoize=memoize)
+
+    def test_01_pool_is_shared(self):
+        "Connection pools are shared per database"
+        self.assertIs(self.pool, HSAlib.get_connection_pool(*DATABASE))
+
+    def test_02_release_returns_connection(self):
+        "Released sessions give their connection back to the pool"
+        ha = self.pooled('cat')
+        conn = ha._HSAccessCore__conn
+        self.assertTrue(ha.resource_is_owned(self.whiskers))
+        ha.release()
+        ha.release()  # idempotent
+        self.assertIsNone(ha._HSAccessCore__conn)
+        ha = self.pooled('dog')
+        self.assertIs(ha._HSAccessCore__conn, conn)
+        self.assertFalse(ha.resource_is_readable(self.whiskers))
+        ha.release()
+
+    def test_03_memo_forgets_on_change(self):
+        "Memoized decisions are forgotten when the session changes something"
+        ha = self.pooled('cat', memoize=True)
+        self.assertFalse(ha.resource_is_readable(self.whiskers, self.dog))
+        self.assertTrue(ha.user_is_active(self.dog))
+        ha.share_resource_with_user(self.whiskers, self.dog, 'ro')
+        self.assertTrue(ha.resource_is_readable(self.whiskers, self.dog))
+        self.assertFalse(ha.resource_is_readwrite(self.whiskers, self.dog))
+        ha.release()
+
+    def test_04_unknown_user_releases_connection(self):
+        "A session for an unknown user does not keep its connection"
+        used = len(self.pool._used)
+        with self.assertRaises(HSAlib.HSAUsageException):
+            self.pooled('wombat')
+        self.assertEqual(len(self.pool._used), used)
+
+    def test_05_middleware_unregistered_user(self):
+        "The middleware gives unregistered users no session instead of failing the request"
+        import HSAtoMezzanine
+
+        class User(object):
+            def __init__(self, login):
+                self.login = login
+
+            def is_authenticated(self):
+                return True
+
+            def get_username(self):
+                return self.login
+
+        class Request(object):
+            def __init__(self, login):
+                self.user = User(login)
+
+        middleware = HSAtoMezzanine.HSAccessMiddleware(dict(zip(
+            ('NAME', 'USER', 'PASSWORD', 'HOST', 'PORT'), DATABASE)))
+        used = len(middleware.pool._used)
+        request = Request('wombat')
+        self.assertIsNone(middleware.process_request(request))
+        self.assertIsNone(request.hsaccess)
+        self.assertEqual(len(middleware.pool._used), used)
+        request = Request('cat')
+        middleware.process_request(request)
+        self.assertTrue(request.hsaccess.resource_is_owned(self.whiskers))
+        middleware.process_response(request, None)
+        self.assertIsNone(request.hsaccess)
+        self.assertEqual(len(middleware.pool._used), used)
+
+    def test_06_mixin_uses_request_session(self):
+        "Resource permissions are asked of the request's own session; requests without one are denied"
+        import HSAtoMezzanine
+        self.assertFalse(hasattr(HSAtoMezzanine, 'ha'))
+        whiskers = HSAtoMezzanine.ResourcePermissionsMixin(self.whiskers)
+        cat = HSAtoMezzanine.request(startup('cat'))
+        self.assertEqual(HSAtoMezzanine.get_user(cat), self.cat)
+        self.assertTrue(whiskers.can_view(cat))
+        self.assertTrue(whiskers.can_change(cat))
+        self.assertTrue(whiskers.can_delete(cat))
+        dog = HSAtoMezzanine.request(startup('dog'))
+        self.assertFalse(whiskers.can_view(dog))
+        self.assertFalse(whiskers.can_change(dog))
+        self.assertFalse(whiskers.can_delete(dog))
+        anonymous = HSAtoMezzanine.request(None)
+        self.assertIsNone(HSAtoMezzanine.get_user(anonymous))
+        self.assertFalse(whiskers.can_view(anonymous))
+        self.assertFalse(whiskers.can_add(anonymous))
+        self.assertFalse(whiskers.can_delete(anonymous))
+
+
+class T17Folders(unittest.TestCase):
+    def setUp(self):
+        ha = startup('admin')
+        ha._HSAccessCore__global_reset("yes, I'm sure")
+        self.cat = ha.assert_user('cat', 'not a dog', True, False)
+        self.dog = ha.assert_user('dog', 'a little arfer', True, False)
+        ha = startup('dog')
+        self.bones = ha.assert_resource('/dog/bones', 'all about bones')
+        ha.share_resource_with_user(self.bones, self.cat, 'rw')
+        self.fleas = ha.assert_resource('/dog/fleas', 'all about fleas')
+        ha.make_resource_public(self.fleas)
+        self.secret = ha.assert_resource('/dog/secret', 'a secret')
+        ha = startup('cat')
+        self.whiskers = ha.assert_resource('/cat/whiskers', 'all about whiskers')
+
+    def test_01_hierarchy(self):
+        "Folders are hierarchical and ancestors are created automatically"
+        ha = startup('cat')
+        ha.assert_folder('/pets/dogs/')
+        ha.assert_folder('pets/cats')
+        ha.assert_folder('pets')
+        self.assertEqual(ha.get_folders(), ['pets', 'pets/cats', 'pets/dogs'])
+        # folders are local to a user
+        self.assertEqual(startup('dog').get_folders(), [])
+
+    def test_02_resources_in_folders(self):
+        "Folder contents report access codes"
+        ha = startup('cat')
+        ha.assert_folder('pets/dogs')
+        ha.assert_folder('pets/cats')
+        ha.assert_folder('pets_other')
+        ha.assert_resource_in_folder(self.bones, 'pets/dogs')
+        ha.assert_resource_in_folder(self.fleas, 'pets/dogs')
+        ha.assert_resource_in_folder(self.whiskers, 'pets')
+        self.assertEqual(ha.get_resources_in_folders(), {
+            'pets': {self.whiskers: {'title': 'all about whiskers', 'access': 'own'}},
+            'pets/dogs': {self.bones: {'title': 'all about bones', 'access': 'rw'},
+                          self.fleas: {'title': 'all about fleas', 'access': 'ro'}},
+            'pets/cats': {},
+            'pets_other': {}})
+        self.assertEqual(ha.get_resources_in_folders('pets/dogs').keys(), ['pets/dogs'])
+        # '_' is not a wildcard
+        self.assertEqual(sorted(ha.get_resources_in_folders('pets').keys()), ['pets', 'pets/cats', 'pets/dogs'])
+        # moving a resource
+        ha.assert_resource_in_folder(self.bones, 'pets/cats')
+        self.assertEqual(ha.get_resources_in_folders('pets/cats')['pets/cats'].keys(), [self.bones])
+        ha.retract_resource_in_folder(self.bones, 'pets/cats')
+        self.assertEqual(ha.get_resources_in_folders('pets/cats'), {'pets/cats': {}})
+
+    def test_03_retract_subtree(self):
+        "Retracting a folder retracts its subfolders and unfiles contents"
+        ha = startup('cat')
+        ha.assert_folder('pets/dogs')
+        ha.assert_folder('pets_other')
+        ha.assert_resource_in_folder(self.bones, 'pets/dogs')
+        ha.retract_folder('pets')
+        self.assertEqual(ha.get_folders(), ['pets_other'])
+        self.assertTrue(ha.resource_exists(self.bones))
+
+    def test_04_errors(self):
+        "Folder misuse is reported"
+        ha = startup('cat')
+        with self.assertRaises(HSAlib.HSAUsageException):
+            ha.assert_folder('//')
+        with self.assertRaises(HSAlib.HSAUsageException):
+            ha.assert_resource_in_folder(self.bones, 'nowhere')
+        with self.assertRaises(HSAlib.HSAUsageException):
+            ha.retract_folder('nowhere')
+        ha.assert_folder('pets')
+        with self.assertRaises(HSAlib.HSAccessException):
+            ha.assert_resource_in_folder(self.secret, 'pets')
+        with self.assertRaises(HSAlib.HSAUsageException):
+            ha.retract_resource_in_folder(self.bones, 'pets')
+
+
+class T18Tags(unittest.TestCase):
+    def setUp(self):
+        ha = startup('admin')
+        ha._HSAccessCore__global_reset("yes, I'm sure")
+        self.cat = ha.assert_user('cat', 'not a dog', True, False)
+        self.dog = ha.assert_user('dog', 'a little arfer', True, False)
+        ha = startup('dog')
+        self.bones = ha.assert_resource('/dog/bones', 'all about bones')
+        ha.share_resource_with_user(self.bones, self.cat, 'rw')
+        self.fleas = ha.assert_resource('/dog/fleas', 'all about fleas')
+        ha.make_resource_public(self.fleas)
+        ha = startup('cat')
+        self.whiskers = ha.assert_resource('/cat/whiskers', 'all about whiskers')
+        for tag in ['fun', 'gross', 'pets']:
+            ha.assert_tag(tag)
+        ha.assert_resource_has_tag(self.bones, 'fun')
+        ha.assert_resource_has_tag(self.bones, 'pets')
+        ha.assert_resource_has_tag(self.fleas, 'gross')
+        ha.assert_resource_has_tag(self.fleas, 'pets')
+        ha.assert_resource_has_tag(self.whiskers, 'pets')
+
+    def test_01_tags(self):
+        "Tags are local to a user"
+        ha = startup('cat')
+        self.assertEqual(ha.get_tags(), ['fun', 'gross', 'pets'])
+        ha = startup('dog')
+        self.assertEqual(ha.get_tags(), [])
+        ha.assert_tag('pets')  # same name as another user's tag
+        self.assertEqual(ha.get_tags(), ['pets'])
+        self.assertEqual(ha.get_resources_by_tag(), {'pets': {}})
+
+    def test_02_resources_by_tag(self):
+        "Tagged resources report access codes"
+        ha = startup('cat')
+        tags = ha.get_resources_by_tag()
+        self.assertEqual(tags['fun'], {self.bones: {'title': 'all about bones', 'access': 'rw'}})
+        self.assertEqual(sorted(tags['pets'].keys()), sorted([self.bones, self.fleas, self.whiskers]))
+        self.assertEqual(tags['pets'][self.fleas]['access'], 'ro')
+        self.assertEqual(tags['pets'][self.whiskers]['access'], 'own')
+        self.assertEqual(ha.get_resources_by_tag('gross').keys(), ['gross'])
+        ha.retract_resource_has_tag(self.bones, 'fun')
+        self.assertEqual(ha.get_resources_by_tag('fun'), {'fun': {}})
+        ha.retract_tag('pets')
+        self.assertEqual(ha.get_tags(), ['fun', 'gross'])
+
+    def test_03_intersection(self):
+        "Resources can be selected by combinations of tags"
+        ha = startup('cat')
+        self.assertEqual(sorted(ha.get_resources_by_tags(all_of=['pets']).keys()),
+                         sorted([self.bones, self.fleas, self.whiskers]))
+        self.assertEqual(ha.get_resources_by_tags(all_of=['pets', 'fun']).keys(), [self.bones])
+        self.assertEqual(sorted(ha.get_resources_by_tags(any_of=['fun', 'gross']).keys()),
+                         sorted([self.bones, self.fleas]))
+        self.assertEqual(ha.get_resources_by_tags(all_of=['pets'], any_of=['gross', 'nothing']),
+                         {self.fleas: {'title': 'all about fleas', 'access': 'ro'}})
+        self.assertEqual(ha.get_resources_by_tags(all_of=['pets', 'nothing']), {})
+        with self.assertRaises(HSAlib.HSAUsageException):
+            ha.get_resources_by_tags()
+
+    def test_04_errors(self):
+        "Tag misuse is reported"
+        ha = startup('cat')
+        with self.assertRaises(HSAlib.HSAUsageException):
+            ha.assert_tag(' ')
+        with self.assertRaises(HSAlib.HSAUsageException):
+            ha.assert_resource_has_tag(self.bones, 'nothing')
+        with self.assertRaises(HSAlib.HSAUsageException):
+            ha.retract_resource_has_tag(self.whiskers, 'fun')
+        ha = startup('dog')
+        ha.assert_tag('mine')
+        ha.assert_resource_has_tag(self.bones, 'mine')
+        with self.assertRaises(HSAlib.HSAccessException):
+            ha.assert_resource_has_tag(self.whiskers, 'mine')
+
+    def test_05_tag_counts(self):
+        "Tag counts follow tags and privileges"
+        ha = startup('cat')
+        self.assertEqual(ha.get_tag_counts(), {'fun': 1, 'gross': 1, 'pets': 3})
+        ha.assert_tag('empty')
+        self.assertEqual(ha.get_tag_counts()['empty'], 0)
+        ha = startup('dog')
+        ha.make_resource_not_public(self.fleas)
+        ha.unshare_resource_with_user(self.bones, self.cat)
+        ha = startup('cat')
+        self.assertEqual(ha.get_tag_counts(), {'fun': 0, 'gross': 0, 'pets': 1, 'empty': 0})
+        ha = startup('dog')
+        singers = ha.assert_group('singers')
+        ha.share_resource_with_group(self.bones, singers, 'ro')
+        ha.share_group_with_user(singers, self.cat, 'ro')
+        ha = startup('cat')
+        self.assertEqual(ha.get_tag_counts()['pets'], 2)
+        ha.retract_resource_has_tag(self.whiskers, 'pets')
+        ha.retract_tag('fun')
+        self.assertEqual(ha.get_tag_counts(), {'gross': 0, 'pets': 1, 'empty': 0})
+
+    def test_06_counts_per_statement(self):
+        "A statement changing many rows brings the counts of every user it affects up to date"
+        admin = startup('admin')
+        cur = admin._HSAccessCore__cur
+        cur.execute("""update user_access_to_resource set privilege_id=3
+                       where user_id=(select user_id from users where user_login='cat')
+                       and privilege_id=2""")
+        cur.execute("""delete from user_tags_of_resource
+                       where user_id=(select user_id from users where user_login='cat')
+                       and resource_id in (select resource_id from resources
+                                           where resource_title in ('all about bones', 'all about fleas'))""")
+        self.assertEqual(cur.rowcount, 4)
+        admin._HSAccessCore__conn.commit()
+        self.assertEqual(startup('cat').get_tag_counts(), {'fun': 0, 'gross': 0, 'pets': 1})
+        self.assertEqual(admin.recount(), 0)
+
+
+class T19Statistics(unittest.TestCase):
+    def setUp(self):
+        ha = startup('admin')
+        ha._HSAccessCore__global_reset("yes, I'm sure")
+        self.cat = ha.assert_user('cat', 'not a dog', True, False)
+        self.dog = ha.assert_user('dog', 'a little arfer', True, False)
+        ha = startup('dog')
+        self.bones = ha.assert_resource('/dog/bones', 'all about bones')
+        self.fleas = ha.assert_resource('/dog/fleas', 'all about fleas')
+        self.singers = ha.assert_group('singers')
+
+    def statistics(self, user_uuid):
+        ha = startup('admin')
+        return (ha.get_number_of_resources_owned_by_user(user_uuid),
+                ha.get_number_of_resources_held_by_user(user_uuid),
+                ha.get_number_of_groups_owned_by_user(user_uuid),
+                ha.get_number_of_groups_of_user(user_uuid))
+
+    def test_01_counts_follow_privileges(self):
+        "Statistics follow sharing, group membership, and activation"
+        self.assertEqual(self.statistics(self.dog), (2, 2, 1, 1))
+        self.assertEqual(self.statistics(self.cat), (0, 0, 0, 0))
+        ha = startup('dog')
+        ha.share_resource_with_user(self.bones, self.cat, 'own')
+        ha.share_group_with_user(self.singers, self.cat, 'ro')
+        ha.share_resource_with_group(self.fleas, self.singers, 'ro')
+        self.assertEqual(self.statistics(self.cat), (1, 2, 0, 1))
+        ha.make_group_not_active(self.singers)
+        self.assertEqual(self.statistics(self.cat), (1, 1, 0, 0))
+        ha = startup('admin')
+        ha.make_user_not_active(self.cat)
+        self.assertEqual(self.statistics(self.cat), (0, 0, 0, 0))
+
+    @postgres_only
+    def test_02_recount(self):
+        "Recount repairs drifted counts"
+        ha = startup('admin')
+        self.assertEqual(ha.recount(), 0)
+        # simulate counts that drifted while maintenance was bypassed
+        ha._HSAccessCore__cur.execute("update user_statistics set resources_held=17")
+        ha._HSAccessCore__cur.execute("update resources set resource_owner_count=5")
+        ha._HSAccessCore__conn.commit()
+        self.assertEqual(ha.recount(), 5)
+        self.assertEqual(ha.get_number_of_resource_owners(self.bones), 1)
+        self.assertEqual(self.statistics(self.dog), (2, 2, 1, 1))
+        with self.assertRaises(HSAlib.HSAccessException):
+            startup('dog').recount()
+
+    @postgres_only
+    def test_03_concurrent_changes(self):
+        "Changes to one user's privileges by concurrent transactions are all counted"
+        ids = startup('admin')
+        cat = ids._HSAccessCore__get_user_id_from_uuid(self.cat)
+        dog = ids._HSAccessCore__get_user_id_from_uuid(self.dog)
+        connections = [psycopg2.connect(database=DATABASE[0], user=DATABASE[1], password=DATABASE[2],
+                                        host=DATABASE[3], port=DATABASE[4]) for _ in range(2)]
+
+        def grant(conn, resource_uuid):
+            conn.cursor().execute("""insert into user_access_to_resource
+                                       (user_id, resource_id, privilege_id, assertion_user_id)
+                                       values (%s, %s, 3, %s)""",
+                                  (cat, ids._HSAccessCore__get_resource_id_from_uuid(resource_uuid), dog))
+        try:
+            first, second = connections
+            grant(first, self.bones)
+            # the second counts cat's privileges while the first has yet to commit
+            thread = threading.Thread(target=lambda: (grant(second, self.fleas), second.commit()))
+            thread.start()
+            time.sleep(0.5)
+            first.commit()
+            thread.join()
+        finally:
+            for conn in connections:
+                conn.close()
+        self.assertEqual(self.statistics(self.cat), (0, 2, 0, 0))
+        self.assertEqual(startup('admin').recount(), 0)
+
+
+class T20Catalogs(unittest.TestCase):
+    def setUp(self):
+        ha = startup('admin')
+        ha._HSAccessCore__global_reset("yes, I'm sure")
+        self.dog = ha.assert_user('dog', 'a little arfer', True, False)
+        ha = startup('dog')
+        self.bones = ha.assert_resource('/dog/bones', 'all about bones')
+        self.fleas = ha.assert_resource('/dog/fleas', 'all about fleas')
+        self.barkers = ha.assert_group('barkers')
+
+    def test_01_catalogs_follow_changes(self):
+        "Cached catalogs change when flags and titles change"
+        ha = startup('dog')
+        self.assertEqual(ha.get_public_resources(), [])
+        ha.make_resource_public(self.fleas)
+        ha.make_resource_discoverable(self.bones)
+        self.assertEqual([r['uuid'] for r in ha.get_public_resources()], [self.fleas])
+        self.assertEqual([(r['title'], r['privilege']) for r in startup('admin').get_discoverable_resources()],
+                         [('all about bones', 'none'), ('all about fleas', 'ro')])
+        meta = ha.get_resource_metadata(self.fleas)
+        meta['title'] = 'about fleas'
+        ha.assert_resource_metadata(meta)
+        self.assertEqual(ha.get_public_resources()[0]['title'], 'about fleas')
+        self.assertEqual([g['uuid'] for g in ha.get_public_groups()], [self.barkers])
+        ha.make_group_not_public(self.barkers)
+        self.assertEqual(ha.get_public_groups(), [])
+        self.assertEqual(ha.get_discoverable_groups(), [{'uuid': self.barkers, 'name': 'barkers', 'code': 'none'}])
+
+    def test_02_catalogs_are_shared_copies(self):
+        "Sessions share one cached catalog but cannot change it"
+        ha = startup('dog')
+        ha.make_resource_public(self.fleas)
+        first = ha.get_public_resources()
+        first[0]['title'] = 'changed'
+        first.append({})
+        second = startup('admin').get_public_resources()
+        self.assertEqual(len(second), 1)
+        self.assertEqual(second[0]['title'], 'all about fleas')
+        self.assertIs(ha._HSAccessCore__get_catalog('public_resources'),
+                      startup('admin')._HSAccessCore__get_catalog('public_resources'))
+
+    def test_03_catalog_pages(self):
+        "Catalog pages are serialized as JSON"
+        ha = startup('dog')
+        ha.make_resource_public(self.bones)
+        ha.make_resource_public(self.fleas)
+        page = json.loads(ha.get_catalog_page('public_resources', 1, 1))
+        self.assertEqual(page['total'], 2)
+        self.assertEqual([r['uuid'] for r in page['items']], [self.fleas])
+        self.assertIs(ha.get_catalog_page('public_resources', 1, 1), ha.get_catalog_page('public_resources', 1, 1))
+        with self.assertRaises(HSAlib.HSAUsageException):
+            ha.get_catalog_page('everything')
+
+
+class T21Search(unittest.TestCase):
+    def setUp(self):
+        ha = startup('admin')
+        ha._HSAccessCore__global_reset("yes, I'm sure")
+        self.cat = ha.assert_user('cat', 'Felix the Cat', True, False)
+        self.dog = ha.assert_user('dog', 'Rover Dog', True, False)
+        self.doggo = ha.assert_user('doggo', 'Another Pup', True, False)
+        self.old = ha.assert_user('dodo', 'Extinct Bird', False, False)
+        ha = startup('dog')
+        self.chewies = ha.assert_resource('/dog/chewies', 'All about dog chewies')
+        self.secret = ha.assert_resource('/dog/secret', 'Dog secrets')
+        self.found = ha.assert_resource('/dog/found', 'Dog discoveries')
+        ha.make_resource_discoverable(self.found)
+        ha.make_resource_public(self.chewies)
+        self.barkers = ha.assert_group('dog barkers')
+        self.hidden = ha.assert_group('dog hideout')
+        ha.make_group_not_public(self.hidden)
+        ha.make_group_not_discoverable(self.hidden)
+
+    def test_01_search_resources(self):
+        "Resource search finds word prefixes among discoverable resources"
+        ha = startup('cat')
+        self.assertEqual(sorted(r['uuid'] for r in ha.search_resources('DOG')), sorted([self.chewies, self.found]))
+        self.assertEqual(ha.search_resources('dog che'),
+                         [{'uuid': self.chewies, 'title': 'All about dog chewies',
+                           'path': '/dog/chewies', 'privilege': 'ro'}])
+        self.assertIn(ha.search_resources('dog', limit=1)[0]['uuid'], [self.chewies, self.found])
+        self.assertEqual(ha.search_resources('?!'), [])
+        ha = startup('dog')
+        self.assertEqual(len(ha.search_resources('dog')), 3)
+        self.assertEqual(ha.search_resources('secr')[0]['privilege'], 'own')
+
+    def test_02_search_users(self):
+        "User search matches login and name prefixes of active users"
+        ha = startup('cat')
+        self.assertEqual([u['login'] for u in ha.search_users('do')], ['dog', 'doggo'])
+        self.assertEqual([u['login'] for u in ha.search_users('pup')], ['doggo'])
+        self.assertEqual([u['login'] for u in ha.search_users('the')], ['cat'])
+        self.assertEqual([u['login'] for u in ha.search_users('do', limit=1)], ['dog'])
+        self.assertEqual(ha.search_users('%'), [])
+        self.assertEqual(ha.search_users(' '), [])
+
+    def test_03_search_groups(self):
+        "Group search finds discoverable groups and the caller's own"
+        ha = startup('cat')
+        self.assertEqual(ha.search_groups('dog'), [{'uuid': self.barkers, 'name': 'dog barkers', 'code': 'ro'}])
+        ha = startup('dog')
+        self.assertEqual(sorted(g['uuid'] for g in ha.search_groups('dog')), sorted([self.barkers, self.hidden]))
+        self.assertEqual(ha.search_groups('hide')[0]['code'], 'own')
+        with self.assertRaises(HSAlib.HSAUsageException):
+            ha.search_groups('dog', limit=0)
+
+
+
+class T22EffectiveReaders(unittest.TestCase):
+    def setUp(self):
+        ha = startup('admin')
+        ha._HSAccessCore__global_reset("yes, I'm sure")
+        self.cat = ha.assert_user('cat', 'Felix the Cat', True, False)
+        self.dog = ha.assert_user('dog', 'Rover Dog', True, False)
+        self.bat = ha.assert_user('bat', 'Bat Bat', True, False)
+        self.rat = ha.assert_user('rat', 'Ratty Rat', True, False)
+        ha = startup('dog')
+        self.chewies = ha.assert_resource('/dog/chewies', 'All about dog chewies')
+        self.barkers = ha.assert_group('dog barkers')
+        ha.share_group_with_user(self.barkers, self.cat, 'rw')
+        ha.share_group_with_user(self.barkers, self.bat, 'ro')
+        ha.share_resource_with_group(self.chewies, self.barkers, 'rw')
+        ha.share_resource_with_user(self.chewies, self.cat, 'ro')
+
+    def readers(self, ha, min_privilege='ro'):
+        found = ha.get_effective_readers(self.chewies, min_privilege)
+        return found['public'], dict((r['login'], r['privilege']) for r in found['readers'])
+
+    def test_01_expansion(self):
+        "Effective readers merge direct and group grants"
+        ha = startup('dog')
+        self.assertEqual(self.readers(ha), (False, {'dog': 'own', 'cat': 'rw', 'bat': 'rw'}))
+        self.assertEqual(self.readers(ha, 'rw'), (False, {'dog': 'own', 'cat': 'rw', 'bat': 'rw'}))
+        self.assertEqual(self.readers(ha, 'own'), (False, {'dog': 'own'}))
+        with self.assertRaises(HSAlib.HSAUsageException):
+            ha.get_effective_readers(self.chewies, 'none')
+
+    def test_02_restrictions(self):
+        "Effective readers honor inactive groups and users, public and immutable flags"
+        ha = startup('dog')
+        ha.make_resource_public(self.chewies)
+        ha.make_resource_immutable(self.chewies)
+        self.assertEqual(self.readers(ha), (True, {'dog': 'ro', 'cat': 'ro', 'bat': 'ro'}))
+        self.assertEqual(self.readers(ha, 'rw'), (False, {}))
+        ha.make_group_not_active(self.barkers)
+        self.assertEqual(self.readers(ha), (True, {'dog': 'ro', 'cat': 'ro'}))
+        ha = startup('admin')
+        ha.make_user_not_active(self.cat)
+        self.assertEqual(self.readers(ha), (True, {'dog': 'ro'}))
+
+
+
+class T23AuditLog(unittest.TestCase):
+    def setUp(self):
+        ha = startup('admin')
+        ha._HSAccessCore__global_reset("yes, I'm sure")
+        self.cat = ha.assert_user('cat', 'Felix the Cat', True, False)
+        self.dog = ha.assert_user('dog', 'Rover Dog', True, False)
+
+    def test_01_resource_history(self):
+        "Resource history survives retraction"
+        ha = startup('dog')
+        chewies = ha.assert_resource('/dog/chewies', 'All about dog chewies')
+        ha.share_resource_with_user(chewies, self.cat, 'rw')
+        ha.make_resource_public(chewies)
+        history = ha.get_resource_history(chewies)
+        self.assertEqual([e['verb'] for e in history],
+                         ['assert_resource', 'share_resource_with_user',
+                          'share_resource_with_user', 'assert_resource'])
+        self.assertEqual(history[2]['user'], self.cat)
+        self.assertEqual(history[2]['privilege'], 'rw')
+        self.assertEqual(history[3]['flags'], 'sp')
+        self.assertEqual(history[3]['actor'], self.dog)
+        ha = startup('cat')
+        with self.assertRaises(HSAlib.HSAccessException):
+            ha.get_resource_history(chewies)
+        ha.unshare_resource_with_user(chewies)
+        ha = startup('dog')
+        ha.retract_resource(chewies)
+        with self.assertRaises(HSAlib.HSAccessException):
+            ha.get_resource_history(chewies)
+        ha = startup('admin')
+        history = ha.get_resource_history(chewies)
+        self.assertEqual([(e['verb'], e['actor']) for e in history[-2:]],
+                         [('unshare_resource_with_user', self.cat), ('retract_resource', self.dog)])
+        self.assertEqual(history[-1]['detail'], chewies)
+        self.assertIsNone(history[-1]['resource'])
+
+    def test_02_user_actions(self):
+        "Actions by a user can be listed by time range"
+        ha = startup('dog')
+        barkers = ha.assert_group('dog barkers')
+        ha.invite_user_to_group(barkers, self.cat, 'ro')
+        actions = ha.get_user_actions()
+        self.assertEqual([e['verb'] for e in actions],
+                         ['assert_group', 'share_group_with_user', 'invite_user_to_group'])
+        since = actions[-1]['time']
+        ha = startup('cat')
+        ha.accept_invitation_to_group(barkers, self.dog)
+        actions = ha.get_user_actions(since=since)
+        self.assertEqual([(e['verb'], e['asserter']) for e in actions],
+                         [('share_group_with_user', self.dog), ('uninvite_user_to_group', self.dog)])
+        self.assertEqual(ha.get_user_actions(until=since), [])
+        with self.assertRaises(HSAlib.HSAccessException):
+            ha.get_user_actions(self.dog)
+        ha = startup('admin')
+        self.assertEqual(len(ha.get_user_actions(self.dog)), 3)
+
+    def test_03_append_only(self):
+        "The audit log cannot be changed"
+        ha = startup('admin')
+        cur = ha._HSAccessCore__cur
+        with self.assertRaises(HSAlib._backends[BACKEND].Error):
+            cur.execute("delete from audit_log")
+        ha._HSAccessCore__conn.rollback()
+
+
+
+class T24PrivilegeAt(unittest.TestCase):
+    def setUp(self):
+        ha = startup('admin')
+        ha._HSAccessCore__global_reset("yes, I'm sure")
+        self.cat = ha.assert_user('cat', 'Felix the Cat', True, False)
+        self.dog = ha.assert_user('dog', 'Rover Dog', True, False)
+
+    def test_01_replay(self):
+        "Privilege at a past time is replayed from checkpoints and events"
+        admin = startup('admin')
+        ha = startup('dog')
+        chewies = ha.assert_resource('/dog/chewies', 'All about dog chewies')
+        ha.share_resource_with_user(chewies, self.cat, 'rw')
+        admin.checkpoint_audit_log()
+        ha.unshare_resource_with_user(chewies, self.cat)
+        barkers = ha.assert_group('dog barkers')
+        ha.share_group_with_user(barkers, self.cat, 'ro')
+        ha.share_resource_with_group(chewies, barkers, 'ro')
+        ha.make_group_not_active(barkers)
+        admin.checkpoint_audit_log()
+        ha.make_resource_public(chewies)
+        # times at which the resource's history changed
+        times = [e['time'] for e in ha.get_resource_history(chewies)]
+        self.assertEqual(len(times), 6)
+        self.assertEqual(ha.get_cumulative_user_privilege_over_resource_at(chewies, self.dog, times[1]), 'own')
+        expected = ['none', 'none', 'rw', 'none', 'ro', 'ro']
+        for when, code in zip(times, expected):
+            self.assertEqual(ha.get_cumulative_user_privilege_over_resource_at(chewies, self.cat, when), code)
+        # the group was made inactive after its share
+        later = ha.get_user_actions()[-2]['time']
+        self.assertEqual(ha.get_cumulative_user_privilege_over_resource_at(chewies, self.cat, later), 'none')
+        self.assertEqual(ha.get_cumulative_user_privilege_over_resource_at(chewies, self.cat, times[5]), 'ro')
+        self.assertEqual(ha.get_cumulative_user_privilege_over_resource(chewies, self.cat), 'ro')
+
+        ha.retract_resource(chewies)
+        with self.assertRaises(HSAlib.HSAccessException):
+            ha.get_cumulative_user_privilege_over_resource_at(chewies, self.cat, times[1])
+        now = admin.checkpoint_audit_log()
+        self.assertEqual(admin.get_cumulative_user_privilege_over_resource_at(chewies, self.cat, times[2]), 'rw')
+        self.assertEqual(admin.get_cumulative_user_privilege_over_resource_at(chewies, self.dog, now), 'none')
+
+
+
+class T25NestedGroups(unittest.TestCase):
+    def setUp(self):
+        ha = startup('admin')
+        ha._HSAccessCore__global_reset("yes, I'm sure")
+        self.cat = ha.assert_user('cat', 'Felix the Cat', True, False)
+        self.dog = ha.assert_user('dog', 'Rover Dog', True, False)
+        self.bat = ha.assert_user('bat', 'Bat Bat', True, False)
+        ha = startup('dog')
+        self.chewies = ha.assert_resource('/dog/chewies', 'All about dog chewies')
+        self.dept = ha.assert_group('dept')
+        self.lab = ha.assert_group('lab')
+        self.team = ha.assert_group('team')
+        ha.share_group_with_user(self.lab, self.cat, 'ro')
+        ha.share_group_with_user(self.team, self.bat, 'ro')
+        ha.share_resource_with_group(self.chewies, self.dept, 'rw')
+
+    def privileges(self, ha):
+        return (ha.get_cumulative_user_privilege_over_resource(self.chewies, self.cat),
+                ha.get_cumulative_user_privilege_over_resource(self.chewies, self.bat))
+
+    def test_01_nesting(self):
+        "Members of nested groups share the privileges of containing groups"
+        ha = startup('dog')
+        self.assertEqual(self.privileges(ha), ('none', 'none'))
+        ha.share_group_with_group(self.dept, self.lab)
+        ha.share_group_with_group(self.lab, self.team)
+        self.assertEqual(self.privileges(ha), ('rw', 'rw'))
+        self.assertEqual(ha.get_member_groups(self.dept), [{'uuid': self.lab, 'name': 'lab'}])
+        self.assertEqual(ha.get_number_of_resources_held_by_user(self.bat), 1)
+        readers = ha.get_effective_readers(self.chewies)['readers']
+        self.assertEqual(sorted(r['login'] for r in readers), ['bat', 'cat', 'dog'])
+        # membership in a contained group does not confer privilege over the containing group
+        self.assertFalse(ha.user_is_in_group(self.dept, self.cat))
+        with self.assertRaises(HSAlib.HSAUsageException):
+            ha.share_group_with_group(self.team, self.dept)
+        with self.assertRaises(HSAlib.HSAUsageException):
+            ha.share_group_with_group(self.team, self.team)
+        ha.make_group_not_active(self.team)
+        self.assertEqual(self.privileges(ha), ('rw', 'none'))
+        ha = startup('cat')
+        with self.assertRaises(HSAlib.HSAccessException):
+            ha.share_group_with_group(self.lab, self.team)
+
+    def test_02_paths(self):
+        "Removing one of several paths keeps membership"
+        ha = startup('dog')
+        ha.share_group_with_group(self.dept, self.lab)
+        ha.share_group_with_group(self.lab, self.team)
+        ha.share_group_with_group(self.dept, self.team)
+        ha.unshare_group_with_group(self.lab, self.team)
+        self.assertEqual(self.privileges(ha), ('rw', 'rw'))
+        ha.share_group_with_group(self.lab, self.team)
+        before = ha.get_user_actions()[-1]['time']
+        ha.retract_group(self.lab)
+        self.assertEqual(self.privileges(ha), ('none', 'rw'))
+        ha.unshare_group_with_group(self.dept, self.team)
+        self.assertEqual(self.privileges(ha), ('none', 'none'))
+        with self.assertRaises(HSAlib.HSAUsageException):
+            ha.unshare_group_with_group(self.dept, self.team)
+        self.assertEqual(ha.get_cumulative_user_privilege_over_resource_at(self.chewies, self.cat, before), 'rw')
+        startup('admin').checkpoint_audit_log()
+        self.assertEqual(ha.get_cumulative_user_privilege_over_resource_at(self.chewies, self.bat, before), 'rw')
+        self.assertEqual(ha.get_cumulative_user_privilege_over_resource_at(
+            self.chewies, self.bat, ha.get_user_actions()[-1]['time']), 'none')
+
+
+@postgres_only
+class T26ReplicaRouting(unittest.TestCase):
+    # the database serves as its own replica here; routing is observed through the cursors
+    replicas = [('localhost', '5432')]
+
+    def setUp(self):
+        ha = startup('admin')
+        ha._HSAccessCore__global_reset("yes, I'm sure")
+        self.cat = ha.assert_user('cat', 'Felix the Cat', True, False)
+        self.dog = ha.assert_user('dog', 'Rover Dog', True, False)
+        ha = startup('dog')
+        self.chewies = ha.assert_resource('/dog/chewies', 'All about dog chewies')
+
+    def used(self, cur, call):
+        """ whether call executes queries with cursor cur """
+        cur.execute("select 'marker'")
+        marker = cur.query
+        call()
+        return cur.query != marker
+
+    def test_01_routing(self):
+        "Reads go to the replica, changes and their checks to the primary"
+        ha = HSAlib.HSAccess('dog', 'unused', *DATABASE, replicas=self.replicas)
+        replica = ha._HSAccessCore__replica_cur
+        primary = ha._HSAccessCore__cur
+        self.assertIsNotNone(replica)
+        self.assertTrue(self.used(replica, lambda: ha.resource_is_readable(self.chewies, self.cat)))
+        self.assertFalse(self.used(replica, lambda: ha.share_resource_with_user(self.chewies, self.cat, 'ro')))
+        self.assertIsNotNone(ha._HSAccessCore__sticky_lsn)
+        # the change has been replayed, so reading from the replica resumes
+        self.assertTrue(self.used(replica, lambda: self.assertTrue(ha.resource_is_readable(self.chewies, self.cat))))
+        self.assertIsNone(ha._HSAccessCore__sticky_lsn)
+        # until the replica catches up, reads stay on the primary
+        ha._HSAccessCore__sticky_lsn = 'FFFFFFFF/FFFFFFFF'
+        self.assertTrue(self.used(primary, lambda: ha.get_user_privilege_over_resource(self.chewies)))
+        self.assertIn(b'pg_last_wal_replay_lsn', replica.query)
+        self.assertEqual(ha._HSAccessCore__sticky_lsn, 'FFFFFFFF/FFFFFFFF')
+
+    def test_02_fallback(self):
+        "A session without a reachable replica reads from the primary"
+        ha = HSAlib.HSAccess('cat', 'unused', *DATABASE, replicas=[('localhost', '1')])
+        self.assertIsNone(ha._HSAccessCore__replica_cur)
+        self.assertFalse(ha.resource_is_readable(self.chewies))
+        pool = HSAlib.get_connection_pool(*DATABASE)
+        ha = HSAlib.HSAccess('cat', 'unused', *DATABASE, pool=pool, replicas=self.replicas)
+        self.assertFalse(ha.resource_is_readable(self.chewies))
+        ha.release()
+        # the pool also serves primary sessions, which must not be left in autocommit
+        conns = [pool.getconn(), pool.getconn()]
+        self.assertEqual([conn.autocommit for conn in conns], [False, False])
+        for conn in conns:
+            pool.putconn(conn)
+
+
+
+class T27SQLiteBackend(unittest.TestCase):
+    # a fresh database file for each test, loaded from db/database.sqlite
+    schema = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'db', 'database.sqlite')
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'access.db')
+        db = sqlite3.connect(self.path)
+        with open(self.schema) as f:
+            db.executescript(f.read())
+        db.close()
+        ha = self.login('admin')
+        self.cat = ha.assert_user('cat', 'Felix the Cat', True, False)
+        self.dog = ha.assert_user('dog', 'Rover Dog', True, False)
+        ha = self.login('dog')
+        self.chewies = ha.assert_resource('/dog/chewies', 'All about dog chewies')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def login(self, login):
+        return HSAlib.HSAccess(login, 'unused', self.path, None, None, None, None, backend='sqlite')
+
+    def test_01_privileges(self):
+        "Privilege is the least granted, subject to resource flags"
+        dog = self.login('dog')
+        cat = self.login('cat')
+        self.assertTrue(dog.resource_is_owned(self.chewies))
+        self.assertFalse(cat.resource_is_readable(self.chewies))
+        dog.share_resource_with_user(self.chewies, self.cat, 'ro')
+        self.assertEqual(cat.get_cumulative_user_privilege_over_resource(self.chewies), 'ro')
+        barkers = dog.assert_group('dog barkers')
+        dog.share_group_with_user(barkers, self.cat, 'rw')
+        dog.share_resource_with_group(self.chewies, barkers, 'rw')
+        self.assertTrue(cat.resource_is_readwrite(self.chewies))
+        pack = dog.assert_group('dog pack')
+        dog.share_group_with_group(barkers, pack)
+        with self.assertRaises(HSAlib.HSAUsageException):
+            dog.share_group_with_group(pack, barkers)
+        dog.make_resource_immutable(self.chewies)
+        self.assertEqual(cat.get_cumulative_user_privilege_over_resource(self.chewies), 'ro')
+        dog.make_group_not_active(barkers)
+        self.assertFalse(cat.resource_is_readwrite(self.chewies))
+        self.assertIs(dog.resource_is_immutable(self.chewies), True)
+        with self.assertRaises(HSAlib.HSAccessException):
+            dog.unshare_resource_with_user(self.chewies, self.dog)
+        self.assertTrue(dog.resource_is_owned(self.chewies))
+
+    def test_02_listings(self):
+        "Search, folders, tags, and history work in SQLite"
+        dog = self.login('dog')
+        dog.make_resource_discoverable(self.chewies)
+        self.assertEqual([r['uuid'] for r in self.login('cat').search_resources('dog CHEW')], [self.chewies])
+        self.assertEqual([u['login'] for u in dog.search_users('fel')], ['cat'])
+        dog.assert_folder('toys/Ball_1')
+        dog.assert_folder('Toys/BallX1')
+        dog.assert_resource_in_folder(self.chewies, 'toys/Ball_1')
+        self.assertEqual(dog.get_folders(), ['Toys', 'Toys/BallX1', 'toys', 'toys/Ball_1'])
+        self.assertEqual(sorted(dog.get_resources_in_folders('toys')), ['toys', 'toys/Ball_1'])
+        dog.retract_folder('toys')
+        self.assertEqual(dog.get_folders(), ['Toys', 'Toys/BallX1'])
+        dog.assert_tag('chewy')
+        dog.assert_resource_has_tag(self.chewies, 'chewy')
+        self.assertEqual(list(dog.get_resources_by_tags(all_of=['chewy'], any_of=['chewy', 'soft'])),
+                         [self.chewies])
+        self.assertEqual(dog.get_tag_counts(), {'chewy': 1})
+        when = dog.get_resource_history(self.chewies)[-1]['time']
+        self.login('admin').checkpoint_audit_log()
+        dog.make_resource_not_discoverable(self.chewies)
+        self.assertEqual(dog.get_cumulative_user_privilege_over_resource_at(self.chewies, self.cat, when), 'none')
+        self.assertEqual(dog.get_number_of_resources_owned_by_user(), 1)
+
+    def test_03_usage(self):
+        "Pools, replicas, and denial filters need PostgreSQL"
+        with self.assertRaises(HSAlib.HSAUsageException):
+            HSAlib.HSAccess('dog', 'unused', self.path, None, None, None, None,
+                            replicas=[('localhost', '5432')], backend='sqlite')
+        with self.assertRaises(HSAlib.HSAUsageException):
+            HSAlib.HSAccess('dog', 'unused', self.path, None, None, None, None,
+                            denial_filter=True, backend='sqlite')
+
+    def test_04_budgets(self):
+        "Statements of SQLite sessions are counted against their budgets"
+        dog = self.login('dog')
+        with HSAQueryBudgets.statements(dog) as sent:
+            dog.resource_is_owned(self.chewies)
+        self.assertGreater(sent.count, 0)
+        admin = self.login('admin')
+        with HSAQueryBudgets.statements(admin) as sent:
+            admin.recount()
+        self.assertEqual(sent.count, HSAQueryBudgets.SQLITE_BUDGETS['HSAccessCore']['recount'])
+        with self.assertRaises(HSAlib.HSAUsageException):
+            HSAlib.HSAccess('dog', 'unused', self.path, None, None, None, None, backend='oracle')
+
+
+
+@postgres_only
+class T28PreparedStatements(unittest.TestCase):
+    def setUp(self):
+        ha = startup('admin')
+        ha._HSAccessCore__global_reset("yes, I'm sure")
+        self.cat = ha.assert_user('cat', 'Felix the Cat', True, False)
+        self.dog = ha.assert_user('dog', 'Rover Dog', True, False)
+        ha = startup('dog')
+        self.chewies = ha.assert_resource('/dog/chewies', 'All about dog chewies')
+
+    def counts(self, name):
+        return HSAlib.get_prepared_statement_statistics()[name]
+
+    def test_01_statistics(self):
+        "Checks are prepared once per connection and then executed by name"
+        ha = startup('dog')
+        ha.share_resource_with_user(self.chewies, self.cat, 'ro')
+        before = self.counts('cumulative_user_privilege_over_resource')
+        for i in range(5):
+            self.assertTrue(ha.resource_is_readable(self.chewies, self.cat))
+        after = self.counts('cumulative_user_privilege_over_resource')
+        self.assertEqual(after['executions'] - before['executions'], 5)
+        self.assertEqual(after['preparations'] - before['preparations'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 4)
+        self.assertIn(b'execute hs_cumulative_user_privilege_over_resource', ha._HSAccessCore__cur.query)
+
+    def test_02_reprepare(self):
+        "Statements the server has forgotten are prepared again"
+        ha = startup('dog')
+        self.assertFalse(ha.resource_is_readable(self.chewies, self.cat))
+        conn = ha._HSAccessCore__conn
+        conn.cursor().execute("deallocate all")
+        conn.commit()
+        before = self.counts('cumulative_user_privilege_over_resource')
+        self.assertFalse(ha.resource_is_readable(self.chewies, self.cat))
+        after = self.counts('cumulative_user_privilege_over_resource')
+        self.assertEqual(after['preparations'] - before['preparations'], 1)
+        # within a transaction, the error is reported and the next transaction recovers
+        ha.share_resource_with_user(self.chewies, self.cat, 'ro')
+        conn.cursor().execute("deallocate all")
+        with self.assertRaises(psycopg2.Error):
+            ha._HSAccessCore__execute_prepared('cumulative_user_privilege_over_resource', (0, 0))
+        conn.rollback()
+        self.assertTrue(ha.resource_is_readable(self.chewies, self.cat))
+
+
+@postgres_only
+class T29GrantTableMaintenance(unittest.TestCase):
+    def setUp(self):
+        ha = startup('admin')
+        ha._HSAccessCore__global_reset("yes, I'm sure")
+        self.cat = ha.assert_user('cat', 'Felix the Cat', True, False)
+        self.dog = ha.assert_user('dog', 'Rover Dog', True, False)
+        ha = startup('dog')
+        self.chewies = ha.assert_resource('/dog/chewies', 'All about dog chewies')
+        ha.share_resource_with_user(self.chewies, self.cat, 'ro')
+
+    def maintain(self, operation, jobs=2):
+        return HSAlib.maintain_grant_tables(*DATABASE, operation=operation, jobs=jobs)
+
+    def test_01_operations(self):
+        "Every grant table, or every partition of one, is maintained once"
+        for operation in ('vacuum', 'analyze', 'vacuum analyze', 'reindex'):
+            tables = self.maintain(operation)
+            self.assertEqual(len(tables), len(set(tables)))
+            for prefix in ('user_access_to_resource', 'group_access_to_resource'):
+                self.assertTrue([t for t in tables if t.startswith(prefix)])
+        self.assertEqual(sorted(self.maintain('analyze', jobs=1)), sorted(tables))
+        # grants are intact
+        self.assertTrue(startup('cat').resource_is_readable(self.chewies))
+
+    def test_02_usage(self):
+        "Unknown operations and job counts are refused"
+        with self.assertRaises(HSAlib.HSAUsageException):
+            self.maintain('cluster')
+        with self.assertRaises(HSAlib.HSAUsageException):
+            self.maintain('analyze', jobs=0)
+
+
+@postgres_only
+class T30DenialFilter(unittest.TestCase):
+    def setUp(self):
+        ha = startup('admin')
+        ha._HSAccessCore__global_reset("yes, I'm sure")
+        self.cat = ha.assert_user('cat', 'Felix the Cat', True, False)
+        self.dog = ha.assert_user('dog', 'Rover Dog', True, False)
+        self.bat = ha.assert_user('bat', 'Bat Bat', True, False)
+        ha = startup('dog')
+        self.chewies = ha.assert_resource('/dog/chewies', 'All about dog chewies')
+        self.dept = ha.assert_group('dept')
+        self.lab = ha.assert_group('lab')
+
+    def filtered(self, login):
+        ha = HSAlib.HSAccess(login, 'unused', *DATABASE, denial_filter=True)
+        # lookups do not wait for the filter to be built
+        ha._HSAccessCore__denial_filter.warm()
+        return ha
+
+    def eventually(self, check):
+        # notifications from other sessions arrive moments after their commit
+        deadline = time.time() + 5
+        while not check() and time.time() < deadline:
+            time.sleep(0.05)
+        return check()
+
+    def test_01_denials(self):
+        "Denials the filter is sure of are answered without querying privileges"
+        cat = self.filtered('cat')
+        self.assertFalse(cat.resource_is_readable(self.chewies))
+        queries = HSAlib.get_prepared_statement_statistics()['cumulative_user_privilege_over_resource']
+        denials = HSAlib.get_denial_filter_statistics()['denials']
+        self.assertFalse(cat.resource_is_readable(self.chewies))
+        self.assertEqual(cat.get_cumulative_user_privilege_over_resource(self.chewies), 'none')
+        self.assertEqual(HSAlib.get_prepared_statement_statistics()['cumulative_user_privilege_over_resource'],
+                         queries)
+        self.assertEqual(HSAlib.get_denial_filter_statistics()['denials'], denials + 2)
+        # privileges that are held are read from the database
+        self.assertEqual(self.filtered('dog').get_cumulative_user_privilege_over_resource(self.chewies), 'own')
+
+    def test_02_own_changes(self):
+        "A session sees its own grants at once"
+        cat = self.filtered('cat')
+        dog = self.filtered('dog')
+        self.assertFalse(cat.resource_is_readable(self.chewies))
+        dog.share_resource_with_user(self.chewies, self.cat, 'ro')
+        self.assertTrue(cat.resource_is_readable(self.chewies))
+        dog.unshare_resource_with_user(self.chewies, self.cat)
+        self.assertFalse(cat.resource_is_readable(self.chewies))
+
+    def test_03_other_changes(self):
+        "Grants made elsewhere, directly or through groups, reach the filter"
+        cat = self.filtered('cat')
+        bat = self.filtered('bat')
+        dog = startup('dog')
+        self.assertFalse(cat.resource_is_readable(self.chewies))
+        self.assertFalse(bat.resource_is_readable(self.chewies))
+        dog.share_resource_with_group(self.chewies, self.dept, 'ro')
+        dog.share_group_with_user(self.lab, self.cat, 'ro')
+        dog.share_group_with_group(self.dept, self.lab)
+        self.assertTrue(self.eventually(lambda: cat.resource_is_readable(self.chewies)))
+        dog.share_resource_with_user(self.chewies, self.bat, 'rw')
+        self.assertTrue(self.eventually(lambda: bat.resource_is_readwrite(self.chewies)))
+        dog.unshare_resource_with_user(self.chewies, self.bat)
+        dog.make_resource_public(self.chewies)
+        self.assertTrue(self.eventually(lambda: bat.resource_is_readable(self.chewies)))
+
+    def test_04_rebuild_in_batches(self):
+        "A rebuild streams every held pair, however many batches that takes"
+        dog = startup('dog')
+        bones = dog.assert_resource('/dog/bones', 'All about dog bones')
+        dog.share_resource_with_user(self.chewies, self.cat, 'ro')
+        dog.share_resource_with_user(bones, self.bat, 'ro')
+        dog.share_resource_with_group(bones, self.dept, 'ro')
+        dog.share_group_with_user(self.dept, self.cat, 'ro')
+        batch = HSAlib._DenialFilter._DenialFilter__BATCH
+        HSAlib._DenialFilter._DenialFilter__BATCH = 2
+        try:
+            denial_filter = HSAlib._DenialFilter(*DATABASE)
+            denial_filter.warm()
+        finally:
+            HSAlib._DenialFilter._DenialFilter__BATCH = batch
+        ids = startup('admin')
+        for user, resource in ((self.cat, self.chewies), (self.cat, bones), (self.bat, bones),
+                               (self.dog, self.chewies), (self.dog, bones)):
+            self.assertTrue(denial_filter.may_hold(ids._HSAccessCore__get_user_id_from_uuid(user),
+                                                   ids._HSAccessCore__get_resource_id_from_uuid(resource)))
+        self.assertFalse(denial_filter.may_hold(ids._HSAccessCore__get_user_id_from_uuid(self.bat),
+                                                ids._HSAccessCore__get_resource_id_from_uuid(self.chewies)))
+        self.assertEqual(denial_filter.rebuilds, 1)
+
+    def test_05_rebuild_in_background(self):
+        "Lookups neither wait for a rebuild nor go unanswered while it runs"
+        ids = startup('admin')
+        bat = ids._HSAccessCore__get_user_id_from_uuid(self.bat)
+        chewies = ids._HSAccessCore__get_resource_id_from_uuid(self.chewies)
+        denial_filter = HSAlib._DenialFilter(*DATABASE)
+        # the first lookup starts a rebuild and is answered at once
+        self.assertTrue(denial_filter.may_hold(bat, chewies))
+        denial_filter.warm()
+        self.assertEqual(denial_filter.rebuilds, 1)
+        started = threading.Event()
+        release = threading.Event()
+        rebuild = denial_filter._DenialFilter__rebuild
+
+        def held_rebuild():
+            started.set()
+            release.wait()
+            rebuild()
+        denial_filter._DenialFilter__rebuild = held_rebuild
+        denial_filter._DenialFilter__built = 0  # too old
+        try:
+            self.assertFalse(denial_filter.may_hold(bat, chewies))
+            self.assertTrue(started.wait(5))
+            self.assertFalse(denial_filter.may_hold(bat, chewies))
+            self.assertEqual(denial_filter.rebuilds, 1)
+        finally:
+            release.set()
+        denial_filter.warm()
+        self.assertEqual(denial_filter.rebuilds, 2)
+        self.assertFalse(denial_filter.may_hold(bat, chewies))
+
+
+@postgres_only
+class T31SingleFlight(unittest.TestCase):
+    def setUp(self):
+        ha = startup('admin')
+        ha._HSAccessCore__global_reset("yes, I'm sure")
+        self.cat = ha.assert_user('cat', 'Felix the Cat', True, False)
+        self.dog = ha.assert_user('dog', 'Rover Dog', True, False)
+        ha = startup('dog')
+        self.chewies = ha.assert_resource('/dog/chewies', 'All about dog chewies')
+        ha.share_resource_with_user(self.chewies, self.cat, 'ro')
+        # holding this lock keeps privilege questions in flight until it is released
+        self.blocker = psycopg2.connect(database=DATABASE[0], user=DATABASE[1], password=DATABASE[2],
+                                        host=DATABASE[3], port=DATABASE[4])
+
+    def tearDown(self):
+        self.blocker.close()
+
+    def block(self):
+        self.blocker.cursor().execute("LOCK TABLE user_access_to_resource IN ACCESS EXCLUSIVE MODE")
+
+    def ask(self, sessions):
+        answers = []
+        threads = [threading.Thread(target=lambda s=s: answers.append(
+                       s.get_cumulative_user_privilege_over_resource(self.chewies)))
+                   for s in sessions]
+        for thread in threads:
+            thread.start()
+        return threads, answers
+
+    def wait_for(self, check):
+        deadline = time.time() + 5
+        while not check() and time.time() < deadline:
+            time.sleep(0.05)
+        return check()
+
+    def test_01_coalesced(self):
+        "Identical questions asked at once are answered by one query"
+        sessions = [startup('cat') for _ in range(5)]
+        before = HSAlib.get_single_flight_statistics()
+        self.block()
+        threads, answers = self.ask(sessions)
+        self.assertTrue(self.wait_for(
+            lambda: HSAlib.get_single_flight_statistics()['coalesced'] == before['coalesced'] + 4))
+        self.blocker.rollback()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(answers, ['ro'] * 5)
+        after = HSAlib.get_single_flight_statistics()
+        self.assertEqual(after['flights'], before['flights'] + 1)
+        self.assertEqual(after['coalesced'], before['coalesced'] + 4)
+
+    def test_02_after_commit(self):
+        "A question asked after a commit does not wait for one asked before it"
+        first, second = startup('cat'), startup('cat')
+        before = HSAlib.get_single_flight_statistics()
+        self.block()
+        threads, answers = self.ask([first])
+        self.assertTrue(self.wait_for(
+            lambda: HSAlib.get_single_flight_statistics()['flights'] == before['flights'] + 1))
+        startup('admin').assert_user('bat', 'Bat Bat', True, False)
+        more_threads, more_answers = self.ask([second])
+        self.assertTrue(self.wait_for(
+            lambda: HSAlib.get_single_flight_statistics()['flights'] == before['flights'] + 2))
+        self.blocker.rollback()
+        for thread in threads + more_threads:
+            thread.join()
+        self.assertEqual(answers + more_answers, ['ro', 'ro'])
+        self.assertEqual(HSAlib.get_single_flight_statistics()['coalesced'], before['coalesced'])
+
+
+class T32DecisionTrace(unittest.TestCase):
+    def setUp(self):
+        ha = startup('admin')
+        ha._HSAccessCore__global_reset("yes, I'm sure")
+        self.cat = ha.assert_user('cat', 'Felix the Cat', True, False)
+        self.dog = ha.assert_user('dog', 'Rover Dog', True, False)
+        ha = startup('dog')
+        self.chewies = ha.assert_resource('/dog/chewies', 'All about dog chewies')
+        self.bones = ha.assert_resource('/dog/bones', 'All about dog bones')
+        ha.share_resource_with_user(self.chewies, self.cat, 'ro')
+        self.tmp = tempfile.mkdtemp()
+        self.trace = os.path.join(self.tmp, 'trace')
+
+    def tearDown(self):
+        HSAlib.record_decision_trace(None)
+        shutil.rmtree(self.tmp)
+
+    def test_01_record(self):
+        "Decisions are recorded, and the trace rotates"
+        HSAlib.record_decision_trace(self.trace + '.1', max_bytes=40, backups=2)
+        cat = startup('cat')
+        for _ in range(10):
+            self.assertTrue(cat.resource_is_readable(self.chewies))
+            self.assertFalse(cat.resource_is_readable(self.bones))
+        HSAlib.record_decision_trace(None)
+        files = sorted(os.listdir(self.tmp))
+        self.assertEqual(files, ['trace.1', 'trace.1.1', 'trace.1.2'])
+        for name in files[1:]:
+            lines = open(os.path.join(self.tmp, name)).read().splitlines()
+            self.assertTrue(lines)
+            self.assertTrue(all(len(line.split()) == 2 for line in lines))
+        with self.assertRaises(HSAlib.HSAUsageException):
+            HSAlib.record_decision_trace(self.trace, max_bytes=0)
+
+    @postgres_only
+    def test_02_warm_up(self):
+        "Warming up reads the traces and prepares the pool's connections"
+        HSAlib.record_decision_trace(self.trace + '.1')
+        cat = startup('cat')
+        cat.resource_is_readable(self.chewies)
+        cat.resource_is_readable(self.bones)
+        cat.resource_is_readable(self.chewies)
+        HSAlib.record_decision_trace(None)
+        pool = psycopg2.pool.ThreadedConnectionPool(2, 4, database=DATABASE[0], user=DATABASE[1],
+                                                    password=DATABASE[2], host=DATABASE[3], port=DATABASE[4])
+        try:
+            report = HSAlib.warm_up(os.path.join(self.tmp, 'trace.*'), *DATABASE, pool=pool, denial_filter=True)
+            self.assertEqual(report, {'decisions': 2, 'granted': 1, 'connections': 2})
+            statistics = HSAlib.get_prepared_statement_statistics()
+            cats = [HSAlib.HSAccess('cat', 'unused', *DATABASE, pool=pool) for _ in range(2)]
+            for session in cats:
+                self.assertTrue(session.resource_is_readable(self.chewies))
+                session.release()
+            for name, counts in HSAlib.get_prepared_statement_statistics().items():
+                self.assertEqual(counts['preparations'], statistics[name]['preparations'])
+        finally:
+            pool.closeall()
+        # a pool that keeps no connections open lends one
+        pool = psycopg2.pool.ThreadedConnectionPool(0, 4, database=DATABASE[0], user=DATABASE[1],
+                                                    password=DATABASE[2], host=DATABASE[3], port=DATABASE[4])
+        try:
+            self.assertEqual(HSAlib.warm_up(os.path.join(self.tmp, 'trace.*'), *DATABASE, pool=pool),
+                             {'decisions': 2, 'granted': 1, 'connections': 1})
+        finally:
+            pool.closeall()
+        # no traces, nothing to warm up on
+        self.assertEqual(HSAlib.warm_up(os.path.join(self.tmp, 'none.*'), *DATABASE),
+                         {'decisions': 0, 'granted': 0, 'connections': 1})
+
+    def test_03_background_writes(self):
+        "Decisions reach the trace without stopping the recording"
+        HSAlib.record_decision_trace(self.trace)
+        startup('cat').resource_is_readable(self.chewies)
+        deadline = time.time() + 5
+        while not open(self.trace).read() and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(len(open(self.trace).read().splitlines()), 1)
+
+    @postgres_only
+    def test_04_middleware_slots(self):
+        "Workers record to a fixed set of slots, and a slot given up is used again"
+        import HSAtoMezzanine
+        database = dict(zip(('NAME', 'USER', 'PASSWORD', 'HOST', 'PORT'), DATABASE),
+                        DECISION_TRACE=self.trace, DECISION_TRACE_SLOTS=2)
+        first = HSAtoMezzanine.HSAccessMiddleware(database)
+        second = HSAtoMezzanine.HSAccessMiddleware(database)
+        HSAtoMezzanine.HSAccessMiddleware(database)  # no free slot: does not record
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['trace.0', 'trace.1', 'trace.lock.0', 'trace.lock.1'])
+        first._HSAccessMiddleware__trace_slot.close()  # as when the worker exits
+        HSAtoMezzanine.HSAccessMiddleware(database)
+        startup('cat').resource_is_readable(self.chewies)
+        HSAlib.record_decision_trace(None)
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['trace.0', 'trace.1', 'trace.lock.0', 'trace.lock.1'])
+        self.assertEqual(len(open(self.trace + '.0').read().splitlines()), 1)
+        second._HSAccessMiddleware__trace_slot.close()
+
+
+@postgres_only
+class T33BulkImport(unittest.TestCase):
+    def setUp(self):
+        ha = startup('admin')
+        ha._HSAccessCore__global_reset("yes, I'm sure")
+        self.dog = ha.assert_user('dog', 'Rover Dog', True, False)
+        self.chewies = startup('dog').assert_resource('/dog/chewies', 'All about dog chewies')
+        self.admin = ha
+
+    def stream(self, text):
+        return io.BytesIO(text.encode('utf-8'))
+
+    def test_01_csv(self):
+        "Users, groups, resources, memberships, and grants are imported together"
+        report = self.admin.bulk_import(
+            users=self.stream("login,name,admin\ncat,Felix the Cat,false\nbat,Bat,\n"),
+            groups=self.stream("uuid,name,owner,public\ngdept,dept,cat,false\n"),
+            resources=self.stream("uuid,path,title,owner\nrbones,/cat/bones,Bones,cat\n"),
+            memberships=self.stream("group,user,privilege,grantor\ngdept,bat,ro,cat\n"),
+            grants=self.stream("resource,user,group,privilege,grantor\n"
+                               + self.chewies + ",cat,,rw,dog\nrbones,,gdept,ro,cat\n"))
+        self.assertEqual(report, {'users': 2, 'groups': 1, 'resources': 1, 'memberships': 1,
+                                  'grants': 2, 'rejects': []})
+        cat = startup('cat')
+        bat = cat.get_user_uuid_from_login('bat')
+        self.assertEqual(cat.get_cumulative_user_privilege_over_resource(self.chewies), 'rw')
+        self.assertEqual(cat.get_cumulative_user_privilege_over_resource('rbones'), 'own')
+        self.assertEqual(cat.get_cumulative_user_privilege_over_resource('rbones', bat), 'ro')
+        self.assertFalse(cat.get_group_metadata('gdept')['public'])
+        self.assertEqual(cat.get_number_of_resources_owned_by_user(), 1)
+        # counts and history are as if each record had been asserted on its own
+        self.assertEqual(self.admin.recount(), 0)
+        self.assertEqual(cat.get_cumulative_user_privilege_over_resource_at('rbones', bat,
+                                                                            datetime.datetime.now()), 'ro')
+        # importing again changes nothing
+        report = self.admin.bulk_import(grants=self.stream("resource,user,privilege,grantor\n"
+                                                           + self.chewies + ",cat,rw,dog\n"))
+        self.assertEqual(report['grants'], 1)
+        self.assertEqual(self.admin.recount(), 0)
+
+    def test_02_rejects(self):
+        "Records that cannot be imported are reported by row"
+        report = self.admin.bulk_import(
+            users=self.stream('{"login": "cat", "active": true}\n'
+                              'not json\n'
+                              '{"login": "cat"}\n'
+                              '{"login": "eel", "colour": "grey"}\n'
+                              '{"login": "fox", "admin": "maybe"}\n'
+                              '\n'
+                              '{"name": "nobody"}\n'),
+            grants=self.stream('{"resource": "%s", "user": "cat", "privilege": "own"}\n'
+                               '{"resource": "%s", "group": "nowhere", "privilege": "ro"}\n'
+                               '{"resource": "nothing", "user": "cat", "privilege": "ro"}\n'
+                               '{"resource": "%s", "user": "dog", "privilege": "none"}\n'
+                               % (self.chewies, self.chewies, self.chewies)),
+            format='jsonl')
+        self.assertEqual(report['users'], 1)
+        self.assertEqual(report['grants'], 1)
+        self.assertEqual(report['rejects'], [
+            {'kind': 'users', 'row': 2, 'reason': 'not a JSON object'},
+            {'kind': 'users', 'row': 3, 'reason': 'login appears more than once'},
+            {'kind': 'users', 'row': 4, 'reason': "unknown field 'colour'"},
+            {'kind': 'users', 'row': 5, 'reason': 'admin must be true or false'},
+            {'kind': 'users', 'row': 6, 'reason': 'login is required'},
+            {'kind': 'grants', 'row': 2, 'reason': 'group does not exist'},
+            {'kind': 'grants', 'row': 3, 'reason': 'resource does not exist'},
+            {'kind': 'grants', 'row': 4, 'reason': "privilege must be 'own', 'rw', or 'ro'"}])
+        self.assertTrue(startup('cat').resource_is_owned(self.chewies))
+
+    def test_03_last_owner(self):
+        "Grants that would leave a resource without owners are rejected"
+        dog_grant = self.chewies + ",dog,rw,dog\n"
+        report = self.admin.bulk_import(grants=self.stream("resource,user,privilege,grantor\n" + dog_grant))
+        self.assertEqual(report['rejects'], [{'kind': 'grants', 'row': 1,
+                                              'reason': 'would remove the last owner of the resource'}])
+        self.assertTrue(startup('dog').resource_is_owned(self.chewies))
+        # ownership can be handed over within one import
+        report = self.admin.bulk_import(users=self.stream("login\ncat\n"),
+                                        grants=self.stream("resource,user,privilege,grantor\n" + dog_grant +
+                                                           self.chewies + ",cat,own,dog\n"))
+        self.assertEqual(report['rejects'], [])
+        self.assertFalse(startup('dog').resource_is_owned(self.chewies))
+        self.assertTrue(startup('cat').resource_is_owned(self.chewies))
+        self.assertEqual(self.admin.recount(), 0)
+
+    def test_04_usage(self):
+        "Only administrators may import, and streams must be well formed"
+        with self.assertRaises(HSAlib.HSAccessException):
+            startup('dog').bulk_import(users=self.stream("login\ncat\n"))
+        with self.assertRaises(HSAlib.HSAUsageException):
+            self.admin.bulk_import(users=self.stream("login,colour\ncat,grey\n"))
+        with self.assertRaises(HSAlib.HSAUsageException):
+            self.admin.bulk_import(users=self.stream("login\ncat,extra\n"))
+        with self.assertRaises(HSAlib.HSAUsageException):
+            self.admin.bulk_import(users=self.stream("login\ncat\n"), format='xml')
+        with self.assertRaises(HSAlib.HSAUsageException):
+            self.admin.get_user_uuid_from_login('cat')
+
+    def test_05_uuids_and_triggers(self):
+        "New users get uuids like assert_user's, and triggers work as usual after an import"
+        self.admin.bulk_import(users=self.stream("login\ncat\nbat\n"))
+        uuids = [self.admin.get_user_uuid_from_login(login) for login in ('cat', 'bat')]
+        for user_uuid in uuids:
+            self.assertTrue(re.match('^[0-9a-f]{32}$', user_uuid))
+        self.assertNotEqual(uuids[0], uuids[1])
+        startup('dog').share_resource_with_user(self.chewies, uuids[0], 'ro')
+        self.assertEqual(startup('cat').get_number_of_resources_held_by_user(), 1)
+        self.assertEqual(self.admin.recount(), 0)
+
+    def test_06_no_bypass_by_setting(self):
+        "A session cannot turn off owner counts or the last-owner check with a setting"
+        dog = startup('dog')
+        dog._HSAccessCore__cur.execute("set hs.bulk_import = 'on'")
+        with self.assertRaises(HSAlib.HSAccessException):
+            dog.unshare_resource_with_user(self.chewies, self.dog)
+        self.assertTrue(dog.resource_is_owned(self.chewies))
+        self.assertEqual(dog.get_number_of_resource_owners(self.chewies), 1)
+        self.assertEqual(self.admin.recount(), 0)
+
+
+@postgres_only
+class T34ExportACL(unittest.TestCase):
+    def setUp(self):
+        ha = startup('admin')
+        ha._HSAccessCore__global_reset("yes, I'm sure")
+        self.cat = ha.assert_user('cat', 'Felix the Cat', True, False)
+        self.dog = ha.assert_user('dog', 'Rover Dog', True, False)
+        ha = startup('dog')
+        self.chewies = ha.assert_resource('/dog/chewies', 'All about dog chewies')
+        self.bones = ha.assert_resource('/dog/bones', 'All about dog bones')
+        self.pets = ha.assert_group('pets')
+        ha.share_group_with_user(self.pets, self.cat, 'ro')
+        ha.share_resource_with_group(self.bones, self.pets, 'rw')
+        ha.share_resource_with_user(self.chewies, self.cat, 'ro')
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def read(self, name):
+        f = gzip.open(os.path.join(self.tmp, name + '.csv.gz'), 'rb')
+        try:
+            return list(csv.DictReader(f))
+        finally:
+            f.close()
+
+    def test_01_export(self):
+        "Grants and effective privileges are exported with dictionaries of uuids"
+        rows = startup('admin').export_acl(self.tmp)
+        self.assertEqual(sorted(rows), sorted(name[:-len('.csv.gz')] for name in os.listdir(self.tmp)))
+        for name, count in rows.items():
+            self.assertEqual(len(self.read(name)), count)
+        users = dict((row['user_id'], row['user_uuid']) for row in self.read('user_uuids'))
+        resources = dict((row['resource_id'], row['resource_uuid']) for row in self.read('resource_uuids'))
+        groups = dict((row['group_id'], row['group_uuid']) for row in self.read('group_uuids'))
+        codes = dict((row['privilege_id'], row['privilege_code']) for row in self.read('privileges'))
+        self.assertEqual(sorted(users.values()), sorted(['placeholderuuid0001', self.cat, self.dog]))
+        self.assertEqual(sorted(resources.values()), sorted([self.chewies, self.bones]))
+        self.assertEqual(list(groups.values()), [self.pets])
+        self.assertEqual(sorted((resources[row['resource_id']], groups[row['group_id']],
+                                 codes[row['privilege_id']], users[row['grantor_id']])
+                                for row in self.read('group_access_to_resource')),
+                         [(self.bones, self.pets, 'rw', self.dog)])
+        # effective privileges are those that privilege checks decide
+        ha = startup('admin')
+        effective = [(users[row['user_id']], resources[row['resource_id']], codes[row['privilege_id']])
+                     for row in self.read('cumulative_user_resource_privilege')]
+        self.assertEqual(len(effective), 4)
+        for user, resource, code in effective:
+            self.assertEqual(ha.get_cumulative_user_privilege_over_resource(resource, user), code)
+        self.assertIn((self.cat, self.bones, 'rw'), effective)
+        # the session is usable afterwards
+        self.assertTrue(ha.resource_is_readwrite(self.bones, self.cat))
+
+    def test_02_usage(self):
+        "Only administrators may export, to a directory that exists"
+        with self.assertRaises(HSAlib.HSAccessException):
+            startup('dog').export_acl(self.tmp)
+        with self.assertRaises(HSAlib.HSAUsageException):
+            startup('admin').export_acl(os.path.join(self.tmp, 'missing'))
+        self.assertEqual(os.listdir(self.tmp), [])
+
+
+class T35QueryBudgets(unittest.TestCase):
+    def setUp(self):
+        ha = startup('admin')
+        ha._HSAccessCore__global_reset("yes, I'm sure")
+        self.cat = ha.assert_user('cat', 'Felix the Cat', True, False)
+        self.dog = ha.assert_user('dog', 'Rover Dog', True, False)
+        ha = startup('dog')
+        self.bones = ha.assert_resource('/dog/bones', 'All about dog bones')
+
+    def tearDown(self):
+        HSAQueryBudgets.install()
+
+    def test_01_declared(self):
+        "Every public method of the session and the access objects has a budget or a reason for none"
+        for cls in HSAQueryBudgets._CLASSES:
+            budgeted = list(HSAQueryBudgets.BUDGETS[cls.__name__])
+            unbudgeted = list(HSAQueryBudgets.UNBUDGETED.get(cls.__name__, {}))
+            self.assertEqual(sorted(budgeted + unbudgeted), HSAQueryBudgets.public_methods(cls))
+
+    def test_02_warm_readable(self):
+        "A repeated privilege check of a memoizing session sends at most one statement"
+        ha = HSAlib.HSAccess('dog', 'unused', *DATABASE, memoize=True, backend=BACKEND)
+        self.assertTrue(ha.resource_is_readable(self.bones))
+        with HSAQueryBudgets.statements(ha) as sent:
+            self.assertTrue(ha.resource_is_readable(self.bones))
+        self.assertLessEqual(sent.count, 1)
+
+    def test_03_share(self):
+        "Sharing a resource stays within its budget"
+        ha = startup('dog')
+        with HSAQueryBudgets.statements(ha) as sent:
+            ha.share_resource_with_user(self.bones, self.cat, 'ro')
+        self.assertGreater(sent.count, 0)
+        self.assertLessEqual(sent.count, HSAQueryBudgets.BUDGETS['HSAccessCore']['share_resource_with_user'])
+        self.assertTrue(startup('cat').resource_is_readable(self.bones))
+
+    def test_04_capabilities(self):
+        "The capabilities of a resource object take one statement"
+        ha = startup('dog')
+        bones = HSAccessObjects.HSAccessResource(ha, self.bones)
+        with HSAQueryBudgets.statements(ha) as sent:
+            caps = bones.get_capabilities()
+        self.assertEqual(sent.count, 1)
+        self.assertIn('share_with_user', caps)
+
+    def test_05_exceeded(self):
+        "A call that sends more statements than its budget fails"
+        budgets = dict((name, dict(methods)) for name, methods in HSAQueryBudgets.BUDGETS.items())
+        budgets['HSAccessCore']['share_resource_with_user'] = 1
+        HSAQueryBudgets.install(budgets)
+        ha = startup('dog')
+        with self.assertRaises(AssertionError):
+            ha.share_resource_with_user(self.bones, self.cat, 'ro')
+        HSAQueryBudgets.install()
+        ha.share_resource_with_user(self.bones, self.cat, 'ro')
+
+    def test_06_listing(self):
+        "Listing groups and resources as objects sends as many statements for many as for one"
+        ha = startup('dog')
+        dog = HSAccessObjects.HSAccessUser(ha)
+        ha.assert_group('kennel')
+        with HSAQueryBudgets.statements(ha) as one_group:
+            self.assertEqual(len(dog.get_groups()), 1)
+        with HSAQueryBudgets.statements(ha) as one_resource:
+            self.assertEqual(len(dog.get_resources()), 1)
+        for n in range(5):
+            ha.assert_group('pack %d' % n)
+            ha.assert_resource('/dog/toy%d' % n, 'Toy %d' % n)
+        with HSAQueryBudgets.statements(ha) as groups:
+            listed = dog.get_groups()
+        self.assertEqual(len(listed), 6)
+        self.assertEqual(groups.count, one_group.count)
+        self.assertEqual(set(g.get_privilege() for g in listed), set(['own']))
+        self.assertTrue(all(g.is_member() for g in listed))
+        with HSAQueryBudgets.statements(ha) as resources:
+            listed = dog.get_resources()
+        self.assertEqual(len(listed), 6)
+        self.assertEqual(resources.count, one_resource.count)
+        self.assertEqual(set(r.get_privilege() for r in listed), set(['own']))
+
+    def test_07_summaries(self):
+        "Summaries agree with the methods that ask about one group or resource"
+        dog = startup('dog')
+        kennel = dog.assert_group('kennel', group_public=False)
+        park = dog.assert_group('park')
+        ball = dog.assert_resource('/dog/ball', 'Ball', resource_public=True)
+        dog.share_resource_with_user(self.bones, self.cat, 'rw')
+        cat = startup('cat')
+        groups = cat.get_group_summaries([kennel, park])
+        for group in (kennel, park):
+            self.assertEqual(groups[group], {
+                'metadata': cat.get_group_metadata(group),
+                'privilege': cat.get_cumulative_user_privilege_over_group(group),
+                'user_privilege': cat.get_user_privilege_over_group(group),
+                'member': cat.user_is_in_group(group)})
+        self.assertEqual(groups[park]['privilege'], 'ro')
+        resources = cat.get_resource_summaries([self.bones, ball])
+        for resource in (self.bones, ball):
+            self.assertEqual(resources[resource], {
+                'metadata': cat.get_resource_metadata(resource),
+                'privilege': cat.get_cumulative_user_privilege_over_resource(resource),
+                'user_privilege': cat.get_user_privilege_over_resource(resource)})
+        self.assertEqual(resources[ball]['privilege'], 'ro')
+        self.assertEqual(cat.get_resource_summaries([]), {})
+        with self.assertRaises(HSAlib.HSAUsageException):
+            cat.get_group_summaries([kennel, 'no-such-group'])
+
+    def test_08_other_sessions(self):
+        "Statements are counted for the sessions given, not for others in the thread"
+        dog = startup('dog')
+        cat = startup('cat')
+        with HSAQueryBudgets.statements(dog) as sent:
+            cat.get_resource_metadata(self.bones)
+            cat.get_user_metadata()
+        self.assertEqual(sent.count, 0)
+        with HSAQueryBudgets.statements(dog) as sent:
+            dog.get_resource_metadata(self.bones)
+        self.assertEqual(sent.count, 1)
+
+    def test_09_uninstall(self):
+        "uninstall() gives sessions and their connections back their own cursors"
+        HSAQueryBudgets.uninstall()
+        ha = startup('dog')
+        cur = ha._HSAccessCore__cur
+        factory = ha._HSAccessCore__conn.cursor_factory
+        HSAQueryBudgets.install()
+        ha.get_resource_metadata(self.bones)
+        self.assertIsNot(ha._HSAccessCore__cur, cur)
+        self.assertIsNot(ha._HSAccessCore__conn.cursor_factory, factory)
+        HSAQueryBudgets.uninstall()
+        self.assertIs(ha._HSAccessCore__cur, cur)
+        self.assertIs(ha._HSAccessCore__conn.cursor_factory, factory)
+        # statements() counts on its own, and puts back what it replaced
+        with HSAQueryBudgets.statements(ha) as sent:
+            ha.get_resource_metadata(self.bones)
+        self.assertEqual(sent.count, 1)
+        self.assertIs(ha._HSAccessCore__cur, cur)
+        self.assertIs(ha._HSAccessCore__conn.cursor_factory, factory)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,343 @@
+"""
+Asynchronous access to HSAccess for asyncio applications (Python 3 only).
+
+AsyncHSAccess offers the public methods of HSAlib.HSAccess as coroutines. Privilege checks and
+resource listings are answered directly through asyncpg; privilege checks made concurrently by
+many coroutines are answered together, a batch per query, so that they share a few connections.
+Every other method, including all changes, runs the synchronous library in a worker thread, so
+that access control rules and the audit log stay in one place. Each session keeps one synchronous
+HSAccess, with its own connection, for those calls.
+"""
+__author__ = 'Alva Couch'
+
+import asyncio
+import concurrent.futures
+import functools
+import threading
+import weakref
+
+import asyncpg
+
+import HSAlib
+from HSAlib import HSAUsageException
+
+
+class _PrivilegeBatcher(object):
+    """
+    PRIVATE: answer concurrent privilege lookups a batch at a time
+
+    Lookups requested during one pass of the event loop are answered by one query. While that
+    query runs, later lookups gather into the next batch, which runs on another connection.
+    """
+
+    # user privilege ignores resource flags, as does HSAccess.resource_is_owned;
+    # cumulative privilege accounts for them.
+    __QUERY = """select q.ord, r.resource_id, u.user_id, r.resource_public,
+                        (select p.privilege_id from user_resource_privilege p
+                         where p.user_id=u.user_id and p.resource_id=r.resource_id) as user_privilege,
+                        (select c.privilege_id from cumulative_user_resource_privilege c
+                         where c.user_id=u.user_id and c.resource_id=r.resource_id) as cumulative_privilege
+                 from unnest($1::varchar[], $2::varchar[]) with ordinality as q(resource_uuid, user_uuid, ord)
+                 left join resources r on r.resource_uuid=q.resource_uuid
+                 left join users u on u.user_uuid=q.user_uuid"""
+
+    def __init__(self, pool, max_batch):
+        self.__pool = pool
+        self.__max_batch = max_batch
+        self.__pending = []
+        self.__tasks = set()
+
+    def lookup(self, resource_uuid, user_uuid):
+        """
+        Look up privilege of a user over a resource
+
+        :return: future for a row with columns resource_id, user_id, resource_public,
+            user_privilege, and cumulative_privilege
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not self.__pending:
+            loop.call_soon(self.__flush)
+        self.__pending.append((resource_uuid, user_uuid, future))
+        if len(self.__pending) >= self.__max_batch:
+            self.__flush()
+        return future
+
+    def __flush(self):
+        if not self.__pending:
+            return
+        batch, self.__pending = self.__pending, []
+        task = asyncio.get_running_loop().create_task(self.__run(batch))
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+
+    async def __run(self, batch):
+        try:
+            async with self.__pool.acquire() as conn:
+                rows = await conn.fetch(self.__QUERY, [b[0] for b in batch], [b[1] for b in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for row in rows:
+            future = batch[row['ord'] - 1][2]
+            if not future.done():
+                future.set_result(row)
+
+
+class AsyncHSAccess(object):
+    """
+    Coroutine interface to HSAccess for the current user
+
+    Create one with 'connect', and make sessions for other users of the same pools with 'as_user'::
+
+        access = await AsyncHSAccess.connect('admin', 'unused', 'acouch', 'acouch', 'xyzzy',
+                                             'localhost', '5432')
+        dog = await access.as_user('dog')
+        if await dog.resource_is_readable(resource_uuid):
+            ...
+        await dog.share_resource_with_user(resource_uuid, cat_uuid, 'ro')
+        await access.close()
+
+    Methods not listed here behave exactly as the method of HSAlib.HSAccess with the same name.
+    """
+
+    # privilege codes, indexed by privilege id - 1, as in HSAccessCore
+    __PRIVILEGE_CODES = ['own', 'rw', 'ro', 'none']
+    __PRIVILEGE_RO = 3
+    __PRIVILEGE_NONE = 4
+
+    def __init__(self, irods_user, user_uuid, shared):
+        """
+        Use 'connect' or 'as_user' rather than this.
+        """
+        self.__irods_user = irods_user
+        self.__user_uuid = user_uuid
+        self.__shared = shared
+        # the synchronous session, opened by the first call that needs it
+        self.__sync = None
+        self.__sync_lock = threading.Lock()
+        shared['sessions'].add(self)
+
+    @classmethod
+    async def connect(cls, irods_user, irods_password,
+                      db_database, db_user, db_password, db_host, db_port,
+                      min_size=2, max_size=8, threads=8, max_batch=500):
+        """
+        Open pools and return a session for a user
+
+        :type irods_user: str
+        :type min_size: int
+        :type max_size: int
+        :type threads: int
+        :type max_batch: int
+        :param irods_user: login of current user
+        :param irods_password: password of current user (unused)
+        :param min_size: connections the asynchronous pool keeps open
+        :param max_size: most connections the asynchronous pool opens
+        :param threads: worker threads for methods run by HSAlib
+        :param max_batch: most privilege lookups answered by one query
+        :return: session for irods_user
+        :rtype: AsyncHSAccess
+
+        The other arguments are as for HSAlib.HSAccess.
+        """
+        pool = await asyncpg.create_pool(database=db_database, user=db_user, password=db_password,
+                                         host=db_host, port=int(db_port),
+                                         min_size=min_size, max_size=max_size)
+        shared = {
+            'pool': pool,
+            'batcher': _PrivilegeBatcher(pool, max_batch),
+            'executor': concurrent.futures.ThreadPoolExecutor(max_workers=threads),
+            'sync_args': (irods_password, db_database, db_user, db_password, db_host, db_port),
+            'sessions': weakref.WeakSet(),
+        }
+        try:
+            user_uuid = await cls.__get_user_uuid_from_login(pool, irods_user)
+        except Exception:
+            await pool.close()
+            shared['executor'].shutdown(wait=False)
+            raise
+        return cls(irods_user, user_uuid, shared)
+
+    async def as_user(self, irods_user):
+        """
+        Return a session for another user that shares this session's pools
+
+        :type irods_user: str
+        :param irods_user: login of user
+        :rtype: AsyncHSAccess
+        """
+        user_uuid = await self.__get_user_uuid_from_login(self.__shared['pool'], irods_user)
+        return AsyncHSAccess(irods_user, user_uuid, self.__shared)
+
+    async def close(self):
+        """
+        Close the pools shared by this session and those made from it with 'as_user'
+
+        The synchronous sessions of all of them are released as well.
+        """
+        loop = asyncio.get_running_loop()
+        for session in list(self.__shared['sessions']):
+            await loop.run_in_executor(self.__shared['executor'], session.__release_sync)
+        await self.__shared['pool'].close()
+        self.__shared['executor'].shutdown(wait=True)
+
+    async def release(self):
+        """
+        Give up the synchronous session of this user, and its connection
+
+        The session can still be used; its next call that runs through HSAlib opens another.
+        """
+        await asyncio.get_running_loop().run_in_executor(self.__shared['executor'], self.__release_sync)
+
+    @staticmethod
+    async def __get_user_uuid_from_login(pool, irods_user):
+        if not isinstance(irods_user, str):
+            raise HSAUsageException("user_login is not a string")
+        user_uuid = await pool.fetchval("select user_uuid from users where user_login=$1", irods_user)
+        if user_uuid is None:
+            raise HSAUsageException("User login does not exist")
+        return user_uuid
+
+    def get_uuid(self):
+        """
+        Returns the uuid of the current user
+
+        :rtype: str
+        """
+        return self.__user_uuid
+
+    def get_login(self):
+        """
+        Returns the (iRODS) login name of the current user
+
+        :rtype: str
+        """
+        return self.__irods_user
+
+    ###########################################################
+    # privilege checks, answered in batches
+    ###########################################################
+
+    async def __lookup(self, resource_uuid, user_uuid):
+        if user_uuid is None:
+            user_uuid = self.__user_uuid
+        if not isinstance(user_uuid, str):
+            raise HSAUsageException("user_uuid is not a string")
+        if not isinstance(resource_uuid, str):
+            raise HSAUsageException("resource_uuid is not a string")
+        row = await self.__shared['batcher'].lookup(resource_uuid, user_uuid)
+        if row['resource_id'] is None:
+            raise HSAUsageException("Resource uuid does not exist")
+        if row['user_id'] is None:
+            raise HSAUsageException("User uuid does not exist")
+        return row
+
+    async def __get_cumulative_privilege(self, resource_uuid, user_uuid):
+        row = await self.__lookup(resource_uuid, user_uuid)
+        if row['cumulative_privilege'] is not None:
+            return row['cumulative_privilege']
+        if row['resource_public']:
+            return self.__PRIVILEGE_RO
+        return self.__PRIVILEGE_NONE
+
+    async def get_cumulative_user_privilege_over_resource(self, resource_uuid, user_uuid=None):
+        """
+        Get privilege code for user over a resource, as HSAccess does
+
+        :rtype: str
+        """
+        pnum = await self.__get_cumulative_privilege(resource_uuid, user_uuid)
+        return self.__PRIVILEGE_CODES[pnum - 1]
+
+    async def resource_is_owned(self, resource_uuid, user_uuid=None):
+        """
+        Whether user owns resource, regardless of flags, as HSAccess does
+
+        :rtype: bool
+        """
+        row = await self.__lookup(resource_uuid, user_uuid)
+        return row['user_privilege'] is not None and row['user_privilege'] <= 1
+
+    async def resource_is_readwrite(self, resource_uuid, user_uuid=None):
+        """
+        Whether user can change resource, as HSAccess does
+
+        :rtype: bool
+        """
+        return await self.__get_cumulative_privilege(resource_uuid, user_uuid) <= 2
+
+    async def resource_is_readable(self, resource_uuid, user_uuid=None):
+        """
+        Whether user can read resource, as HSAccess does
+
+        :rtype: bool
+        """
+        return await self.__get_cumulative_privilege(resource_uuid, user_uuid) <= self.__PRIVILEGE_RO
+
+    ###########################################################
+    # listings
+    ###########################################################
+
+    async def get_resources_held_by_user(self, user_uuid=None):
+        """
+        Make a list of resources held by user, as HSAccess does
+
+        :rtype: list
+        """
+        if user_uuid is None:
+            user_uuid = self.__user_uuid
+        if not isinstance(user_uuid, str):
+            raise HSAUsageException("user_uuid is not a string")
+        async with self.__shared['pool'].acquire() as conn:
+            user_id = await conn.fetchval("select user_id from users where user_uuid=$1", user_uuid)
+            if user_id is None:
+                raise HSAUsageException("User uuid does not exist")
+            rows = await conn.fetch("""select distinct r.resource_uuid, r.resource_title, r.resource_path,
+                                              p.privilege_code
+                                       from user_resource_privilege u
+                                       left join resources r on r.resource_id = u.resource_id
+                                       left join privileges p on p.privilege_id = u.privilege_id
+                                       where user_id=$1 order by r.resource_uuid""", user_id)
+        return [{'uuid': row['resource_uuid'],
+                 'title': row['resource_title'],
+                 'path': row['resource_path'],
+                 'privilege': row['privilege_code']} for row in rows]
+
+    ###########################################################
+    # everything else, through HSAlib
+    ###########################################################
+
+    def __call_sync(self, name, args, kwargs):
+        """
+        PRIVATE: call a method of HSAccess as the current user, in a worker thread
+
+        Calls made by several coroutines at once take turns on the session's synchronous HSAccess,
+        which is not safe to share between threads.
+        """
+        with self.__sync_lock:
+            if self.__sync is None:
+                self.__sync = HSAlib.HSAccess(self.__irods_user, *self.__shared['sync_args'])
+            return getattr(self.__sync, name)(*args, **kwargs)
+
+    def __release_sync(self):
+        """
+        PRIVATE: release the synchronous HSAccess, if it has been opened
+        """
+        with self.__sync_lock:
+            if self.__sync is not None:
+                self.__sync.release()
+                self.__sync = None
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not callable(getattr(HSAlib.HSAccess, name, None)):
+            raise AttributeError(name)
+
+        @functools.wraps(getattr(HSAlib.HSAccess, name))
+        async def method(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.__shared['executor'],
+                                              self.__call_sync, name, args, kwargs)
+        return method
@@ -0,0 +1,114 @@
+__author__ = 'Alva'
+# Python 3 only: run with python3 HSAsyncTests.py
+import asyncio
+import os
+import unittest
+
+import HSAlib
+from HSAsync import AsyncHSAccess
+
+# database to test against: name (from HSA_TEST_DATABASE), user, password, host, and port.
+DATABASE = (os.environ.get('HSA_TEST_DATABASE', 'acouch'), 'acouch', 'xyzzy', 'localhost', '5432')
+
+
+def startup(login):
+    """ log into the access control system (without password)
+    :type login: str
+    :param login: login name to use for user
+    :return:
+    """
+    return HSAlib.HSAccess(login, 'unused', *DATABASE)
+
+
+async def async_startup(login, **kwargs):
+    """ log into the access control system through asyncio (without password)
+    :type login: str
+    :param login: login name to use for user
+    :return:
+    """
+    return await AsyncHSAccess.connect(login, 'unused', *DATABASE, **kwargs)
+
+
+class T01AsyncAccess(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        ha = startup('admin')
+        ha._HSAccessCore__global_reset("yes, I'm sure")
+        self.cat = ha.assert_user('cat', 'Felix the Cat', True, False)
+        self.dog = ha.assert_user('dog', 'Rover Dog', True, False)
+        ha = startup('dog')
+        self.chewies = ha.assert_resource('/dog/chewies', 'All about dog chewies')
+        self.bones = ha.assert_resource('/dog/bones', 'All about dog bones')
+        ha.share_resource_with_user(self.chewies, self.cat, 'rw')
+        ha.make_resource_public(self.bones)
+
+    async def test_01_checks(self):
+        "Privilege checks agree with HSAccess"
+        access = await async_startup('dog')
+        try:
+            cat = await access.as_user('cat')
+            self.assertEqual(await cat.resource_is_readwrite(self.chewies), True)
+            self.assertEqual(await cat.resource_is_owned(self.chewies), False)
+            self.assertEqual(await access.resource_is_owned(self.chewies), True)
+            self.assertEqual(await cat.get_cumulative_user_privilege_over_resource(self.bones), 'ro')
+            self.assertEqual(await cat.resource_is_readwrite(self.bones), False)
+            await access.make_resource_immutable(self.chewies)
+            self.assertEqual(await cat.get_cumulative_user_privilege_over_resource(self.chewies), 'ro')
+            self.assertEqual(await cat.resource_is_owned(self.chewies, self.dog), True)
+            with self.assertRaises(HSAlib.HSAUsageException):
+                await cat.resource_is_readable('nonexistent')
+            with self.assertRaises(HSAlib.HSAUsageException):
+                await access.as_user('nobody')
+        finally:
+            await access.close()
+
+    async def test_02_concurrency(self):
+        "Concurrent checks share a few connections"
+        access = await async_startup('cat', min_size=1, max_size=2, max_batch=100)
+        try:
+            checks = [access.resource_is_readable(r) for r in [self.chewies, self.bones] * 500]
+            self.assertEqual(await asyncio.gather(*checks), [True] * 1000)
+            self.assertEqual(await access.resource_is_readable(self.chewies, self.dog), True)
+        finally:
+            await access.close()
+
+    async def test_03_changes(self):
+        "Changes and other methods run through HSAlib"
+        access = await async_startup('dog')
+        try:
+            cat = await access.as_user('cat')
+            self.assertEqual(await cat.resource_is_readable(self.bones), True)
+            await access.make_resource_not_public(self.bones)
+            self.assertEqual(await cat.resource_is_readable(self.bones), False)
+            await access.share_resource_with_user(self.bones, self.cat, 'ro')
+            self.assertEqual(await cat.resource_is_readable(self.bones), True)
+            held = await cat.get_resources_held_by_user()
+            self.assertEqual(held, startup('cat').get_resources_held_by_user())
+            self.assertEqual(sorted(r['uuid'] for r in held), sorted([self.chewies, self.bones]))
+            with self.assertRaises(HSAlib.HSAccessException):
+                await cat.retract_resource(self.bones)
+        finally:
+            await access.close()
+
+    async def test_04_sync_sessions(self):
+        "Each session keeps one synchronous HSAccess for the methods run through HSAlib"
+        access = await async_startup('dog', threads=4)
+        try:
+            cat = await access.as_user('cat')
+            self.assertEqual(await access.get_number_of_resources_owned_by_user(), 2)
+            sync = access._AsyncHSAccess__sync
+            counts = [access.get_number_of_resources_owned_by_user() for _ in range(20)]
+            self.assertEqual(await asyncio.gather(*counts), [2] * 20)
+            self.assertIs(access._AsyncHSAccess__sync, sync)
+            self.assertEqual(await cat.get_number_of_resources_owned_by_user(), 0)
+            self.assertIsNot(cat._AsyncHSAccess__sync, sync)
+            await access.release()
+            self.assertIsNone(access._AsyncHSAccess__sync)
+            self.assertEqual(await access.get_number_of_resources_owned_by_user(), 2)
+        finally:
+            await access.close()
+        self.assertIsNone(access._AsyncHSAccess__sync)
+        self.assertIsNone(cat._AsyncHSAccess__sync)
+
+
+if __name__ == '__main__':
+    unittest.main()
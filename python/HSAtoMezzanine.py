@@ -1,16 +1,107 @@
 __author__ = 'Alva'
 import HSAlib
+import fcntl
 
 
 class request():
-    def __init__(self, uuid):
-        self.user_uuid = uuid
-    def uuid(self): return self.user_uuid
+    def __init__(self, hsaccess):
+        self.hsaccess = hsaccess
+
+
+def get_access(r):
+    """ the request's own session, as installed by HSAccessMiddleware, or None if it has none """
+    return getattr(r, 'hsaccess', None)
+
 
 def get_user(r):
-    return r.user_uuid
+    """ uuid of the user of the request, or None if the request has no session """
+    session = get_access(r)
+    if session is None:
+        return None
+    return session.get_uuid()
+
+
+class HSAccessMiddleware(object):
+    """
+    Django middleware that gives each request its own HSAccess session as request.hsaccess
+
+    The session acts as the logged-in user, borrows a pooled database connection for the
+    duration of the request, and memoizes privilege decisions within the request. The
+    database is described in settings.IRODSSHARE_DATABASE, a dict with keys NAME, USER,
+    PASSWORD, HOST, and PORT, and optionally REPLICAS, a list of (HOST, PORT) of read replicas,
+    and DENIAL_FILTER, True to answer denials from the process-wide denial filter, and
+    DECISION_TRACE, a path prefix: each worker warms up on the traces under the prefix when it
+    starts, and records its decisions in the trace of the first of DECISION_TRACE_SLOTS (by
+    default 16) numbered slots that no running worker holds, so that the number of trace files
+    stays bounded however often workers restart. A worker that finds no free slot does not record.
+    Anonymous requests, and users who are not registered in the access control system, get
+    request.hsaccess = None. A database dict may be passed instead of reading it from settings.
+    """
+    def __init__(self, database=None):
+        if database is None:
+            from django.conf import settings
+            database = settings.IRODSSHARE_DATABASE
+        db = database
+        self.db = (db['NAME'], db['USER'], db['PASSWORD'], db['HOST'], str(db['PORT']))
+        self.replicas = [(host, str(port)) for host, port in db.get('REPLICAS', [])]
+        self.denial_filter = bool(db.get('DENIAL_FILTER', False))
+        self.pool = HSAlib.get_connection_pool(*self.db)
+        trace = db.get('DECISION_TRACE')
+        self.__trace_slot = None
+        if trace:
+            HSAlib.warm_up(trace + '.[0-9]*', *self.db, pool=self.pool, denial_filter=self.denial_filter)
+            slot = self.__claim_trace_slot(trace, int(db.get('DECISION_TRACE_SLOTS', 16)))
+            if slot is not None:
+                HSAlib.record_decision_trace('%s.%d' % (trace, slot))
+
+    def __claim_trace_slot(self, trace, slots):
+        """
+        PRIVATE: lock the first trace slot that no running worker holds
 
-ha = HSAlib.HSAccess("admin", 'unused', 'acouch', 'acouch', 'xyzzy', 'localhost', '5432')
+        :return: number of the slot, or None if every slot is held
+        :rtype: int
+
+        A slot is held by an exclusive lock on the file named by the prefix, 'lock', and the slot
+        number. The lock is kept until the process exits, which releases it however it exits.
+        """
+        for slot in range(slots):
+            lock = open('%s.lock.%d' % (trace, slot), 'a')
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                lock.close()
+                continue
+            self.__trace_slot = lock
+            return slot
+        return None
+
+    def process_request(self, request):
+        request.hsaccess = None
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated():
+            try:
+                request.hsaccess = HSAlib.HSAccess(user.get_username(), 'unused', *self.db,
+                                                   pool=self.pool, memoize=True, replicas=self.replicas,
+                                                   denial_filter=self.denial_filter)
+            except HSAlib.HSAUsageException:
+                # the login is not registered in the access tables (the session has already given
+                # back its connection): treat it like an anonymous request rather than failing it
+                request.hsaccess = None
+        return None
+
+    def process_response(self, request, response):
+        self.__release(request)
+        return response
+
+    def process_exception(self, request, exception):
+        self.__release(request)
+        return None
+
+    def __release(self, request):
+        session = getattr(request, 'hsaccess', None)
+        if session is not None:
+            session.release()
+            request.hsaccess = None
 
 class ResourcePermissionsMixin():
     def __init__(self, uuid):
@@ -82,14 +173,16 @@ class ResourcePermissionsMixin():
         return self.can_change(request)
 
     def can_delete(self, request):
-        global ha
-        user_uuid = get_user(request)
-        return ha.resource_is_owned(self.resource_uuid,user_uuid)
+        ha = get_access(request)
+        if ha is None:
+            return False
+        return ha.resource_is_owned(self.resource_uuid, ha.get_uuid())
 
     def can_change(self, request):
-        global ha
-        user_uuid = get_user(request)
-        return ha.resource_is_readwrite(self.resource_uuid, user_uuid)
+        ha = get_access(request)
+        if ha is None:
+            return False
+        return ha.resource_is_readwrite(self.resource_uuid, ha.get_uuid())
 
         # if user.is_authenticated():
         #     if user.is_superuser:
@@ -111,9 +204,10 @@ class ResourcePermissionsMixin():
 
 
     def can_view(self, request):
-        user_uuid = get_user(request)
-        global ha
-        return ha.resource_is_readable(self.resource_uuid, user_uuid)
+        ha = get_access(request)
+        if ha is None:
+            return False
+        return ha.resource_is_readable(self.resource_uuid, ha.get_uuid())
 
         # if self.public:
         #     return True
@@ -139,29 +233,30 @@ class ResourcePermissionsMixin():
 def setup(login):
     return HSAlib.HSAccess(login, 'unused', 'acouch', 'acouch', 'xyzzy', 'localhost', '5432')
 
-# set up some interesting stuff
-ha = setup('admin')
-ha.__global_reset("yes, I'm sure")
-ha.assert_user('foo', 'foo', True, False, 'foo')
-ha.assert_user('bar', 'bar', True, False, 'bar')
-
-ha = setup('foo')
-ha.assert_resource('/foo/cat','all about foo', False, 'cat', 'foo')
-ha = setup('bar')
-ha.assert_resource('/bar/dog', 'all about dogs', False, 'dog', 'bar')
-ha.share_resource_with_user('dog', 'foo', 'ro')
-print ha.get_users()
-
-r = ResourcePermissionsMixin('dog')
-req_foo = request('foo')
-req_bar = request('bar')
-print r, req_foo
-
-print "foo can read r? ", r.can_view(req_foo)
-print "bar can read r? ", r.can_view(req_bar)
-print "foo can change r? ", r.can_change(req_foo)
-print "bar can change r? ", r.can_change(req_bar)
-print "foo can delete r? ", r.can_delete(req_foo)
-print "bar can delete r", r.can_delete(req_bar)
+if __name__ == '__main__':
+    # set up some interesting stuff
+    ha = setup('admin')
+    ha._HSAccessCore__global_reset("yes, I'm sure")
+    ha.assert_user('foo', 'foo', True, False, 'foo')
+    ha.assert_user('bar', 'bar', True, False, 'bar')
+
+    ha = setup('foo')
+    ha.assert_resource('/foo/cat','all about foo', False, 'cat', 'foo')
+    ha = setup('bar')
+    ha.assert_resource('/bar/dog', 'all about dogs', False, 'dog', 'bar')
+    ha.share_resource_with_user('dog', 'foo', 'ro')
+    print ha.get_users()
+
+    r = ResourcePermissionsMixin('dog')
+    req_foo = request(setup('foo'))
+    req_bar = request(setup('bar'))
+    print r, req_foo
+
+    print "foo can read r? ", r.can_view(req_foo)
+    print "bar can read r? ", r.can_view(req_bar)
+    print "foo can change r? ", r.can_change(req_foo)
+    print "bar can change r? ", r.can_change(req_bar)
+    print "foo can delete r? ", r.can_delete(req_foo)
+    print "bar can delete r", r.can_delete(req_bar)
 
 